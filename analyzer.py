@@ -1,19 +1,172 @@
 from sklearn.metrics.pairwise import cosine_similarity
 import fingerprint
+import hashlib
+import json
 import numpy as np
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
+import torchvision.models as models
+from descriptors import DESCRIPTOR_GRIDS, cosine
+from tile_index import TILE_GRIDS
+from memory_budget import memory_budget
+from scoring import RAW_SIMILARITIES, DERIVED_SIMILARITIES, RISK_LEVELS, derived_similarities, score_model
 
 class AdvancedAnalyzer:
-    def __init__(self):
-        self.fingerprinter = fingerprint.ImageFingerprinter()
+    def __init__(self, descriptor_grids=None):
+        self.fingerprinter = fingerprint.get_fingerprinter("resnet50")
         self.feature_cache = {}
+        # Forward hooks are registered on the shared model, so concurrent callers
+        # (background workers) must not interleave passes. This is the
+        # fingerprinter's own lock, which its fingerprint passes also hold.
+        self.model_lock = self.fingerprinter.model_lock
+        self.descriptor_grids = dict(descriptor_grids or DESCRIPTOR_GRIDS)
+        self.descriptor_version = self.get_descriptor_version()
+    
+    def get_descriptor_version(self):
+        """Tag identifying the model, weights, transform and pooling behind stored descriptors"""
+        spec = json.dumps({
+            'model': 'resnet50',
+            'weights': str(models.ResNet50_Weights.DEFAULT),
+            'transform': repr(self.fingerprinter.transform),
+            'preprocess': self.fingerprinter.preprocessor.describe(),
+            'embedding': self.fingerprinter.describe(),
+            'grids': self.descriptor_grids
+        }, sort_keys=True)
+        return "resnet50-" + hashlib.sha1(spec.encode('utf-8')).hexdigest()[:12]
+    
+    def extract_descriptors(self, image_paths, batch_size=16, with_tiles=False, augmentations=None):
+        """Compact layer1-layer4 descriptors plus the fingerprint embedding, one forward pass per image
+        
+        Each stage's activation map is average-pooled to a small grid inside the
+        forward hook, so full-resolution activations are never kept. With
+        with_tiles, the same pass also yields descriptors['tiles'] = {grid:
+        (grid*grid, channels)} layer3 cells for region matching. With
+        augmentations (see fingerprint.tta_views) every image is expanded into
+        those views inside the batch, and descriptors['views'] = {name:
+        descriptors} holds each view's; the top level stays the unaugmented
+        view. Returns a list aligned with image_paths; unreadable images give None.
+        """
+        results = [None] * len(image_paths)
+        views = tuple(augmentations) if augmentations else ("identity",)
+        pooled = {}
+        
+        def pool_hook(name, grid):
+            def hook(model, input, output):
+                pooled[name] = F.adaptive_avg_pool2d(output, grid).flatten(1)
+            return hook
+        
+        def tile_hook(model, input, output):
+            for grid in TILE_GRIDS:
+                pooled[('tiles', grid)] = F.adaptive_avg_pool2d(output, grid).flatten(2).transpose(1, 2)
+        
+        model = self.fingerprinter.model
+        start = 0
+        while start < len(image_paths):
+            # Shrinks when the process nears its memory budget
+            size = max(1, memory_budget.batch_size(batch_size) // len(views))
+            batch_paths = image_paths[start:start + size]
+            with memory_budget.measure_batch(len(batch_paths) * len(views)):
+                batch, positions = self.fingerprinter.load_batch(batch_paths)
+                if batch is not None:
+                    if augmentations:
+                        preprocessor = self.fingerprinter.preprocessor
+                        batch = fingerprint.make_views(batch, views, preprocessor.mean, preprocessor.std)
+                    with self.model_lock:
+                        handles = [getattr(model, name).register_forward_hook(pool_hook(name, grid))
+                                   for name, grid in self.descriptor_grids.items()]
+                        if with_tiles:
+                            handles.append(model.layer3.register_forward_hook(tile_hook))
+                        try:
+                            with torch.no_grad():
+                                final_output = model(batch)
+                        finally:
+                            for handle in handles:
+                                handle.remove()
+                    
+                    for index, position in enumerate(positions):
+                        per_view = {}
+                        for offset, view in enumerate(views):
+                            row = index * len(views) + offset
+                            descriptors = {name: pooled[name][row].numpy().copy() for name in self.descriptor_grids}
+                            descriptors['final'] = final_output[row].numpy().copy()
+                            if with_tiles and offset == 0:
+                                descriptors['tiles'] = {grid: pooled[('tiles', grid)][row].numpy().copy()
+                                                        for grid in TILE_GRIDS}
+                            per_view[view] = descriptors
+                        descriptors = dict(per_view[views[0]])
+                        if augmentations:
+                            descriptors['views'] = per_view
+                        results[start + position] = descriptors
+                    del batch, final_output
+                pooled.clear()
+            start += len(batch_paths)
+        
+        return results
+    
+    def layer_similarities(self, references, query):
+        """(len(references), len(RAW_SIMILARITIES)) cosines against the query, one matrix product per layer"""
+        matrix = np.zeros((len(references), len(RAW_SIMILARITIES)), dtype=np.float64)
+        for column, layer in enumerate(RAW_SIMILARITIES):
+            stacked = np.stack([np.asarray(reference[layer], dtype=np.float32) for reference in references])
+            vector = np.asarray(query[layer], dtype=np.float32)
+            denominators = np.linalg.norm(stacked, axis=1) * np.linalg.norm(vector)
+            dots = stacked @ vector
+            matrix[:, column] = np.divide(dots, denominators, out=np.zeros_like(dots), where=denominators > 0)
+        return matrix
+    
+    def compare_descriptors(self, reference, query):
+        """Direct, style and content similarity from two descriptor dicts (no model pass)"""
+        derived = derived_similarities(dict(zip(RAW_SIMILARITIES, self.layer_similarities([reference], query)[0])))
+        return derived['direct'], derived['style'], derived['content']
+    
+    def analyses_from_similarities(self, matrix):
+        """run_comprehensive_analysis results for rows of raw similarities, fused and thresholded in one pass
+        
+        The raw similarities are kept in each result, so a different score
+        model can re-score it later without any model pass (scoring.rescore).
+        """
+        scores, levels = score_model.score_matrix(matrix)
+        results = []
+        for row, score, level in zip(matrix, scores, levels):
+            raw = {layer: float(value) for layer, value in zip(RAW_SIMILARITIES, row)}
+            derived = derived_similarities(raw)
+            results.append({
+                "direct_similarity": derived['direct'],
+                "style_similarity": derived['style'],
+                "content_similarity": derived['content'],
+                "raw_similarities": raw,
+                "weighted_score": float(score),
+                "is_ai_trained": bool(level > 0),
+                "risk_level": RISK_LEVELS[level],
+                "analysis_notes": self.generate_analysis_notes(derived['direct'], derived['style'], derived['content'])
+            })
+        return results
+    
+    def run_batch_analysis(self, query_descriptors, reference_descriptors):
+        """Comprehensive analyses of one query against many references' descriptors (None = unreadable)"""
+        readable = [i for i, reference in enumerate(reference_descriptors) if reference is not None]
+        results = [self.failed_analysis() for _ in reference_descriptors]
+        if readable:
+            matrix = self.layer_similarities([reference_descriptors[i] for i in readable], query_descriptors)
+            for i, result in zip(readable, self.analyses_from_similarities(matrix)):
+                results[i] = result
+        return results
+    
+    def failed_analysis(self):
+        return {
+            "direct_similarity": 0.0,
+            "style_similarity": 0.0,
+            "content_similarity": 0.0,
+            "weighted_score": 0.0,
+            "is_ai_trained": False,
+            "risk_level": "LOW",
+            "analysis_notes": "Analysis failed due to error"
+        }
         
     def extract_multi_layer_features(self, image_path):
         """Extract features from different ResNet layers for detailed analysis"""
         try:
-            from PIL import Image
-            
             # Hook to get intermediate layer features
             features = {}
             def get_features(name):
@@ -21,24 +174,34 @@ class AdvancedAnalyzer:
                     features[name] = output.detach()
                 return hook
             
-            # Register hooks for different layers
-            self.fingerprinter.model.layer1.register_forward_hook(get_features('layer1'))  # Basic edges/shapes
-            self.fingerprinter.model.layer2.register_forward_hook(get_features('layer2'))  # Textures/patterns  
-            self.fingerprinter.model.layer3.register_forward_hook(get_features('layer3'))  # Style features
-            self.fingerprinter.model.layer4.register_forward_hook(get_features('layer4'))  # Content/objects
-            
             # Process image
-            image = Image.open(image_path).convert('RGB')
-            image_tensor = self.fingerprinter.transform(image).unsqueeze(0)
+            image_tensor, _ = self.fingerprinter.preprocessor.load_batch([image_path])
+            if image_tensor is None:
+                return None
+            
+            # Register hooks for different layers (removed again after the pass)
+            self.model_lock.acquire()
+            handles = [
+                self.fingerprinter.model.layer1.register_forward_hook(get_features('layer1')),  # Basic edges/shapes
+                self.fingerprinter.model.layer2.register_forward_hook(get_features('layer2')),  # Textures/patterns  
+                self.fingerprinter.model.layer3.register_forward_hook(get_features('layer3')),  # Style features
+                self.fingerprinter.model.layer4.register_forward_hook(get_features('layer4'))   # Content/objects
+            ]
             
-            with torch.no_grad():
-                final_output = self.fingerprinter.model(image_tensor)
-                features['final'] = final_output
+            try:
+                with torch.no_grad():
+                    final_output = self.fingerprinter.model(image_tensor)
+                    features['final'] = final_output
+            finally:
+                for handle in handles:
+                    handle.remove()
+                self.model_lock.release()
             
-            # Convert to numpy arrays
+            # Convert to numpy arrays, dropping each full activation map as soon as it is copied
+            del image_tensor, final_output
             feature_dict = {}
-            for layer_name, tensor in features.items():
-                feature_dict[layer_name] = tensor.numpy().flatten()
+            for layer_name in list(features):
+                feature_dict[layer_name] = features.pop(layer_name).numpy().flatten()
             
             return feature_dict
             
@@ -48,8 +211,9 @@ class AdvancedAnalyzer:
     
     def calculate_direct_similarity(self, img1_path, img2_path):
         """Direct pixel/structure similarity using final layer"""
-        fp1 = self.fingerprinter.get_fingerprint(img1_path)
-        fp2 = self.fingerprinter.get_fingerprint(img2_path)
+        with self.model_lock:
+            fp1 = self.fingerprinter.get_fingerprint(img1_path)
+            fp2 = self.fingerprinter.get_fingerprint(img2_path)
         
         if fp1 is None or fp2 is None:
             return 0.0
@@ -60,149 +224,235 @@ class AdvancedAnalyzer:
     
     def calculate_style_similarity(self, img1_path, img2_path):
         """Style similarity using intermediate layers (textures, patterns)"""
-        try:
-            features1 = self.extract_multi_layer_features(img1_path)
-            features2 = self.extract_multi_layer_features(img2_path)
-            
-            if features1 is None or features2 is None:
-                return 0.0
-            
-            # Use layer2 and layer3 for style (captures textures and patterns)
-            style_features1 = []
-            style_features2 = []
-            
-            for layer in ['layer2', 'layer3']:
-                if layer in features1 and layer in features2:
-                    style_features1.append(features1[layer])
-                    style_features2.append(features2[layer])
-            
-            if not style_features1:
-                return 0.0
-                
-            # Average similarity across style layers
-            style_similarities = []
-            for feat1, feat2 in zip(style_features1, style_features2):
-                sim = cosine_similarity([feat1], [feat2])[0][0]
-                style_similarities.append(sim)
-            
-            avg_style_sim = np.mean(style_similarities)
-            print(f"Style similarity: {avg_style_sim:.4f}")
-            return float(avg_style_sim)
-            
-        except Exception as e:
-            print(f"Style similarity error: {e}")
+        descriptors = self.extract_descriptors([img1_path, img2_path])
+        if descriptors[0] is None or descriptors[1] is None:
             return 0.0
+        style = self.compare_descriptors(descriptors[0], descriptors[1])[1]
+        print(f"Style similarity: {style:.4f}")
+        return style
     
     def calculate_content_similarity(self, img1_path, img2_path):
         """Content similarity using early and final layers (objects, composition)"""
-        try:
-            features1 = self.extract_multi_layer_features(img1_path)
-            features2 = self.extract_multi_layer_features(img2_path)
-            
-            if features1 is None or features2 is None:
-                return 0.0
-            
-            # Use layer1 and final layer for content (captures basic shapes and high-level objects)
-            content_features1 = []
-            content_features2 = []
-            
-            for layer in ['layer1', 'final']:
-                if layer in features1 and layer in features2:
-                    content_features1.append(features1[layer])
-                    content_features2.append(features2[layer])
-            
-            if not content_features1:
-                return 0.0
-                
-            # Average similarity across content layers
-            content_similarities = []
-            for feat1, feat2 in zip(content_features1, content_features2):
-                sim = cosine_similarity([feat1], [feat2])[0][0]
-                content_similarities.append(sim)
-            
-            avg_content_sim = np.mean(content_similarities)
-            print(f"Content similarity: {avg_content_sim:.4f}")
-            return float(avg_content_sim)
-            
-        except Exception as e:
-            print(f"Content similarity error: {e}")
+        descriptors = self.extract_descriptors([img1_path, img2_path])
+        if descriptors[0] is None or descriptors[1] is None:
             return 0.0
+        content = self.compare_descriptors(descriptors[0], descriptors[1])[2]
+        print(f"Content similarity: {content:.4f}")
+        return content
+    
+    def similarity_ranges(self):
+        """Range of each raw similarity: pooled post-ReLU descriptors never have negative cosines"""
+        ranges = {layer: (0.0, 1.0) for layer in RAW_SIMILARITIES}
+        if self.fingerprinter.embedding == "logits":
+            ranges['final'] = (-1.0, 1.0)
+        return ranges
     
-    def run_comprehensive_analysis(self, query_path, reference_path):
-        """Run all analysis types and return comprehensive results"""
+    def run_comprehensive_analysis(self, query_path, reference_path,
+                                   reference_descriptors=None, query_descriptors=None,
+                                   early_exit=False, reference_fingerprint=None):
+        """Run all analysis types and return comprehensive results
+        
+        Precomputed descriptors (e.g. stored with a database entry, or a query
+        reused across several references) skip that image's forward pass.
+        With early_exit, similarities are computed cheapest first and the
+        rest skipped once the risk level is settled; see _early_exit_analysis.
+        """
         print(f"🔍 Running comprehensive analysis: {query_path} vs {reference_path}")
         
         try:
-            # Calculate all similarity types
-            print("📊 Calculating direct similarity...")
-            direct_sim = self.calculate_direct_similarity(reference_path, query_path)
-            
-            print("🎨 Calculating style similarity...")
-            style_sim = self.calculate_style_similarity(reference_path, query_path)
-            
-            print("🖼️ Calculating content similarity...")
-            content_sim = self.calculate_content_similarity(reference_path, query_path)
-            
-            # Overall risk assessment with weighted scoring
-            weighted_score = (direct_sim * 0.5) + (style_sim * 0.1) + (content_sim * 0.5)
+            if early_exit:
+                result = self._early_exit_analysis(query_path, reference_path, reference_descriptors,
+                                                   query_descriptors, reference_fingerprint)
+                print(f"✅ Analysis complete - Overall risk: {result['risk_level']} ({result['weighted_score']:.4f}), "
+                      f"skipped {', '.join(result['early_exit']['skipped']) or 'nothing'}")
+                return result
             
-            # Determine risk levels
-            if weighted_score > 0.7:
-                risk_level = "HIGH"
-                is_ai_trained = True
-            elif weighted_score > 0.4:
-                risk_level = "MEDIUM" 
-                is_ai_trained = True
-            else:
-                risk_level = "LOW"
-                is_ai_trained = False
+            if callable(reference_descriptors):
+                reference_descriptors = reference_descriptors()
+            print("🧠 Extracting multi-layer descriptors...")
+            missing = [path for path, known in ((reference_path, reference_descriptors),
+                                                (query_path, query_descriptors)) if known is None]
+            extracted = dict(zip(missing, self.extract_descriptors(missing))) if missing else {}
+            if reference_descriptors is None:
+                reference_descriptors = extracted[reference_path]
+            if query_descriptors is None:
+                query_descriptors = extracted[query_path]
+            if reference_descriptors is None or query_descriptors is None:
+                raise ValueError("could not read one of the images")
             
-            print(f"✅ Analysis complete - Overall risk: {risk_level} ({weighted_score:.4f})")
-            
-            return {
-                "direct_similarity": direct_sim,
-                "style_similarity": style_sim,
-                "content_similarity": content_sim,
-                "weighted_score": weighted_score,
-                "is_ai_trained": is_ai_trained,
-                "risk_level": risk_level,
-                "analysis_notes": self.generate_analysis_notes(direct_sim, style_sim, content_sim)
-            }
+            # Raw per-layer similarities, then weighting, calibration and thresholds (see scoring.py)
+            result = self.analyses_from_similarities(
+                self.layer_similarities([reference_descriptors], query_descriptors))[0]
+            print(f"📊 Direct similarity: {result['direct_similarity']:.4f}")
+            print(f"🎨 Style similarity: {result['style_similarity']:.4f}")
+            print(f"🖼️ Content similarity: {result['content_similarity']:.4f}")
+            print(f"✅ Analysis complete - Overall risk: {result['risk_level']} ({result['weighted_score']:.4f})")
+            return result
             
         except Exception as e:
             print(f"❌ Comprehensive analysis error: {e}")
-            return {
-                "direct_similarity": 0.0,
-                "style_similarity": 0.0,
-                "content_similarity": 0.0,
-                "weighted_score": 0.0,
-                "is_ai_trained": False,
-                "risk_level": "LOW",
-                "analysis_notes": "Analysis failed due to error"
-            }
+            return self.failed_analysis()
+    
+    def _early_exit_analysis(self, query_path, reference_path, reference_descriptors, query_descriptors,
+                             reference_fingerprint):
+        """Short-circuit evaluation: stop once no remaining similarity can move the score across a threshold
+        
+        The final-layer cosine comes first, from reference_fingerprint (e.g.
+        the database row) when given, so a clear copy or a clearly unrelated
+        pair never loads or computes the reference's descriptors at all.
+        reference_descriptors may be a loader called only if needed. After
+        each stage the score model bounds the score over every value the
+        uncomputed similarities could take; when both bounds give the same
+        risk level the rest are skipped. The risk level is then exact, but
+        nothing reports a skipped layer as measured: raw_similarities holds
+        the computed layers only, a direct/style/content score that needs a
+        skipped layer is None, and the weighted score is an estimate (the
+        skipped layers taken as the mean of the computed ones, kept inside
+        the bounds). result['early_exit'] records what was computed and
+        skipped, the estimates, the skipped layers' ranges and the bounds.
+        """
+        if query_descriptors is None:
+            query_descriptors = self.extract_descriptors([query_path])[0]
+            if query_descriptors is None:
+                raise ValueError("could not read the query image")
+        loaded = []
+        
+        def reference():
+            if not loaded:
+                descriptors = reference_descriptors() if callable(reference_descriptors) else reference_descriptors
+                if descriptors is None:
+                    descriptors = self.extract_descriptors([reference_path])[0]
+                if descriptors is None:
+                    raise ValueError("could not read the reference image")
+                loaded.append(descriptors)
+            return loaded[0]
+        
+        ranges = self.similarity_ranges()
+        known = {'final': cosine(query_descriptors['final'],
+                                 reference_fingerprint if reference_fingerprint is not None else reference()['final'])}
+        stages = score_model.stage_order(ranges)
+        for layer in stages:
+            low, high = score_model.bounds(known, ranges)
+            if score_model.level(low) == score_model.level(high):
+                break
+            known[layer] = cosine(query_descriptors[layer], reference()[layer])
+        low, high = score_model.bounds(known, ranges)
+        skipped = [layer for layer in stages if layer not in known]
+        early_exit = {'computed': list(known), 'skipped': skipped,
+                      'descriptors_loaded': bool(loaded), 'score_bounds': [low, high]}
+        if not skipped:
+            result = self.analyses_from_similarities(np.array([[known[layer] for layer in RAW_SIMILARITIES]]))[0]
+            result['early_exit'] = early_exit
+            return result
+        
+        fill = float(np.mean(list(known.values())))
+        early_exit['estimated'] = {layer: fill for layer in skipped}
+        early_exit['ranges'] = {layer: list(ranges[layer]) for layer in skipped}
+        early_exit['settled'] = True
+        score = min(max(score_model.score(dict(known, **early_exit['estimated']))[0], low), high)
+        raw = {layer: float(known[layer]) for layer in RAW_SIMILARITIES if layer in known}
+        derived = {name: float(np.mean([raw[layer] for layer in layers])) if set(layers) <= set(raw) else None
+                   for name, layers in DERIVED_SIMILARITIES.items()}
+        notes = self.generate_analysis_notes(derived['direct'], derived['style'], derived['content'])
+        notes.append(f"⚡ Risk settled after {', '.join(known)}; {', '.join(skipped)} were not computed, "
+                     f"so the weighted score is an estimate within {low:.3f}-{high:.3f}")
+        return {
+            "direct_similarity": derived['direct'],
+            "style_similarity": derived['style'],
+            "content_similarity": derived['content'],
+            "raw_similarities": raw,
+            "weighted_score": score,
+            "is_ai_trained": score_model.level(score) != "LOW",
+            "risk_level": score_model.level(score),
+            "analysis_notes": notes,
+            "early_exit": early_exit
+        }
     
+    def cascade_stage(self, triage_similarity, uncertain_band=(0.5, 0.9)):
+        """'reject' below the band, 'accept' above it, 'escalate' inside it
+
+        Only 'reject' is final; an 'accept' still gets the full analysis,
+        which confirms (or overrules) the copy before it is reported.
+        """
+        low, high = uncertain_band
+        if triage_similarity < low:
+            return "reject"
+        if triage_similarity >= high:
+            return "accept"
+        return "escalate"
+
+    def run_cascade_analysis(self, query_path, reference_path, backbone="mobilenet_v3_small",
+                             uncertain_band=(0.5, 0.9), query_embedding=None, reference_embedding=None,
+                             reference_descriptors=None, query_descriptors=None):
+        """Triage with a cheap backbone; skip the ResNet50 analysis for clear non-matches
+
+        Pairs below the uncertain band are reported LOW from the cheap cosine
+        alone; everything else, clear copies included, gets the full
+        analysis, so no HIGH is reported without it. Returns the
+        run_comprehensive_analysis result shape plus a 'cascade' dict with
+        the backbone, triage similarity and stage taken. A rejected pair has
+        no ResNet50 similarities: its per-metric fields and weighted score
+        are None, and the triage cosine is only under 'cascade'.
+        """
+        missing = [path for path, known in ((query_path, query_embedding),
+                                            (reference_path, reference_embedding)) if known is None]
+        if missing:
+            embedded = dict(zip(missing, fingerprint.get_fingerprinter(backbone).get_fingerprints(missing)))
+            query_embedding = embedded.get(query_path, query_embedding)
+            reference_embedding = embedded.get(reference_path, reference_embedding)
+        triage_similarity = (cosine(query_embedding, reference_embedding)
+                             if query_embedding is not None and reference_embedding is not None else 0.0)
+        stage = self.cascade_stage(triage_similarity, uncertain_band)
+        cascade = {'backbone': backbone, 'triage_similarity': triage_similarity, 'stage': stage}
+        print(f"⚡ {backbone} triage similarity: {triage_similarity:.4f} -> {stage}")
+
+        if stage != "reject":
+            result = self.run_comprehensive_analysis(query_path, reference_path,
+                                                     reference_descriptors=reference_descriptors,
+                                                     query_descriptors=query_descriptors)
+            result['cascade'] = cascade
+            return result
+
+        return {
+            "direct_similarity": None,
+            "style_similarity": None,
+            "content_similarity": None,
+            "weighted_score": None,
+            "is_ai_trained": False,
+            "risk_level": "LOW",
+            "analysis_notes": [f"⚡ Rejected by {backbone} triage (similarity {triage_similarity:.3f}); "
+                               f"the multi-layer similarities were not computed"],
+            "cascade": cascade
+        }
+
     def generate_analysis_notes(self, direct, style, content):
-        """Generate human-readable analysis notes"""
+        """Generate human-readable analysis notes (similarities that were not computed are None)"""
         notes = []
         
-        if direct > 0.8:
+        if direct is None:
+            pass
+        elif direct > 0.8:
             notes.append("🚨 Very high direct similarity - potential exact copy")
         elif direct > 0.6:
             notes.append("⚠️ High direct similarity - strong structural match")
         elif direct > 0.4:
             notes.append("📝 Moderate direct similarity - some structural elements match")
         
-        if style > 0.7:
+        if style is None:
+            pass
+        elif style > 0.7:
             notes.append("🎨 Strong style match - similar artistic patterns and textures")
         elif style > 0.5:
             notes.append("🖌️ Moderate style influence - some stylistic elements shared")
         
-        if content > 0.7:
+        if content is None:
+            pass
+        elif content > 0.7:
             notes.append("🖼️ High content similarity - similar subjects and composition")
         elif content > 0.5:
             notes.append("📷 Moderate content match - some subject matter overlap")
         
-        if not notes:
+        if not notes and None not in (direct, style, content):
             notes.append("✅ Minimal similarities detected - low risk of training data contamination")
         
         return notes
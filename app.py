@@ -5,7 +5,7 @@ from video_analyzer import video_analyzer
 from copyright_db import copyright_db
 from PIL import Image
 import os
-import matplotlib.pyplot as plt
+from datetime import datetime
 
 # Page configuration
 st.set_page_config(
@@ -273,8 +273,76 @@ st.markdown("""
 # Add new imports at the top
 from video_analyzer import video_analyzer
 from copyright_db import copyright_db
+from job_queue import JobQueue, WorkerPool
+from previews import preview_cache, open_downscaled
+from uploads import copy_upload, temporary_upload, temporary_upload_dir, upload_title, UploadTooLarge
+from scoring import score_model, format_metric
+from fingerprint import DEFAULT_TTA
+from evidence import EXPORT_FORMATS
 
 # Add new tab functions
+@st.cache_resource
+def get_job_queue():
+    """One job queue and worker pool per server process, shared by all sessions"""
+    queue = JobQueue()
+    queue.requeue_interrupted()
+    WorkerPool(queue, num_workers=2).start()
+    return queue
+
+def save_job_upload(queue, job_id, uploaded_file, name):
+    """Stream an upload into the job's directory so it outlives this script run"""
+    path = os.path.join(queue.job_dir(job_id), name + os.path.splitext(uploaded_file.name)[1].lower())
+    copy_upload(uploaded_file, path)
+    return path
+
+def submit_upload_job(kind, uploads, payload):
+    """Save uploads ({payload key: (uploaded file, base name)}) into a new job and queue it
+    
+    Returns the job id, or None (with an error shown) if an upload is over its size limit.
+    """
+    queue = get_job_queue()
+    job_id = queue.new_job_id()
+    try:
+        for key, (uploaded_file, name) in uploads.items():
+            payload[key] = save_job_upload(queue, job_id, uploaded_file, name)
+    except UploadTooLarge as e:
+        queue.delete(job_id)
+        st.error(f"❌ {e}")
+        return None
+    return queue.submit(kind, payload, job_id=job_id)
+
+def jobs_section(kinds, render_result):
+    """Status, progress, cancellation and results of background jobs of the given kinds"""
+    queue = get_job_queue()
+    jobs = queue.list_jobs(limit=10, kinds=kinds)
+    if not jobs:
+        return
+    
+    st.subheader("Background Jobs")
+    if st.button("Refresh", key=f"refresh_{'_'.join(kinds)}"):
+        st.rerun()
+    
+    for job in jobs:
+        label = f"{job['kind'].replace('_', ' ').title()} {job['id']} - {job['status'].upper()}"
+        with st.expander(label, expanded=job['status'] in ('queued', 'running')):
+            if job['status'] in ('queued', 'running'):
+                st.progress(min(max(job['progress'] or 0.0, 0.0), 1.0))
+                if job['message']:
+                    st.caption(job['message'])
+                if st.button("Cancel", key=f"cancel_{job['id']}"):
+                    queue.cancel(job['id'])
+                    st.rerun()
+            elif job['status'] == 'failed':
+                st.error(f"Job failed: {job['error'].splitlines()[0] if job['error'] else 'unknown error'}")
+            elif job['status'] == 'done':
+                if st.checkbox("Show results", key=f"show_{job['id']}"):
+                    full_job = queue.get(job['id'])
+                    render_result(full_job)
+            
+            if job['status'] not in ('queued', 'running') and st.button("Delete", key=f"delete_{job['id']}"):
+                queue.delete(job['id'])
+                st.rerun()
+
 def video_analysis_tab():
     st.header("Video Analysis")
     
@@ -289,25 +357,15 @@ def video_analysis_tab():
         video_file = st.file_uploader("Upload video to analyze", type=['mp4', 'avi', 'mov'], key="video_file")
     
     if reference_file and video_file:
-        # Save files temporarily
-        ref_path = "temp_video_ref.jpg"
-        video_path = "temp_video.mp4"
-        
-        with open(ref_path, "wb") as f:
-            f.write(reference_file.getbuffer())
-        with open(video_path, "wb") as f:
-            f.write(video_file.getbuffer())
-        
         if st.button("Analyze Video Frames"):
-            with st.spinner("Extracting and analyzing video frames..."):
-                results = video_analyzer.analyze_video_against_image(video_path, ref_path)
-                
-                if results:
-                    display_video_results(results, ref_path)
-        
-        # Cleanup
-        os.remove(ref_path)
-        os.remove(video_path)
+            # Runs in the background worker pool; results survive reruns and refreshes
+            job_id = submit_upload_job("video_analysis", {'reference_path': (reference_file, "reference"),
+                                                          'video_path': (video_file, "video")}, {})
+            if job_id:
+                st.success(f"Queued video analysis job {job_id}")
+    
+    jobs_section(["video_analysis"], lambda job: display_video_results(
+        job['result']['frames'], job['payload']['reference_path']))
 
 
 def database_tab():
@@ -329,66 +387,132 @@ def database_tab():
         title = st.text_input("Title *", placeholder="Name of the artwork/frame")
         owner = st.text_input("Owner/Creator *", placeholder="Your name or company")
         description = st.text_area("Description", placeholder="Additional details about this content")
+        tags = st.text_input("Tags", placeholder="Comma-separated, e.g. poster, season-2")
         
         # Add to database button
         if new_image and title and owner:
             if st.button("Add to Database", type="primary"):
-                # Save temporary file
-                temp_path = "temp_db_image.jpg"
-                with open(temp_path, "wb") as f:
-                    f.write(new_image.getbuffer())
-                
-                # Add to database
-                if copyright_db.add_copyrighted_content(temp_path, title, owner, description):
-                    st.success(f"Successfully added '{title}' to copyright database!")
-                else:
-                    st.error("Failed to add image to database. Please try again.")
-                
-                # Cleanup
-                os.remove(temp_path)
+                try:
+                    # Unique per-request temp file, removed when the block exits
+                    with temporary_upload(new_image) as temp_path:
+                        tag_list = [tag.strip() for tag in tags.split(",") if tag.strip()]
+                        if copyright_db.add_copyrighted_content(temp_path, title, owner, description, tags=tag_list):
+                            st.success(f"Successfully added '{title}' to copyright database!")
+                        else:
+                            st.error("Failed to add image to database. Please try again.")
+                except UploadTooLarge as e:
+                    st.error(f"❌ {e}")
+        
+        # Bulk ingestion (titles come from file names)
+        with st.expander("Bulk Upload", expanded=False):
+            bulk_images = st.file_uploader(
+                "Upload many copyrighted images",
+                type=['jpg', 'png', 'jpeg'],
+                accept_multiple_files=True,
+                key="db_bulk_upload"
+            )
+            if bulk_images and owner and st.button("Add All to Database"):
+                try:
+                    with temporary_upload_dir(bulk_images) as paths:
+                        tag_list = [tag.strip() for tag in tags.split(",") if tag.strip()]
+                        with st.spinner(f"Ingesting {len(paths)} images..."):
+                            report = copyright_db.add_bulk_content(paths, owner, description, tags=tag_list,
+                                                                   titles=[upload_title(f) for f in bulk_images])
+                    
+                    st.success(f"Added {report['added']} images ({report['embedded']} embedded at "
+                               f"{report['images_per_sec']:.1f} images/sec)")
+                    if report['skipped_exact'] or report['skipped_near']:
+                        st.info(f"Skipped {report['skipped_exact']} exact and {report['skipped_near']} near duplicates")
+                    if report['failed']:
+                        st.warning(f"{report['failed']} images could not be read")
+                except UploadTooLarge as e:
+                    st.error(f"❌ {e}")
+            elif bulk_images and not owner:
+                st.info("Enter an Owner/Creator above to bulk upload")
+        
+        # Reference videos are fingerprinted once per second in the background
+        with st.expander("Add Reference Video", expanded=False):
+            reference_video = st.file_uploader(
+                "Upload copyrighted video",
+                type=['mp4', 'avi', 'mov', 'mkv'],
+                key="db_video_upload"
+            )
+            if reference_video and title and owner and st.button("Add Video to Database"):
+                job_id = submit_upload_job("video_ingest", {'video_path': (reference_video, "reference")}, {
+                    'title': title,
+                    'owner': owner,
+                    'description': description,
+                    'tags': [tag.strip() for tag in tags.split(",") if tag.strip()]
+                })
+                if job_id:
+                    st.success(f"Queued video ingestion job {job_id}")
+            elif reference_video:
+                st.info("Enter a Title and Owner/Creator above to add the video")
         
         # Database statistics
         st.subheader("Database Stats")
         stats = copyright_db.get_database_stats()
         st.metric("Total Images", stats['total_images'])
+        st.metric("Reference Videos", stats['total_videos'])
         st.write(f"**Owners:** {', '.join(stats['owners']) if stats['owners'] else 'None'}")
+        st.write(f"**Shards:** {stats['shards']}")
+        st.write(f"**Embedding:** {stats['embedding']}")
+        if copyright_db.embedding_stale:
+            st.warning("Stored fingerprints come from an older embedding; searching and adding are "
+                       "disabled until the database is re-embedded.")
+            if st.button("Re-embed Database"):
+                job_id = get_job_queue().submit("embedding_migration", {})
+                st.success(f"Queued re-embedding job {job_id}")
         
         # Clear database option (for testing)
         if st.button("Clear Database", type="secondary"):
-            copyright_db.database = {}
-            copyright_db.save_database()
+            copyright_db.clear_database()
             st.warning("Database cleared!")
     
     with col2:
         st.subheader("Database Contents")
         
-        if not copyright_db.database:
+        entries = copyright_db.database
+        if not entries:
             st.info("Database is empty. Add some copyrighted content using the form on the left.")
         else:
             # Display all database entries
-            for image_id, data in copyright_db.database.items():
+            for image_id, data in entries.items():
                 with st.expander(f"{data['title']} - {data['owner']}", expanded=False):
                     
                     # Display image if available
                     col_img, col_info = st.columns([1, 2])
                     
                     with col_img:
-                        if os.path.exists(data['path']):
-                            st.image(data['path'], use_column_width=True)
+                        preview = data.get('thumbnail') or preview_cache.get(data['path'])
+                        if os.path.exists(preview):
+                            st.image(preview, use_column_width=True)
                         else:
                             st.warning("Image file not found")
                     
                     with col_info:
                         st.write(f"**Owner:** {data['owner']}")
                         st.write(f"**Description:** {data['description']}")
-                        st.write(f"**File:** {os.path.basename(data['path'])}")
+                        st.write(f"**File:** {data.get('source_name', os.path.basename(data['path']))}")
                         
                         # Remove button
                         if st.button("Remove", key=f"remove_{image_id}"):
-                            del copyright_db.database[image_id]
-                            copyright_db.save_database()
+                            copyright_db.remove_content(image_id)
                             st.success("Removed from database!")
                             st.rerun()
+        
+        if stats['total_videos']:
+            st.subheader("Reference Videos")
+            for video_id, data in copyright_db.videos.videos.items():
+                with st.expander(f"{data['title']} - {data['owner']} ({data['duration']:.0f}s)", expanded=False):
+                    if data.get('thumbnail') and os.path.exists(data['thumbnail']):
+                        st.image(data['thumbnail'], use_column_width=True)
+                    st.write(f"**Description:** {data['description']}")
+                    st.write(f"**File:** {data['source_name']}")
+                    if st.button("Remove", key=f"remove_video_{video_id}"):
+                        copyright_db.remove_video(video_id)
+                        st.success("Removed from database!")
+                        st.rerun()
 
 def display_video_results(results, reference_path):
     """Display video analysis results"""
@@ -412,15 +536,16 @@ def display_video_results(results, reference_path):
         with st.expander(f"Frame {i+1} - {result['frame_info']['time_seconds']:.1f}s - {result['analysis']['risk_level']} Risk"):
             col1, col2 = st.columns(2)
             with col1:
-                st.image(result['frame_info']['image'], caption=f"Video Frame at {result['frame_info']['time_seconds']:.1f}s")
+                st.image(result['frame_info'].get('image') or preview_cache.get(result['frame_info']['path']),
+                         caption=f"Video Frame at {result['frame_info']['time_seconds']:.1f}s")
             with col2:
-                st.image(reference_path, caption="Reference Image")
+                st.image(preview_cache.get(reference_path), caption="Reference Image")
                 
             # Show analysis results
             analysis = result['analysis']
-            st.write(f"**Direct Similarity:** {analysis['direct_similarity']:.3f}")
-            st.write(f"**Style Similarity:** {analysis['style_similarity']:.3f}")
-            st.write(f"**Content Similarity:** {analysis['content_similarity']:.3f}")
+            st.write(f"**Direct Similarity:** {format_metric(analysis, 'direct_similarity')}")
+            st.write(f"**Style Similarity:** {format_metric(analysis, 'style_similarity')}")
+            st.write(f"**Content Similarity:** {format_metric(analysis, 'content_similarity')}")
             st.write(f"**Overall Risk:** {analysis['risk_level']}")
 
 def database_scan_tab():
@@ -434,32 +559,149 @@ def database_scan_tab():
         key="db_scan"
     )
     
+    filters = scan_filters_section()
+    
     if uploaded_file:
         file_ext = os.path.splitext(uploaded_file.name)[1].lower()
+        is_image = file_ext in ['.jpg', '.png', '.jpeg']
         
-        # Save uploaded file
-        temp_path = f"temp_scan{file_ext}"
-        with open(temp_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
+        partial = is_image and st.checkbox("Also detect crops and partial copies", key="scan_partial")
+        temporal = not is_image and st.checkbox("Also align against reference videos", key="scan_temporal")
+        namespaces = copyright_db.get_database_stats()['namespaces']
+        cascade_backbone = None
+        if is_image and namespaces:
+            triage = st.selectbox("Fast triage backbone", ["None (ResNet50 only)"] + namespaces, key="scan_triage",
+                                  help="Reject clear non-matches with a cheap model; "
+                                       "ResNet50 only runs on the remaining candidates")
+            cascade_backbone = triage if triage in namespaces else None
+        tta = None
+        if is_image and cascade_backbone is None:
+            # Not supported together with triage
+            tta = st.multiselect("Robust matching views", [name for name in DEFAULT_TTA if name != "identity"],
+                                 key="scan_tta",
+                                 help="Also match flipped, greyscale, zoomed, downscaled or contrast-stretched "
+                                      "views of the query, embedded together in one forward pass") or None
         
-        if file_ext in ['.jpg', '.png', '.jpeg']:
-            # Image scan
-            st.subheader("Image Scan Results")
-            if st.button("Scan Image Against Database"):
-                with st.spinner("Scanning against entire database..."):
-                    matches = copyright_db.search_similar_content(temp_path, top_k=3)
-                    display_database_scan_results(matches, temp_path, is_video=False)
-        
-        else:
-            # Video scan  
-            st.subheader("Video Scan Results")
-            if st.button("Scan Video Against Database"):
-                with st.spinner("Extracting frames and scanning database..."):
-                    video_results = copyright_db.batch_video_analysis(temp_path)
-                    display_video_scan_results(video_results, temp_path)
-        
-        # Cleanup
-        os.remove(temp_path)
+        label = "Scan Image Against Database" if is_image else "Scan Video Against Database"
+        if st.button(label):
+            # Runs in the background worker pool; results survive reruns and refreshes
+            if is_image:
+                job_id = submit_upload_job("image_scan", {'query_path': (uploaded_file, "query")},
+                                           {'top_k': 3, 'filters': filters, 'partial': partial,
+                                            'cascade_backbone': cascade_backbone, 'tta': tta})
+            else:
+                job_id = submit_upload_job("video_scan", {'video_path': (uploaded_file, "query")},
+                                           {'top_k': 2, 'filters': filters, 'temporal': temporal})
+            if job_id:
+                st.success(f"Queued scan job {job_id}")
+    
+    jobs_section(["image_scan", "video_scan", "video_ingest", "embedding_migration", "evidence_export"],
+                 display_scan_job_result)
+
+def display_scan_job_result(job):
+    """Render a finished database scan job"""
+    if job['kind'] == "image_scan":
+        st.subheader("Image Scan Results")
+        display_database_scan_results(job['result']['matches'], job['payload']['query_path'], is_video=False)
+        if 'partial_matches' in job['result']:
+            display_partial_matches(job['result']['partial_matches'])
+        evidence_export_section(job)
+    elif job['kind'] == "evidence_export":
+        summary = job['result']
+        st.success(f"Evidence bundle with {summary['matches']} matches ({summary['bytes'] / 1024:.0f} KB)")
+        st.caption(f"SHA-256: {summary['sha256']}")
+        if os.path.exists(summary['path']):
+            with open(summary['path'], 'rb') as f:
+                st.download_button("Download evidence bundle", f, file_name=os.path.basename(summary['path']),
+                                   key=f"download_{job['id']}")
+    elif job['kind'] == "video_ingest":
+        st.success(f"Added reference video {job['result']['video_id']}")
+    elif job['kind'] == "embedding_migration":
+        st.success(f"Re-embedded {job['result']['embedded']} images as {job['result']['embedding']}")
+    else:
+        st.subheader("Video Scan Results")
+        display_video_scan_results(job['result']['frames'], job['payload']['video_path'])
+        if 'segments' in job['result']:
+            display_video_segments(job['result']['segments'])
+        evidence_export_section(job)
+
+def evidence_export_section(job):
+    """Queue an evidence bundle for a finished scan; it is built in the background from the stored results"""
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        fmt = st.selectbox("Evidence format", EXPORT_FORMATS, key=f"evidence_format_{job['id']}")
+    with col2:
+        min_risk = st.selectbox("Include matches from", ["MEDIUM", "HIGH", "LOW"], key=f"evidence_risk_{job['id']}")
+    with col3:
+        if st.button("Export evidence", key=f"evidence_{job['id']}"):
+            queue = get_job_queue()
+            export_id = queue.submit("evidence_export", {'source_job': job['id'], 'format': fmt, 'min_risk': min_risk,
+                                                         'queue_db': queue.db_path, 'jobs_dir': queue.jobs_dir})
+            st.success(f"Queued evidence export {export_id}")
+
+def scan_filters_section():
+    """Optional metadata filters applied before the vector search"""
+    stats = copyright_db.get_database_stats()
+    filters = {}
+    
+    with st.expander("Filter database", expanded=False):
+        owners = st.multiselect("Owners", stats['owners'], key="scan_owners")
+        tags = st.multiselect("Tags", stats['tags'], key="scan_tags")
+        text = st.text_input("Title/description contains", key="scan_text")
+        added_after = st.date_input("Added on or after", value=None, key="scan_added_after")
+    
+    if owners:
+        filters['owners'] = owners
+    if tags:
+        filters['tags'] = tags
+    if text.strip():
+        filters['text'] = text
+    if added_after:
+        filters['added_after'] = datetime.combine(added_after, datetime.min.time()).timestamp()
+    return filters
+
+def display_partial_matches(partial_matches):
+    """Display crop/partial-copy matches found by tile voting"""
+    st.subheader("Crops and Partial Copies")
+    if not partial_matches:
+        st.success("No partial copies found in database!")
+        return
+    
+    for match in partial_matches:
+        with st.expander(f"{match['title']} by {match['owner']} (Region score: {match['score']:.3f})"):
+            col1, col2 = st.columns(2)
+            with col1:
+                preview = match.get('thumbnail') or preview_cache.get(match['path'])
+                if os.path.exists(preview):
+                    st.image(preview, caption=f"Match: {match['title']}", use_column_width=True)
+            with col2:
+                relation = ("Reference appears inside the query" if match['scale'] > 1 else
+                            "Query is a crop of the reference" if match['scale'] < 1 else
+                            "Same scale")
+                st.write(f"**Relation:** {relation}")
+                st.write(f"**Agreeing tiles:** {match['votes']}")
+                st.write(f"**Query region:** {', '.join(f'{v:.2f}' for v in match['query_box'])}")
+                st.write(f"**Reference region:** {', '.join(f'{v:.2f}' for v in match['reference_box'])}")
+
+def display_video_segments(segments):
+    """Display time spans of the scanned video that match reference videos"""
+    st.subheader("Matching Reference Video Segments")
+    if not segments:
+        st.success("No matching reference video segments found!")
+        return
+    
+    for segment in segments:
+        label = (f"{segment['title']} by {segment['owner']}: {segment['query_start']:.0f}-{segment['query_end']:.0f}s "
+                 f"matches {segment['reference_start']:.0f}-{segment['reference_end']:.0f}s")
+        with st.expander(label):
+            col1, col2 = st.columns([1, 2])
+            with col1:
+                if segment.get('thumbnail') and os.path.exists(segment['thumbnail']):
+                    st.image(segment['thumbnail'], use_column_width=True)
+            with col2:
+                st.write(f"**Offset:** {segment['offset']:+.1f}s (reference time minus scanned time)")
+                st.write(f"**Matched seconds:** {segment['matched_frames']}")
+                st.write(f"**Mean frame similarity:** {segment['score']:.3f}")
 
 def display_database_scan_results(matches, query_path, is_video=False):
     """Display results from database scanning"""
@@ -476,11 +718,11 @@ def display_database_scan_results(matches, query_path, is_video=False):
             col1, col2 = st.columns(2)
             
             with col1:
-                st.image(query_path, caption="Query Image", use_column_width=True)
+                st.image(preview_cache.get(query_path), caption="Query Image", use_column_width=True)
             
             with col2:
                 if os.path.exists(match['path']):
-                    st.image(match['path'], caption=f"Match: {match['title']}", use_column_width=True)
+                    st.image(preview_cache.get(match['path']), caption=f"Match: {match['title']}", use_column_width=True)
             
             # Display full analysis results
             analysis = match['full_analysis']
@@ -489,11 +731,18 @@ def display_database_scan_results(matches, query_path, is_video=False):
             col1, col2, col3 = st.columns(3)
             
             with col1:
-                st.metric("Direct Similarity", f"{analysis['direct_similarity']:.3f}")
+                st.metric("Direct Similarity", format_metric(analysis, 'direct_similarity'))
             with col2:
-                st.metric("Style Similarity", f"{analysis['style_similarity']:.3f}")
+                st.metric("Style Similarity", format_metric(analysis, 'style_similarity'))
             with col3:
-                st.metric("Content Similarity", f"{analysis['content_similarity']:.3f}")
+                st.metric("Content Similarity", format_metric(analysis, 'content_similarity'))
+            
+            if 'cascade' in analysis:
+                cascade = analysis['cascade']
+                st.caption(f"Triage: {cascade['backbone']} similarity {cascade['triage_similarity']:.3f} "
+                           f"({'rejected by triage' if cascade['stage'] == 'reject' else 'confirmed by full analysis'})")
+            if match.get('tta_view', "identity") != "identity":
+                st.caption(f"Matched through the {match['tta_view']} view of the query")
             
             # Risk assessment
             risk_color = "HIGH" if analysis['risk_level'] == "HIGH" else "MEDIUM" if analysis['risk_level'] == "MEDIUM" else "LOW"
@@ -536,11 +785,12 @@ def display_video_scan_results(video_results, video_path):
                 col1, col2, col3 = st.columns(3)
                 
                 with col1:
-                    st.image(result['frame_info']['image'], caption=f"Video Frame at {result['frame_info']['time_seconds']:.1f}s")
+                    st.image(result['frame_info'].get('image') or preview_cache.get(result['frame_info']['path']),
+                             caption=f"Video Frame at {result['frame_info']['time_seconds']:.1f}s")
                 
                 with col2:
                     if os.path.exists(best_match['path']):
-                        st.image(best_match['path'], caption=f"Match: {best_match['title']}")
+                        st.image(preview_cache.get(best_match['path']), caption=f"Match: {best_match['title']}")
                 
                 with col3:
                     analysis = best_match['full_analysis']
@@ -606,32 +856,28 @@ def image_analysis_section():
         st.markdown('<hr class="gradient-divider">', unsafe_allow_html=True)
         if st.button("Run Comprehensive Multi-Test Analysis", type="primary", use_container_width=True, help="Click to analyze both images using our advanced detection system"):
             with st.spinner('Running advanced multi-layer analysis... This may take a few moments.'):
-                # Save uploaded files
-                ref_path = "temp_reference.jpg"
-                query_path = "temp_query.jpg"
-                
-                with open(ref_path, "wb") as f:
-                    f.write(reference_file.getbuffer())
-                with open(query_path, "wb") as f:
-                    f.write(query_file.getbuffer())
-                
-                # Display uploaded images
-                st.subheader("Uploaded Images")
-                img_col1, img_col2 = st.columns(2)
-                with img_col1:
-                    st.image(reference_file, caption="Reference Image")
-                with img_col2:
-                    st.image(query_file, caption="Query Image")
-                
-                # Run comprehensive analysis
-                results = analyzer.run_comprehensive_analysis(query_path, ref_path)
-                
-                # Display professional results
-                display_professional_results(results, ref_path, query_path)
-                
-                # Cleanup
-                os.remove(ref_path)
-                os.remove(query_path)
+                try:
+                    # Per-request temp copies, so concurrent sessions never collide
+                    with temporary_upload(reference_file) as ref_path, temporary_upload(query_file) as query_path:
+                        run_image_analysis(reference_file, query_file, ref_path, query_path)
+                except UploadTooLarge as e:
+                    st.error(f"❌ {e}")
+
+def run_image_analysis(reference_file, query_file, ref_path, query_path):
+    """Show the uploads, analyse them and render the results dashboard"""
+    # Display uploaded images
+    st.subheader("Uploaded Images")
+    img_col1, img_col2 = st.columns(2)
+    with img_col1:
+        st.image(open_downscaled(ref_path), caption="Reference Image")
+    with img_col2:
+        st.image(open_downscaled(query_path), caption="Query Image")
+    
+    # Run comprehensive analysis
+    results = analyzer.run_comprehensive_analysis(query_path, ref_path)
+    
+    # Display professional results
+    display_professional_results(results, ref_path, query_path)
 
 def display_professional_results(results, ref_path, query_path):
     """Display professional results dashboard"""
@@ -697,25 +943,30 @@ def display_professional_results(results, ref_path, query_path):
     # Advanced Visualizations
     st.subheader("Advanced Analysis Visualizations")
     
+    # Interactive charts are drawn by the browser from a small Plotly spec;
+    # static charts are cached PNGs, rendered once per distinct result
+    interactive = visualizer.plotly_available() and st.checkbox("Interactive charts", value=True,
+                                                                 key="interactive_charts")
+    
     viz_col1, viz_col2 = st.columns(2)
     
     with viz_col1:
         st.write("**Similarity Profile Radar**")
-        radar_fig = visualizer.create_similarity_radar(results)
-        st.pyplot(radar_fig)
-        plt.close()
+        if interactive:
+            st.plotly_chart(visualizer.similarity_radar_spec(results), use_container_width=True)
+        else:
+            st.image(visualizer.similarity_radar_png(results))
     
     with viz_col2:
         st.write("**Risk Assessment Heatmap**")
-        heatmap_fig = visualizer.create_risk_heatmap(results)
-        st.pyplot(heatmap_fig)
-        plt.close()
+        if interactive:
+            st.plotly_chart(visualizer.risk_heatmap_spec(results), use_container_width=True)
+        else:
+            st.image(visualizer.risk_heatmap_png(results))
     
     # Side-by-side comparison
     st.subheader("Visual Comparison Analysis")
-    comparison_fig = visualizer.create_side_by_side_comparison(ref_path, query_path, results)
-    st.pyplot(comparison_fig)
-    plt.close()
+    st.image(visualizer.side_by_side_png(ref_path, query_path, results))
     
     # Analysis Notes
     st.subheader("Expert Analysis Notes")
@@ -734,12 +985,15 @@ def display_professional_results(results, ref_path, query_path):
         st.write(f"- Style: `{results['style_similarity']:.6f}`")
         st.write(f"- Content: `{results['content_similarity']:.6f}`")
         st.write(f"- Weighted: `{results['weighted_score']:.6f}`")
+        if 'raw_similarities' in results:
+            st.write("- Per layer: " + ", ".join(f"{layer} `{value:.4f}`"
+                                               for layer, value in results['raw_similarities'].items()))
         
         st.write("**Analysis Method:**")
         st.write("- Direct: Final ResNet50 layer features")
-        st.write("- Style: Layer 2-3 features (textures/patterns)")
-        st.write("- Content: Layer 1 + Final features (shapes/objects)")
-        st.write("- Thresholds: HIGH > 0.7, MEDIUM > 0.4, LOW ≤ 0.4")
+        st.write("- Style: Layer 2-3 features pooled to a 4x4 grid (textures/patterns)")
+        st.write("- Content: Layer 1 (8x8 grid) + Final features (shapes/objects)")
+        st.write(f"- Risk: {score_model.describe()}")
 
 if __name__ == "__main__":
     main()
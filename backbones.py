@@ -0,0 +1,23 @@
+import torchvision.models as models
+
+# name -> {'builder', 'weights', 'cost'}; cost is relative forward-pass FLOPs
+# (ResNet50 = 1.0) and is only used to order cascade stages and in reports
+BACKBONES = {}
+
+
+def register_backbone(name, builder, weights, cost):
+    """Make a torchvision classifier available as a fingerprint backbone"""
+    BACKBONES[name] = {'builder': builder, 'weights': weights, 'cost': cost}
+
+
+def backbone_spec(name):
+    if name not in BACKBONES:
+        raise ValueError(f"Unknown backbone: {name} (available: {', '.join(sorted(BACKBONES))})")
+    return BACKBONES[name]
+
+
+register_backbone("resnet50", models.resnet50, models.ResNet50_Weights.DEFAULT, 1.0)
+register_backbone("resnet18", models.resnet18, models.ResNet18_Weights.DEFAULT, 0.44)
+register_backbone("efficientnet_b0", models.efficientnet_b0, models.EfficientNet_B0_Weights.DEFAULT, 0.1)
+register_backbone("mobilenet_v3_large", models.mobilenet_v3_large, models.MobileNet_V3_Large_Weights.DEFAULT, 0.053)
+register_backbone("mobilenet_v3_small", models.mobilenet_v3_small, models.MobileNet_V3_Small_Weights.DEFAULT, 0.015)
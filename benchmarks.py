@@ -0,0 +1,420 @@
+import os
+import random
+import shutil
+import tempfile
+import time
+from PIL import Image, ImageEnhance, ImageOps
+
+
+def make_queries(image_paths, output_dir, seed=0):
+    """Write a lightly edited copy of each image (crop, rescale, brightness, JPEG) as a known-positive query"""
+    rng = random.Random(seed)
+    queries = []
+    for i, path in enumerate(image_paths):
+        image = Image.open(path).convert('RGB')
+        width, height = image.size
+        margin_x, margin_y = int(width * rng.uniform(0, 0.08)), int(height * rng.uniform(0, 0.08))
+        image = image.crop((margin_x, margin_y, width - margin_x, height - margin_y))
+        scale = rng.uniform(0.5, 0.9)
+        image = image.resize((max(int(image.width * scale), 32), max(int(image.height * scale), 32)), Image.BILINEAR)
+        image = ImageEnhance.Brightness(image).enhance(rng.uniform(0.85, 1.15))
+        query_path = os.path.join(output_dir, f"query_{i:05d}.jpg")
+        image.save(query_path, "JPEG", quality=rng.randint(50, 85))
+        queries.append(query_path)
+    return queries
+
+
+# Edits a single-view fingerprint tends to miss, applied on top of make_queries' light ones
+ROBUSTNESS_EDITS = {
+    "mirror": ImageOps.mirror,
+    "grayscale": lambda image: ImageOps.grayscale(image).convert('RGB'),
+    "colour": lambda image: ImageEnhance.Contrast(ImageEnhance.Color(image).enhance(1.8)).enhance(0.6),
+    "lowres": lambda image: image.resize((max(image.width // 4, 16), max(image.height // 4, 16)), Image.BILINEAR),
+}
+
+
+def make_robust_queries(image_paths, output_dir, seed=0):
+    """make_queries copies with one ROBUSTNESS_EDITS edit each, cycling through them; returns (queries, edits)"""
+    queries = make_queries(image_paths, output_dir, seed)
+    edits = [list(ROBUSTNESS_EDITS)[i % len(ROBUSTNESS_EDITS)] for i in range(len(queries))]
+    for query_path, edit in zip(queries, edits):
+        ROBUSTNESS_EDITS[edit](Image.open(query_path).convert('RGB')).save(query_path, "JPEG", quality=85)
+    return queries, edits
+
+
+def run_scan(db, queries, truth, top_k=3, **search_kwargs):
+    """Scan every query; recall counts the true reference returned with a MEDIUM/HIGH risk"""
+    start = time.time()
+    found, escalated, analysed = 0, 0, 0
+    for query_path, expected_id in zip(queries, truth):
+        matches = db.search_similar_content(query_path, top_k=top_k, min_similarity=None, **search_kwargs)
+        for match in matches:
+            analysed += 1
+            if match['full_analysis'].get('cascade', {}).get('stage') != 'reject':
+                escalated += 1
+        if any(match['image_id'] == expected_id and match['full_analysis']['risk_level'] != 'LOW'
+               for match in matches):
+            found += 1
+    seconds = time.time() - start
+    return {
+        'seconds': seconds,
+        'images_per_sec': len(queries) / seconds if seconds > 0 else 0.0,
+        'recall': found / len(queries) if queries else 0.0,
+        'full_analyses': escalated,
+        'candidates': analysed
+    }
+
+
+def benchmark_cascade(db, backbone="mobilenet_v3_small", bands=((0.3, 0.9), (0.5, 0.9), (0.7, 0.9), (0.8, 0.9)),
+                      sample=50, top_k=3, seed=0):
+    """End-to-end scan throughput of ResNet50-only vs cheap-backbone cascades
+
+    Queries are edited copies of a sample of database entries, so each has
+    one known correct reference. The headline figure is the speedup of the
+    fastest band whose recall is at least the ResNet50-only recall.
+    """
+    if backbone not in db.namespaces:
+        print(f"Embedding the database with {backbone}...")
+        db.add_namespace(backbone)
+
+    entries = sorted(db.database.values(), key=lambda entry: entry['image_id'])
+    random.Random(seed).shuffle(entries)
+    entries = entries[:sample]
+    truth = [entry['image_id'] for entry in entries]
+
+    query_dir = tempfile.mkdtemp(prefix="copyscale_bench_")
+    try:
+        queries = make_queries([db.reference_path(entry) for entry in entries], query_dir, seed)
+
+        # Load both models before timing anything
+        run_scan(db, queries[:1], truth[:1], top_k)
+        run_scan(db, queries[:1], truth[:1], top_k, cascade_backbone=backbone)
+
+        report = {'backbone': backbone, 'queries': len(queries), 'baseline': run_scan(db, queries, truth, top_k),
+                  'cascades': []}
+        for band in bands:
+            result = run_scan(db, queries, truth, top_k, cascade_backbone=backbone, uncertain_band=band)
+            result['band'] = list(band)
+            report['cascades'].append(result)
+    finally:
+        shutil.rmtree(query_dir, ignore_errors=True)
+
+    at_recall = [result for result in report['cascades'] if result['recall'] >= report['baseline']['recall']]
+    best = max(at_recall, key=lambda result: result['images_per_sec']) if at_recall else None
+    report['best'] = best
+    report['speedup'] = (best['images_per_sec'] / report['baseline']['images_per_sec']
+                         if best and report['baseline']['images_per_sec'] else None)
+    return report
+
+
+def print_cascade_report(report):
+    baseline = report['baseline']
+    print(f"{report['queries']} queries, triage backbone {report['backbone']}")
+    print(f"{'mode':<24}{'img/s':>8}{'recall':>8}{'full analyses':>15}")
+    print(f"{'resnet50 only':<24}{baseline['images_per_sec']:>8.2f}{baseline['recall']:>8.2%}"
+          f"{baseline['full_analyses']:>15}")
+    for result in report['cascades']:
+        label = f"cascade {result['band'][0]:.2f}-{result['band'][1]:.2f}"
+        print(f"{label:<24}{result['images_per_sec']:>8.2f}{result['recall']:>8.2%}{result['full_analyses']:>15}")
+    if report['best']:
+        print(f"✅ {report['speedup']:.2f}x end-to-end at recall >= {baseline['recall']:.2%} "
+              f"(band {report['best']['band'][0]:.2f}-{report['best']['band'][1]:.2f})")
+    else:
+        print("⚠️ No cascade band kept the ResNet50-only recall")
+
+
+def benchmark_embeddings(db, embeddings=("logits", "avg", "gem", "rmac"), sample=50, max_catalogue=2000,
+                         target_recall=0.95, batch_size=32, seed=0):
+    """Stage-1 retrieval quality and cost of each fingerprint embedding
+    
+    The catalogue (up to max_catalogue database images) is embedded in
+    memory with every variant; queries are edited copies of a sample of it.
+    'candidates_needed' is the smallest top-k whose recall reaches
+    target_recall, i.e. how many comprehensive analyses a scan would need.
+    """
+    import numpy as np
+    from fingerprint import get_fingerprinter
+    
+    entries = sorted(db.database.values(), key=lambda entry: entry['image_id'])
+    random.Random(seed).shuffle(entries)
+    entries = entries[:max_catalogue]
+    paths = [db.reference_path(entry) for entry in entries]
+    truth = list(range(min(sample, len(entries))))
+    
+    query_dir = tempfile.mkdtemp(prefix="copyscale_bench_")
+    reports = []
+    try:
+        queries = make_queries(paths[:len(truth)], query_dir, seed)
+        for embedding in embeddings:
+            fingerprinter = get_fingerprinter("resnet50", embedding)
+            start = time.time()
+            catalogue = fingerprinter.get_fingerprints(paths, batch_size)
+            embed_seconds = time.time() - start
+            query_vectors = fingerprinter.get_fingerprints(queries, batch_size)
+            
+            dim = next(len(vector) for vector in catalogue if vector is not None)
+            matrix = np.stack([vector if vector is not None else np.zeros(dim, dtype=np.float32)
+                               for vector in catalogue]).astype(np.float32)
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+            
+            ranks, search_seconds = [], 0.0
+            for expected, vector in zip(truth, query_vectors):
+                if vector is None:
+                    ranks.append(len(matrix))
+                    continue
+                start = time.time()
+                scores = matrix @ (vector / max(np.linalg.norm(vector), 1e-12))
+                search_seconds += time.time() - start
+                ranks.append(int(np.sum(scores > scores[expected])))
+            ranks = np.array(ranks)
+            
+            needed = next((k for k in range(1, len(matrix) + 1) if np.mean(ranks < k) >= target_recall), None)
+            reports.append({
+                'embedding': fingerprinter.describe(),
+                'dim': dim,
+                'recall_at_1': float(np.mean(ranks < 1)),
+                'recall_at_5': float(np.mean(ranks < 5)),
+                'mrr': float(np.mean(1.0 / (ranks + 1))),
+                'candidates_needed': needed,
+                'embed_images_per_sec': len(paths) / embed_seconds if embed_seconds > 0 else 0.0,
+                'search_ms': 1000 * search_seconds / max(len(truth), 1),
+                'queries': len(truth),
+                'catalogue': len(matrix),
+                'target_recall': target_recall
+            })
+    finally:
+        shutil.rmtree(query_dir, ignore_errors=True)
+    return reports
+
+
+def print_embedding_report(reports):
+    if not reports:
+        print("No images to benchmark")
+        return
+    print(f"{reports[0]['queries']} queries against {reports[0]['catalogue']} images")
+    print(f"{'embedding':<22}{'dim':>6}{'R@1':>8}{'R@5':>8}{'MRR':>7}{'k@' + format(reports[0]['target_recall'], '.0%'):>7}"
+          f"{'img/s':>8}{'ms/query':>10}")
+    for report in reports:
+        needed = report['candidates_needed'] if report['candidates_needed'] is not None else '-'
+        print(f"{report['embedding']:<22}{report['dim']:>6}{report['recall_at_1']:>8.2%}{report['recall_at_5']:>8.2%}"
+              f"{report['mrr']:>7.3f}{needed:>7}{report['embed_images_per_sec']:>8.1f}{report['search_ms']:>10.3f}")
+
+
+def benchmark_compression(db, configs=((128, "float32"), (128, "int8"), (256, "int8"), (128, "pq"), (256, "pq")),
+                          sample=200, k=10, whiten=True, seed=0):
+    """Recall@k, bytes per entry and search time of PCA + codec variants against the raw fingerprints
+    
+    Each variant is fitted in memory; nothing is written to the database.
+    """
+    import numpy as np
+    from quantization import CompressedIndex, recall_report
+    
+    ids, matrix = db._all_fingerprints()
+    if matrix is None:
+        return []
+    rng = np.random.RandomState(seed)
+    rows = rng.choice(len(ids), min(sample, len(ids)), replace=False)
+    queries = matrix[rows] / np.linalg.norm(matrix[rows], axis=1, keepdims=True)
+    queries = queries + rng.normal(0, 0.005, queries.shape).astype(np.float32)
+    
+    reports = []
+    for dim, codec in configs:
+        index = CompressedIndex(os.devnull).fit(ids, matrix, dim, whiten, codec, pq_subspaces=dim // 8)
+        report = recall_report(ids, matrix, index, queries, k)
+        report.update({'dim': index.projection.dim, 'codec': codec})
+        reports.append(report)
+    return reports
+
+
+def print_compression_report(reports):
+    if not reports:
+        print("No fingerprints to compress")
+        return
+    print(f"{reports[0]['queries']} queries, recall@{reports[0]['k']} against raw {reports[0]['raw_bytes_per_entry']}-byte "
+          f"vectors ({reports[0]['raw_seconds']:.3f}s)")
+    print(f"{'variant':<16}{'bytes':>8}{'smaller':>9}{'recall':>8}{'seconds':>9}")
+    for report in reports:
+        label = f"{report['dim']}d {report['codec']}"
+        print(f"{label:<16}{report['compressed_bytes_per_entry']:>8.0f}{report['memory_reduction']:>8.1f}x"
+              f"{report['recall_at_k']:>8.2%}{report['compressed_seconds']:>9.3f}")
+
+
+def benchmark_early_exit(db, sample=50, top_k=10, seed=0):
+    """Per-pair cost of the full analysis vs early-exit evaluation over the same search candidates
+
+    Queries are edited copies of a sample of database entries, so each has
+    one true copy among its top_k candidates and the rest are mostly
+    unrelated, as in a real scan. Both modes load reference descriptors
+    from the blob store per pair; query descriptors are extracted once up
+    front and not timed. Early exit must agree with the full analysis on
+    every risk level.
+    """
+    import contextlib
+    import io
+    from analyzer import analyzer
+
+    entries = sorted(db.database.values(), key=lambda entry: entry['image_id'])
+    random.Random(seed).shuffle(entries)
+    entries = entries[:sample]
+    query_dir = tempfile.mkdtemp(prefix="copyscale_bench_")
+    try:
+        queries = make_queries([db.reference_path(entry) for entry in entries], query_dir, seed)
+        pairs = []
+        for query_path, descriptors in zip(queries, analyzer.extract_descriptors(queries)):
+            if descriptors is None:
+                continue
+            for _, image_id, shard_id in db.search_candidates(descriptors['final'], top_k):
+                shard = db.get_shard(shard_id)
+                pairs.append((query_path, descriptors, shard.entries[image_id],
+                              shard.namespace_matrix(None)[shard.row_of(image_id)]))
+    finally:
+        shutil.rmtree(query_dir, ignore_errors=True)
+
+    def analyse(early_exit):
+        results = []
+        start = time.time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for query_path, descriptors, entry, fingerprint in pairs:
+                results.append(analyzer.run_comprehensive_analysis(
+                    query_path, entry['path'],
+                    reference_descriptors=lambda entry=entry: db.get_reference_descriptors(entry),
+                    query_descriptors=descriptors, early_exit=early_exit, reference_fingerprint=fingerprint))
+        return results, time.time() - start
+
+    analyse(False)
+    full, full_seconds = analyse(False)
+    early, early_seconds = analyse(True)
+    return {
+        'pairs': len(pairs),
+        'full_ms_per_pair': full_seconds * 1000 / max(len(pairs), 1),
+        'early_ms_per_pair': early_seconds * 1000 / max(len(pairs), 1),
+        'speedup': full_seconds / early_seconds if early_seconds else None,
+        'settled_by_fingerprint': sum(not result['early_exit']['descriptors_loaded'] for result in early),
+        'mean_computed': sum(len(result['early_exit']['computed']) for result in early) / max(len(early), 1),
+        'risk_agreement': sum(a['risk_level'] == b['risk_level'] for a, b in zip(full, early)) / max(len(pairs), 1),
+        'levels': {level: sum(result['risk_level'] == level for result in full) for level in ('LOW', 'MEDIUM', 'HIGH')}
+    }
+
+
+def print_early_exit_report(report):
+    print(f"{report['pairs']} query/candidate pairs (full analysis levels: "
+          f"{', '.join(f'{level} {count}' for level, count in report['levels'].items())})")
+    print(f"full analysis {report['full_ms_per_pair']:.2f} ms/pair, early exit {report['early_ms_per_pair']:.2f} ms/pair "
+          f"({report['speedup']:.2f}x)")
+    print(f"{report['settled_by_fingerprint']} pairs settled from the fingerprint alone, "
+          f"{report['mean_computed']:.2f} of 5 similarities computed on average")
+    print("✅ Same risk level on every pair" if report['risk_agreement'] == 1.0
+          else f"❌ Risk levels agree on only {report['risk_agreement']:.2%} of pairs")
+
+
+def benchmark_tta(db, sample=50, top_k=3, view_counts=(1, 2, 4, 6), seed=0):
+    """Detection gain vs added latency of test-time augmentation over flipped/greyscale/recoloured/low-res copies
+
+    Queries are edited copies of a sample of database entries (see
+    make_robust_queries). For each K the whole search (query extraction of
+    K views in one forward pass, the max-pooled candidate search and the
+    full analysis) is timed per query; a query is detected when its true
+    entry is among the top_k matches with a MEDIUM/HIGH risk. Gains and
+    added latency are relative to K=1, the ordinary single-view search.
+    """
+    import contextlib
+    import io
+    from fingerprint import tta_views
+
+    entries = sorted(db.database.values(), key=lambda entry: entry['image_id'])
+    random.Random(seed).shuffle(entries)
+    entries = entries[:sample]
+    truth = [entry['image_id'] for entry in entries]
+    query_dir = tempfile.mkdtemp(prefix="copyscale_bench_")
+    reports = []
+    try:
+        queries, edits = make_robust_queries([db.reference_path(entry) for entry in entries], query_dir, seed)
+        # Warm-up: model, shards and descriptor blobs are loaded before anything is timed
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.search_similar_content(queries[0], top_k=top_k, min_similarity=None, tta=max(view_counts))
+        for views in view_counts:
+            found, ranks, by_edit = 0, [], {edit: 0 for edit in ROBUSTNESS_EDITS}
+            start = time.time()
+            with contextlib.redirect_stdout(io.StringIO()):
+                for query_path, expected_id, edit in zip(queries, truth, edits):
+                    matches = db.search_similar_content(query_path, top_k=top_k, min_similarity=None, tta=views)
+                    ids = [match['image_id'] for match in matches]
+                    if expected_id in ids:
+                        ranks.append(ids.index(expected_id) + 1)
+                    if any(match['image_id'] == expected_id and match['full_analysis']['risk_level'] != 'LOW'
+                           for match in matches):
+                        found += 1
+                        by_edit[edit] += 1
+            seconds = time.time() - start
+            reports.append({
+                'views': views,
+                'augmentations': list(tta_views(views)),
+                'ms_per_query': seconds * 1000 / max(len(queries), 1),
+                'recall': found / max(len(queries), 1),
+                'retrieved': len(ranks) / max(len(queries), 1),
+                'mean_rank': sum(ranks) / len(ranks) if ranks else None,
+                'recall_by_edit': {edit: count / max(edits.count(edit), 1) for edit, count in by_edit.items()}
+            })
+    finally:
+        shutil.rmtree(query_dir, ignore_errors=True)
+
+    baseline = reports[0]
+    for report in reports:
+        report['recall_gain'] = report['recall'] - baseline['recall']
+        report['added_ms'] = report['ms_per_query'] - baseline['ms_per_query']
+    return reports
+
+
+def print_tta_report(reports):
+    print(f"{'K':>2} {'views':<52} {'ms/query':>9} {'+ms':>7} {'recall':>7} {'gain':>7} {'in top-k':>8}  by edit")
+    for report in reports:
+        by_edit = ", ".join(f"{edit} {recall:.0%}" for edit, recall in report['recall_by_edit'].items())
+        print(f"{report['views']:>2} {','.join(report['augmentations']):<52} {report['ms_per_query']:>9.1f} "
+              f"{report['added_ms']:>7.1f} {report['recall']:>7.2%} {report['recall_gain']:>+7.2%} "
+              f"{report['retrieved']:>8.2%}  {by_edit}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Copyscale benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    cascade_parser = subparsers.add_parser("cascade", help="cheap-backbone cascade vs ResNet50-only scanning")
+    cascade_parser.add_argument("--db", default="copyright_database.json")
+    cascade_parser.add_argument("--backbone", default="mobilenet_v3_small")
+    cascade_parser.add_argument("--sample", type=int, default=50)
+    embedding_parser = subparsers.add_parser("embeddings", help="logits vs pooled penultimate-layer fingerprints")
+    embedding_parser.add_argument("--db", default="copyright_database.json")
+    embedding_parser.add_argument("--sample", type=int, default=50)
+    embedding_parser.add_argument("--max-catalogue", type=int, default=2000)
+    early_exit_parser = subparsers.add_parser("early-exit", help="full vs short-circuit pair analysis cost")
+    early_exit_parser.add_argument("--db", default="copyright_database.json")
+    early_exit_parser.add_argument("--sample", type=int, default=50)
+    early_exit_parser.add_argument("--top-k", type=int, default=10)
+    tta_parser = subparsers.add_parser("tta", help="test-time augmentation detection gain vs latency")
+    tta_parser.add_argument("--db", default="copyright_database.json")
+    tta_parser.add_argument("--sample", type=int, default=50)
+    tta_parser.add_argument("--top-k", type=int, default=3)
+    tta_parser.add_argument("--views", default="1,2,4,6", help="comma-separated view counts K to compare")
+    compression_parser = subparsers.add_parser("compression", help="PCA + int8/PQ fingerprint compression recall")
+    compression_parser.add_argument("--db", default="copyright_database.json")
+    compression_parser.add_argument("--sample", type=int, default=200)
+    compression_parser.add_argument("--k", type=int, default=10)
+    compression_parser.add_argument("--no-whiten", action="store_true")
+    args = parser.parse_args()
+
+    from copyright_db import CopyrightDatabase
+
+    if args.benchmark == "cascade":
+        print_cascade_report(benchmark_cascade(CopyrightDatabase(args.db), args.backbone, sample=args.sample))
+    elif args.benchmark == "embeddings":
+        print_embedding_report(benchmark_embeddings(CopyrightDatabase(args.db), sample=args.sample,
+                                                    max_catalogue=args.max_catalogue))
+    elif args.benchmark == "early-exit":
+        print_early_exit_report(benchmark_early_exit(CopyrightDatabase(args.db), sample=args.sample, top_k=args.top_k))
+    elif args.benchmark == "tta":
+        print_tta_report(benchmark_tta(CopyrightDatabase(args.db), sample=args.sample, top_k=args.top_k,
+                                       view_counts=[int(k) for k in args.views.split(",")]))
+    elif args.benchmark == "compression":
+        print_compression_report(benchmark_compression(CopyrightDatabase(args.db), sample=args.sample, k=args.k,
+                                                       whiten=not args.no_whiten))
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import shutil
+from contextlib import contextmanager
+from previews import open_downscaled
+from shards import atomic_write_json, file_lock
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Content hash used for blob addressing and exact-duplicate detection"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BlobStore:
+    """Content-addressed copies of reference images plus their thumbnails
+
+    Blobs live at <root>/objects/ab/abcdef....jpg so the database never
+    depends on upload temp files that the app deletes after ingestion.
+    Thumbnails and per-model-version descriptors sit alongside under
+    thumbs/ and descriptors/. Database snapshots pin the blobs they
+    reference (pins/<name>.json): deleting a pinned blob is deferred until
+    its last pin is released.
+    """
+
+    def __init__(self, root="copyright_blobs", thumbnail_size=(256, 256)):
+        self.root = root
+        self.thumbnail_size = thumbnail_size
+
+    def _object_dir(self, sha256):
+        return os.path.join(self.root, "objects", sha256[:2])
+
+    def _thumb_dir(self, sha256):
+        return os.path.join(self.root, "thumbs", sha256[:2])
+
+    def path_for(self, sha256):
+        """Path of the stored original, or None if the blob is missing"""
+        directory = self._object_dir(sha256)
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if name.startswith(sha256):
+                    return os.path.join(directory, name)
+        return None
+
+    def thumbnail_path(self, sha256):
+        return os.path.join(self._thumb_dir(sha256), f"{sha256}.jpg")
+
+    def descriptor_path(self, sha256, version):
+        """Where precomputed multi-layer descriptors for a blob and model version live"""
+        return os.path.join(self.root, "descriptors", sha256[:2], f"{sha256}.{version}.npz")
+
+    def has(self, sha256):
+        return self.path_for(sha256) is not None
+
+    def put(self, source_path, sha256=None, thumbnail=True):
+        """Copy a file into the store (no-op if already present); returns (sha256, blob_path)
+        
+        Pass thumbnail=False for files PIL cannot open (videos) and call
+        save_thumbnail with a decoded frame instead.
+        """
+        sha256 = sha256 or file_sha256(source_path)
+        self._cancel_deferred(sha256)
+        existing = self.path_for(sha256)
+        if existing is not None:
+            return sha256, existing
+
+        extension = os.path.splitext(source_path)[1].lower() or ".img"
+        directory = self._object_dir(sha256)
+        os.makedirs(directory, exist_ok=True)
+        blob_path = os.path.join(directory, f"{sha256}{extension}")
+
+        tmp_path = f"{blob_path}.tmp"
+        shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, blob_path)
+
+        if thumbnail:
+            self.make_thumbnail(sha256, blob_path)
+        return sha256, blob_path
+
+    def make_thumbnail(self, sha256, blob_path):
+        """Write a small JPEG preview for the blob"""
+        try:
+            self.save_thumbnail(sha256, open_downscaled(blob_path, self.thumbnail_size))
+        except Exception as e:
+            print(f"Error creating thumbnail for {blob_path}: {e}")
+    
+    def save_thumbnail(self, sha256, image):
+        """Write a small JPEG preview from an already decoded PIL image"""
+        os.makedirs(self._thumb_dir(sha256), exist_ok=True)
+        image = image.copy()
+        image.thumbnail(self.thumbnail_size)
+        image.convert('RGB').save(self.thumbnail_path(sha256), "JPEG", quality=85)
+
+    def _pins_dir(self):
+        return os.path.join(self.root, "pins")
+
+    @contextmanager
+    def _pins_locked(self):
+        os.makedirs(self._pins_dir(), exist_ok=True)
+        with file_lock(os.path.join(self._pins_dir(), ".lock")):
+            yield
+
+    def _read_pins(self, name):
+        path = os.path.join(self._pins_dir(), name)
+        if not os.path.exists(path):
+            return set()
+        with open(path, 'r') as f:
+            return set(json.load(f))
+
+    def _pinned(self):
+        """Every hash held by some pin (call with the pins lock held)"""
+        pinned = set()
+        for name in os.listdir(self._pins_dir()):
+            if name.endswith(".json") and not name.startswith("."):
+                pinned |= self._read_pins(name)
+        return pinned
+
+    def pin(self, name, hashes):
+        """Keep these blobs (with their thumbnails and descriptors) until unpin(name)"""
+        with self._pins_locked():
+            atomic_write_json(os.path.join(self._pins_dir(), f"{name}.json"), sorted(hashes))
+
+    def unpin(self, name):
+        """Release a pin and carry out the deletions it deferred; returns how many blobs were deleted"""
+        with self._pins_locked():
+            path = os.path.join(self._pins_dir(), f"{name}.json")
+            if os.path.exists(path):
+                os.remove(path)
+            deferred = self._read_pins(".deferred.json")
+            due = deferred - self._pinned()
+            for sha256 in due:
+                self._delete_files(sha256)
+            atomic_write_json(os.path.join(self._pins_dir(), ".deferred.json"), sorted(deferred - due))
+        return len(due)
+
+    def _cancel_deferred(self, sha256):
+        """A blob stored again must survive the release of a pin that deferred its deletion"""
+        if not os.path.isdir(self._pins_dir()):
+            return
+        with self._pins_locked():
+            deferred = self._read_pins(".deferred.json")
+            if sha256 in deferred:
+                atomic_write_json(os.path.join(self._pins_dir(), ".deferred.json"), sorted(deferred - {sha256}))
+
+    def delete(self, sha256):
+        """Delete a blob with its thumbnail and descriptors, or defer that while a snapshot pins it"""
+        return self.delete_many([sha256])
+
+    def delete_many(self, hashes):
+        """delete() for several blobs, reading the pins once; returns how many were deleted now"""
+        hashes = set(hashes)
+        if not hashes:
+            return 0
+        if not os.path.isdir(self._pins_dir()):
+            for sha256 in hashes:
+                self._delete_files(sha256)
+            return len(hashes)
+        with self._pins_locked():
+            pinned = hashes & self._pinned()
+            if pinned:
+                deferred = self._read_pins(".deferred.json") | pinned
+                atomic_write_json(os.path.join(self._pins_dir(), ".deferred.json"), sorted(deferred))
+            for sha256 in hashes - pinned:
+                self._delete_files(sha256)
+        return len(hashes - pinned)
+
+    def _delete_files(self, sha256):
+        for path in (self.path_for(sha256), self.thumbnail_path(sha256)):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+        # Descriptors of every model version
+        descriptor_dir = os.path.join(self.root, "descriptors", sha256[:2])
+        if os.path.isdir(descriptor_dir):
+            for name in os.listdir(descriptor_dir):
+                if name.startswith(sha256):
+                    os.remove(os.path.join(descriptor_dir, name))
+
+    def garbage_collect(self, live_hashes):
+        """Delete blobs no longer referenced by any entry (pinned ones once released); returns how many were removed"""
+        objects_root = os.path.join(self.root, "objects")
+        if not os.path.isdir(objects_root):
+            return 0
+        return self.delete_many(name.split('.')[0] for prefix in os.listdir(objects_root)
+                                for name in os.listdir(os.path.join(objects_root, prefix))
+                                if name.split('.')[0] not in live_hashes)
@@ -1,47 +1,537 @@
 import json
 import os
+import time
+import heapq
+import functools
+import threading
+from contextlib import contextmanager, nullcontext
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from analyzer import analyzer
+from fingerprint import get_fingerprinter, tta_views
+from backbones import backbone_spec
 import streamlit as st
-from sklearn.metrics.pairwise import cosine_similarity
+from shards import (FingerprintShard, owner_shard_id, hash_shard_id,
+                    atomic_write_json, file_lock, search_shard_file)
+from db_index import MetadataIndex
+from blob_store import BlobStore, file_sha256
+from descriptors import save_descriptors, load_descriptors
+from tile_index import TileIndex
+from video_index import VideoIndex
+from quantization import CompressedIndex, recall_report
+from memory_budget import memory_budget
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def serialised_write(method):
+    """Run a CopyrightDatabase method as one locked read-modify-write (see CopyrightDatabase._writing)"""
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self._writing():
+            return method(self, *args, **kwargs)
+    return locked
 
 class CopyrightDatabase:
-    def __init__(self, db_file="copyright_database.json"):
+    def __init__(self, db_file="copyright_database.json", shard_dir=None, partition="owner",
+                 num_shards=16, max_workers=None, executor="thread", blob_dir=None,
+                 descriptor_dtype="float16", namespaces=None, compressed_search=True, rerank_factor=4,
+                 read_only=False):
         self.db_file = db_file
-        self.database = self.load_database()
+        self.shard_dir = shard_dir or os.path.splitext(db_file)[0] + "_shards"
+        self.blobs = BlobStore(blob_dir or os.path.splitext(db_file)[0] + "_blobs")
+        self.descriptor_dtype = descriptor_dtype    # "float32", "float16" or "int8"
+        self.partition = partition          # "owner" (one shard per owner) or "hash"
+        self.num_shards = num_shards        # Bucket count for hash partitioning
+        self.max_workers = max_workers
+        self.executor = executor            # "thread" or "process" fan-out
+        self._process_pool = None
+        self.compressed_search = compressed_search
+        self.rerank_factor = rerank_factor  # Compressed hits rescored exactly: top_k * factor (at least top_k)
+        # Scan snapshots are opened read-only: searches never write, writes raise
+        self.read_only = read_only
+        # Saves hold this lock (threads) and the lock file (other processes)
+        self.lock_file = os.path.splitext(db_file)[0] + ".lock"
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        self.namespaces = list(namespaces or [])
+        self._load_state()
+        if self.embedding_stale:
+            print(f"Database fingerprints are {self.embedding} but the fingerprinter produces "
+                  f"{analyzer.fingerprinter.describe()}; run migrate_embeddings() before searching")
+        memory_budget.register(self.release_memory)
+    
+    def _load_state(self):
+        """(Re)read the manifest, shards and indexes from disk, dropping everything cached"""
+        self.shards = {}
+        self._dirty_shards = set()
+        self.index = MetadataIndex(os.path.splitext(self.db_file)[0] + "_index.json")
+        self.tiles = TileIndex(os.path.splitext(self.db_file)[0] + "_tiles.npz")
+        self.videos = VideoIndex(os.path.splitext(self.db_file)[0] + "_videos")
+        # Optional PCA + int8/PQ copy of the ResNet50 fingerprints (see compress_fingerprints)
+        self.compressed = CompressedIndex(os.path.splitext(self.db_file)[0] + "_compressed.npz")
+        self._loaded_signature = self._manifest_signature()
+        self.manifest = self.load_database()
+        # Extra backbones embedded at ingestion, each searchable as its own namespace
+        self.namespaces = list(dict.fromkeys(self.manifest.get('namespaces', []) + self.namespaces))
+        for backbone in self.namespaces:
+            backbone_spec(backbone)
+        self.manifest['namespaces'] = self.namespaces
+        # Fingerprinter behind the stored vectors; databases from before the
+        # embedding was configurable hold ResNet50 classifier logits
+        if not self.manifest['shards'] and not len(self.videos):
+            self.manifest['embedding'] = analyzer.fingerprinter.describe()
+        self.embedding = self.manifest.setdefault('embedding', "resnet50/logits")
+        if not self.index.load() and self.manifest['shards']:
+            self.rebuild_index()
+    
+    def _manifest_signature(self):
+        try:
+            stat = os.stat(self.db_file)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    
+    def refresh(self):
+        """Reload if another process has saved the database since it was read; returns True if it did
+        
+        Every save replaces the manifest last, so a changed manifest file
+        means shards and indexes may have changed too. Long-running readers
+        (workers, the watcher) call this before each search.
+        """
+        if self._manifest_signature() == self._loaded_signature:
+            return False
+        with self._lock:
+            if self._dirty_shards or self._manifest_signature() == self._loaded_signature:
+                return False
+            print(f"{self.db_file} changed on disk, reloading")
+            self._load_state()
+            return True
+    
+    @contextmanager
+    def _writing(self, reload=True):
+        """Serialise a read-modify-write against other threads and processes
+        
+        Holds the in-process lock and the database lock file, and first
+        reloads whatever another process saved (unless reload is False), so
+        the change lands on top of it instead of overwriting it. Re-entrant.
+        """
+        if self.read_only:
+            raise PermissionError(f"{self.db_file} is opened read-only")
+        with self._lock:
+            outermost = self._lock_depth == 0
+            with file_lock(self.lock_file) if outermost else nullcontext():
+                self._lock_depth += 1
+                try:
+                    if outermost and reload:
+                        self.refresh()
+                    yield
+                finally:
+                    self._lock_depth -= 1
     
     def load_database(self):
-        """Load the copyright database from file"""
+        """Load the shard manifest, migrating a legacy single-file database if needed"""
+        manifest = {'format': 'sharded', 'partition': self.partition,
+                    'num_shards': self.num_shards, 'shards': {}}
+        
         if os.path.exists(self.db_file):
             try:
                 with open(self.db_file, 'r') as f:
-                    return json.load(f)
+                    data = json.load(f)
             except:
-                return {}
-        return {}
+                return manifest
+            
+            if data.get('format') == 'sharded':
+                # The stored layout wins over constructor defaults
+                self.partition = data.get('partition', self.partition)
+                self.num_shards = data.get('num_shards', self.num_shards)
+                return data
+            
+            self.manifest = manifest
+            self._migrate_legacy(data)
+            return self.manifest
+        
+        return manifest
+    
+    def _migrate_legacy(self, legacy_entries):
+        """Split a legacy flat {image_id: entry} database into shards"""
+        print(f"Migrating {len(legacy_entries)} entries into sharded database at {self.shard_dir}")
+        for image_id, data in legacy_entries.items():
+            entry = {key: value for key, value in data.items() if key != 'fingerprint'}
+            if os.path.exists(entry.get('path', '')):
+                sha256, entry['path'] = self.blobs.put(entry['path'])
+                entry['sha256'] = sha256
+                entry['thumbnail'] = self.blobs.thumbnail_path(sha256)
+            self._put_entry(image_id, entry, np.array(data['fingerprint']))
+        self.save_database()
     
     def save_database(self):
-        """Save the database to file"""
-        with open(self.db_file, 'w') as f:
-            json.dump(self.database, f, indent=2)
+        """Save modified shards and indexes, then the manifest, under the write lock"""
+        with self._writing(reload=False):
+            for shard_id in self._dirty_shards:
+                shard = self.shards[shard_id]
+                if len(shard):
+                    shard.save()
+                else:
+                    shard.delete_files()
+                    self.manifest['shards'].pop(shard_id, None)
+            self._dirty_shards.clear()
+            self.index.save()
+            self.tiles.save()
+            self.videos.save()
+            self.compressed.save()
+            # Last, so other processes only reload once everything above is on disk
+            atomic_write_json(self.db_file, self.manifest)
+            self._loaded_signature = self._manifest_signature()
+    
+    def rebuild_index(self):
+        """Rebuild the secondary indexes from the shards (one full scan)"""
+        print("Rebuilding metadata index...")
+        self.index.clear()
+        for shard_id in self.manifest['shards']:
+            for image_id, entry in self.get_shard(shard_id).entries.items():
+                self.index.add(image_id, entry, shard_id)
+        if not self.read_only:
+            self.index.save()
+    
+    def shard_id_for(self, image_id, owner):
+        """Pick the shard an entry belongs to under the configured partitioning"""
+        if self.partition == "hash":
+            return hash_shard_id(image_id, self.num_shards)
+        return owner_shard_id(owner)
+    
+    def preload(self):
+        """Load every shard (matrices memory-mapped), the tile, video and compressed indexes up front
+
+        Called before forking workers so they inherit one copy instead of
+        each reading the database again.
+        """
+        for shard_id in self.manifest['shards']:
+            shard = self.get_shard(shard_id)
+            shard.normalized_matrix()
+            for namespace in shard.namespaces:
+                shard.normalized_matrix(namespace)
+        self.tiles.load()
+        self.videos.load()
+        self.compressed.load()
+
+    def release_memory(self):
+        """Unload every shard without unsaved changes; they are re-read from disk on next use
+        
+        Writers mark a shard dirty before editing it (and before any model
+        pass, which may call this through the memory budget), so a shard
+        being edited is never dropped from under them.
+        """
+        for shard_id in [shard_id for shard_id in self.shards if shard_id not in self._dirty_shards]:
+            del self.shards[shard_id]
+    
+    def get_shard(self, shard_id):
+        """Return a shard handle; the shard itself is only read from disk on first use"""
+        if shard_id not in self.shards:
+            self.shards[shard_id] = FingerprintShard(self.shard_dir, shard_id)
+        return self.shards[shard_id]
+    
+    def _put_entry(self, image_id, entry, fingerprint, extra=None):
+        """Add an entry to its shard and update the manifest (caller saves)"""
+        self._put_entries([(image_id, entry, fingerprint, extra)])
+    
+    def _put_entries(self, items):
+        """Add many (image_id, entry, fingerprint[, {namespace: fingerprint}]) items, appending to each shard once"""
+        by_shard = {}
+        for item in items:
+            image_id, entry = item[:2]
+            by_shard.setdefault(self.shard_id_for(image_id, entry['owner']), []).append(item)
+        
+        for shard_id, shard_items in by_shard.items():
+            shard = self.get_shard(shard_id)
+            shard.add_many(shard_items)
+            info = self.manifest['shards'].setdefault(shard_id, {'count': 0, 'owners': []})
+            info['count'] = len(shard)
+            for image_id, entry in (item[:2] for item in shard_items):
+                self.index.add(image_id, entry, shard_id)
+                if entry['owner'] not in info['owners']:
+                    info['owners'].append(entry['owner'])
+            self._dirty_shards.add(shard_id)
+        
+        if self.compressed.fitted:
+            self.compressed.add([item[0] for item in items], np.stack([item[2] for item in items]))
+    
+    def _nearest_stored(self, units):
+        """Best cosine and matching image_id in the stored database for each unit-norm row"""
+        best_score = np.full(len(units), -np.inf, dtype=np.float32)
+        best_id = [None] * len(units)
+        for shard_id in self.manifest['shards']:
+            shard = self.get_shard(shard_id)
+            matrix = shard.normalized_matrix()
+            if matrix is None:
+                continue
+            scores = units @ matrix.T
+            rows = scores.argmax(axis=1)
+            for i, row in enumerate(rows):
+                if scores[i, row] > best_score[i]:
+                    best_score[i], best_id[i] = scores[i, row], shard.ids[row]
+        return best_score, best_id
+    
+    def _embed_namespaces(self, image_paths, batch_size=32):
+        """{namespace: fingerprint} for each image under every configured extra backbone"""
+        extras = [{} for _ in image_paths]
+        for backbone in self.namespaces:
+            fingerprints = get_fingerprinter(backbone).get_fingerprints(image_paths, batch_size)
+            for extra, fingerprint in zip(extras, fingerprints):
+                if fingerprint is not None:
+                    extra[backbone] = fingerprint
+        return extras
+    
+    @serialised_write
+    def add_namespace(self, backbone, batch_size=32):
+        """Start keeping fingerprints from another backbone, backfilling existing entries; returns the count embedded"""
+        backbone_spec(backbone)
+        self._check_embedding()
+        if backbone not in self.namespaces:
+            self.namespaces.append(backbone)
+        
+        embedded = 0
+        fingerprinter = get_fingerprinter(backbone)
+        for shard_id in self.manifest['shards']:
+            shard = self.get_shard(shard_id)
+            self._dirty_shards.add(shard_id)
+            missing = shard.missing_in_namespace(backbone)
+            for start in range(0, len(missing), batch_size):
+                batch = missing[start:start + batch_size]
+                fingerprints = fingerprinter.get_fingerprints(
+                    [self.reference_path(shard.entries[image_id]) for image_id in batch], batch_size)
+                vectors = {image_id: fingerprint for image_id, fingerprint in zip(batch, fingerprints)
+                           if fingerprint is not None}
+                shard.set_namespace_rows(backbone, vectors)
+                embedded += len(vectors)
+        self.save_database()
+        return embedded
+    
+    @property
+    def embedding_stale(self):
+        """True when stored fingerprints come from a different embedding than the current fingerprinter"""
+        return self.embedding != analyzer.fingerprinter.describe()
+    
+    def _check_embedding(self):
+        if self.embedding_stale:
+            raise ValueError(f"Database fingerprints are {self.embedding}, the fingerprinter produces "
+                             f"{analyzer.fingerprinter.describe()}; run migrate_embeddings() first")
     
-    def add_copyrighted_content(self, image_path, title, owner, description=""):
+    @serialised_write
+    def migrate_embeddings(self, batch_size=16, progress_callback=None):
+        """Re-embed every reference image and video with the current fingerprinter
+        
+        Rewrites the main and namespace fingerprint matrices, refreshes the
+        stored descriptors in the same pass and refits the compressed index
+        with its previous settings. Entries whose image can no longer be read
+        keep an all-zero row (they never match) until re-added. Progress goes
+        to progress_callback(fraction, message). Returns the number of images
+        re-embedded.
+        """
+        from video_analyzer import video_analyzer
+        
+        total = sum(info['count'] for info in self.manifest['shards'].values())
+        done, embedded = 0, 0
+        with analyzer.model_lock:
+            dim = analyzer.fingerprinter.dim
+        for shard_id in list(self.manifest['shards']):
+            shard = self.get_shard(shard_id)
+            self._dirty_shards.add(shard_id)
+            entries = [shard.entries[image_id] for image_id in shard.ids]
+            paths = [self.reference_path(entry) for entry in entries]
+            matrix = np.zeros((len(entries), dim), dtype=np.float32)
+            for start in range(0, len(entries), batch_size):
+                descriptor_batch = analyzer.extract_descriptors(paths[start:start + batch_size], batch_size)
+                for row, descriptors in enumerate(descriptor_batch, start):
+                    entry = entries[row]
+                    if descriptors is None:
+                        print(f"Could not re-embed {entry['image_id']}; it will not match until re-added")
+                        continue
+                    matrix[row] = descriptors['final']
+                    if entry.get('sha256'):
+                        self.store_descriptors(entry['sha256'], descriptors)
+                        entry['descriptor_version'] = analyzer.descriptor_version
+                    embedded += 1
+                done += len(descriptor_batch)
+                if progress_callback:
+                    progress_callback(done / max(total, 1) * 0.9, f"Re-embedded {done}/{total} images")
+            shard.replace_matrix(matrix)
+            
+            for backbone in self.namespaces:
+                fingerprinter = get_fingerprinter(backbone)
+                extra = np.zeros((len(entries), fingerprinter.dim), dtype=np.float32)
+                for row, fingerprint in enumerate(fingerprinter.get_fingerprints(paths, batch_size)):
+                    if fingerprint is not None:
+                        extra[row] = fingerprint
+                shard.replace_matrix(extra, backbone)
+        
+        self.videos.load()
+        videos = []
+        for number, video_id in enumerate(list(self.videos.video_ids)):
+            data = self.videos.videos[video_id]
+            if progress_callback:
+                progress_callback(0.9 + 0.1 * number / len(self.videos.video_ids), f"Re-embedding video {data['title']}")
+            path = self.blobs.path_for(data['sha256']) or data['path']
+            times, fingerprints, _ = video_analyzer.fingerprint_sequence(path, data.get('interval', 1.0))
+            if not len(times):
+                print(f"Could not re-embed video {video_id}; removing it from the video index")
+                continue
+            metadata = {key: value for key, value in data.items() if key != 'frames'}
+            videos.append((video_id, metadata, times, fingerprints))
+        if self.videos.video_ids:
+            self.videos.clear()
+            for video in videos:
+                self.videos.add(*video)
+        
+        self.manifest['embedding'] = self.embedding = analyzer.fingerprinter.describe()
+        if self.compressed.fitted and embedded:
+            self.compressed.fit(*self._all_fingerprints(), **self.compressed.settings())
+        self.save_database()
+        return embedded
+    
+    def _all_fingerprints(self):
+        """(image_ids, raw ResNet50 fingerprint matrix) across every shard"""
+        ids, blocks = [], []
+        for shard_id in self.manifest['shards']:
+            shard = self.get_shard(shard_id)
+            matrix = shard.namespace_matrix(None)
+            if matrix is not None and len(shard):
+                ids.extend(shard.ids)
+                blocks.append(matrix)
+        return ids, (np.vstack(blocks) if blocks else None)
+    
+    @serialised_write
+    def compress_fingerprints(self, dim=128, codec="int8", whiten=True, pq_subspaces=16):
+        """Fit a PCA projection (and int8/PQ codec) on the catalogue and build the compressed index
+        
+        codec is "float32", "int8" or "pq". Entries added later are encoded
+        with the fitted model; re-run this after large catalogue changes.
+        """
+        ids, matrix = self._all_fingerprints()
+        if matrix is None or len(ids) < 2:
+            print("Not enough fingerprints to fit a projection")
+            return None
+        self.compressed.fit(ids, matrix, dim, whiten, codec, pq_subspaces)
+        self.save_database()
+        print(f"Compressed {len(ids)} fingerprints to {self.compressed.projection.dim} dims ({codec}), "
+              f"{self.compressed.bytes_per_entry():.0f} bytes per entry")
+        return len(ids)
+    
+    @serialised_write
+    def drop_compression(self):
+        """Delete the compressed index; searches go back to the raw shard matrices"""
+        self.compressed.drop()
+        self.save_database()
+    
+    def compression_report(self, sample=200, k=10, seed=0):
+        """Recall@k, memory and speed of the compressed index against exact raw-vector search
+        
+        Queries are stored fingerprints with a little Gaussian noise, so the
+        exact top-k is a real neighbourhood rather than just the entry itself.
+        """
+        if not self.compressed.fitted:
+            return None
+        ids, matrix = self._all_fingerprints()
+        rng = np.random.RandomState(seed)
+        rows = rng.choice(len(ids), min(sample, len(ids)), replace=False)
+        queries = matrix[rows] / np.linalg.norm(matrix[rows], axis=1, keepdims=True)
+        queries = queries + rng.normal(0, 0.005, queries.shape).astype(np.float32)
+        return recall_report(ids, matrix, self.compressed, queries, k)
+    
+    def reference_path(self, entry):
+        """Local path of an entry's reference image, preferring the blob store copy"""
+        if entry.get('sha256'):
+            blob_path = self.blobs.path_for(entry['sha256'])
+            if blob_path is not None:
+                return blob_path
+        return entry['path']
+    
+    def store_descriptors(self, sha256, descriptors):
+        """Persist an entry's multi-layer descriptors under the current model version"""
+        save_descriptors(self.blobs.descriptor_path(sha256, analyzer.descriptor_version),
+                         descriptors, analyzer.descriptor_version, self.descriptor_dtype)
+    
+    def get_reference_descriptors(self, entry):
+        """Stored descriptors for an entry, recomputed (and re-stored) if missing or stale"""
+        sha256 = entry.get('sha256')
+        if sha256:
+            descriptors = load_descriptors(self.blobs.descriptor_path(sha256, analyzer.descriptor_version),
+                                           analyzer.descriptor_version)
+            if descriptors is not None:
+                return descriptors
+        
+        print(f"Descriptors for {entry['image_id']} are missing or stale, recomputing")
+        descriptors = analyzer.extract_descriptors([self.reference_path(entry)])[0]
+        if descriptors is not None and sha256 and not self.read_only:
+            self.store_descriptors(sha256, descriptors)
+        return descriptors
+    
+    @serialised_write
+    def refresh_descriptors(self, batch_size=16):
+        """Recompute descriptors for every entry whose stored version is stale; returns the count"""
+        stale = []
+        for shard_id in self.manifest['shards']:
+            shard = self.get_shard(shard_id)
+            for image_id, entry in shard.entries.items():
+                if entry.get('sha256') and entry.get('descriptor_version') != analyzer.descriptor_version:
+                    stale.append((shard_id, entry))
+        # Before the model passes, so the shards holding these entries stay loaded
+        self._dirty_shards.update(shard_id for shard_id, _ in stale)
+        
+        for start in range(0, len(stale), batch_size):
+            batch = stale[start:start + batch_size]
+            descriptor_batch = analyzer.extract_descriptors([self.reference_path(entry) for _, entry in batch],
+                                                            batch_size)
+            for (_, entry), descriptors in zip(batch, descriptor_batch):
+                if descriptors is None:
+                    continue
+                self.store_descriptors(entry['sha256'], descriptors)
+                entry['descriptor_version'] = analyzer.descriptor_version
+        
+        if stale:
+            self.save_database()
+        return len(stale)
+    
+    @property
+    def database(self):
+        """Merged read-only view of every entry (loads all shards)"""
+        self.refresh()
+        merged = {}
+        for shard_id in self.manifest['shards']:
+            merged.update(self.get_shard(shard_id).entries)
+        return merged
+    
+    @serialised_write
+    def add_copyrighted_content(self, image_path, title, owner, description="", tags=None):
         """Add a copyrighted image to the database"""
         try:
-            # Generate fingerprint
-            fingerprint = analyzer.fingerprinter.get_fingerprint(image_path)
+            self._check_embedding()
+            # Fingerprint and multi-layer descriptors from a single forward pass
+            descriptors = analyzer.extract_descriptors([image_path], with_tiles=True)[0]
             
-            if fingerprint is not None:
+            if descriptors is not None:
+                fingerprint = descriptors['final']
                 image_id = f"{owner}_{title}_{os.path.basename(image_path)}"
+                self.tiles.add(image_id, descriptors.pop('tiles'))
+                
+                # Keep our own copy: callers often delete the upload right after
+                sha256, blob_path = self.blobs.put(image_path)
+                self.store_descriptors(sha256, descriptors)
                 
-                self.database[image_id] = {
+                extra = self._embed_namespaces([image_path])[0]
+                self._put_entry(image_id, {
                     'title': title,
                     'owner': owner,
                     'description': description,
-                    'fingerprint': fingerprint.tolist(),
-                    'path': image_path,
-                    'image_id': image_id
-                }
+                    'path': blob_path,
+                    'source_name': os.path.basename(image_path),
+                    'thumbnail': self.blobs.thumbnail_path(sha256),
+                    'image_id': image_id,
+                    'tags': list(tags or []),
+                    'added_at': time.time(),
+                    'sha256': sha256,
+                    'descriptor_version': analyzer.descriptor_version
+                }, fingerprint, extra)
                 
                 self.save_database()
                 return True
@@ -50,54 +540,462 @@ class CopyrightDatabase:
         
         return False
     
-    def search_similar_content(self, query_image_path, top_k=3):
-        """Search for similar content in the database and return top matches with full analysis"""
-        query_fp = analyzer.fingerprinter.get_fingerprint(query_image_path)
-        if query_fp is None:
-            return []
+    @serialised_write
+    def add_bulk_content(self, sources, owner, description="", tags=None, titles=None,
+                         batch_size=16, near_duplicate_threshold=0.98):
+        """Ingest many images at once with batched embedding and duplicate skipping
         
-        matches = []
+        sources is a directory or a list of image paths. Titles default to the
+        file stem. Exact duplicates (same file hash) and near duplicates (fingerprint
+        cosine >= near_duplicate_threshold against the database or this batch) are
+        skipped, and everything accepted is written in a single save.
+        """
+        self._check_embedding()
+        start_time = time.time()
+        
+        if isinstance(sources, str) and os.path.isdir(sources):
+            image_paths = sorted(os.path.join(sources, name) for name in os.listdir(sources)
+                                 if name.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            image_paths = list(sources)
+        titles = titles or [os.path.splitext(os.path.basename(path))[0] for path in image_paths]
         
-        # Compare against every image in database
-        for image_id, data in self.database.items():
-            db_fingerprint = np.array(data['fingerprint'])
+        report = {'total': len(image_paths), 'added': 0, 'skipped_exact': 0,
+                  'skipped_near': 0, 'failed': 0, 'embedded': 0, 'skipped': []}
+        
+        # Exact duplicates are dropped before paying for any forward pass
+        pending, seen_hashes = [], {}
+        for path, title in zip(image_paths, titles):
+            try:
+                sha256 = file_sha256(path)
+            except OSError as e:
+                print(f"Error reading {path}: {e}")
+                report['failed'] += 1
+                continue
+            duplicate_of = self.index.find_by_hash(sha256) or seen_hashes.get(sha256)
+            if duplicate_of is not None:
+                report['skipped_exact'] += 1
+                report['skipped'].append({'path': path, 'reason': 'exact', 'duplicate_of': duplicate_of})
+                continue
+            seen_hashes[sha256] = path
+            pending.append((path, title, sha256))
+        
+        accepted = np.zeros((0, 0), dtype=np.float32)   # unit-norm fingerprints accepted in this run
+        new_entries = []
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            descriptor_batch = analyzer.extract_descriptors([item[0] for item in batch], batch_size,
+                                                            with_tiles=True)
+            
+            rows = [i for i, descriptors in enumerate(descriptor_batch) if descriptors is not None]
+            report['failed'] += len(batch) - len(rows)
+            report['embedded'] += len(rows)
+            if not rows:
+                continue
+            
+            vectors = np.stack([descriptor_batch[i]['final'] for i in rows]).astype(np.float32)
+            units = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
             
-            # Calculate similarity
-            similarity = cosine_similarity([query_fp], [db_fingerprint])[0][0]
+            # Near duplicates against the stored database and earlier batches, one GEMM each
+            best_score, best_id = self._nearest_stored(units)
+            if len(accepted):
+                run_scores = units @ accepted.T
+                run_best = run_scores.max(axis=1)
+                for i in np.where(run_best > best_score)[0]:
+                    best_score[i] = run_best[i]
+                    best_id[i] = new_entries[int(run_scores[i].argmax())][0]
             
-            # Run full comprehensive analysis for top candidates
-            if similarity > 0.3:  # Only analyze reasonably similar images
-                full_analysis = analyzer.run_comprehensive_analysis(query_image_path, data['path'])
+            keep, kept_ids = [], []
+            for i, row in enumerate(rows):
+                path, title, sha256 = batch[row]
+                # Within-batch duplicates of images already kept from this batch
+                for j, kept_id in zip(keep, kept_ids):
+                    similarity = float(units[i] @ units[j])
+                    if similarity > best_score[i]:
+                        best_score[i], best_id[i] = similarity, kept_id
+                if best_score[i] >= near_duplicate_threshold:
+                    report['skipped_near'] += 1
+                    report['skipped'].append({'path': path, 'reason': 'near',
+                                              'duplicate_of': best_id[i],
+                                              'similarity': float(best_score[i])})
+                    continue
                 
-                matches.append({
+                image_id = f"{owner}_{title}_{os.path.basename(path)}"
+                _, blob_path = self.blobs.put(path, sha256)
+                self.tiles.add(image_id, descriptor_batch[row].pop('tiles'))
+                self.store_descriptors(sha256, descriptor_batch[row])
+                new_entries.append((image_id, {
+                    'title': title,
+                    'owner': owner,
+                    'description': description,
+                    'path': blob_path,
+                    'source_name': os.path.basename(path),
+                    'thumbnail': self.blobs.thumbnail_path(sha256),
                     'image_id': image_id,
-                    'similarity': float(similarity),
-                    'title': data['title'],
-                    'owner': data['owner'],
-                    'description': data['description'],
-                    'path': data['path'],
-                    'full_analysis': full_analysis
-                })
-        
-        # Sort by similarity and return top K
-        matches.sort(key=lambda x: x['similarity'], reverse=True)
-        return matches[:top_k]
-    
-    def batch_video_analysis(self, video_path, top_matches_per_frame=2):
-        """Analyze video against entire database"""
+                    'tags': list(tags or []),
+                    'added_at': time.time(),
+                    'sha256': sha256,
+                    'descriptor_version': analyzer.descriptor_version
+                }, vectors[i]))
+                keep.append(i)
+                kept_ids.append(image_id)
+            
+            if keep:
+                accepted = units[keep] if not len(accepted) else np.vstack([accepted, units[keep]])
+                if self.namespaces:
+                    # Cheap-backbone fingerprints only for the images actually kept
+                    extras = self._embed_namespaces([batch[rows[i]][0] for i in keep], batch_size)
+                    first = len(new_entries) - len(keep)
+                    new_entries[first:] = [item + (extra,) for item, extra in zip(new_entries[first:], extras)]
+        
+        # One commit for the whole batch
+        if new_entries:
+            self._put_entries(new_entries)
+            self.save_database()
+        report['added'] = len(new_entries)
+        
+        report['seconds'] = time.time() - start_time
+        # Embedding throughput counts only images that went through the model;
+        # inputs_per_sec also credits the cheap hash-skipped duplicates
+        report['images_per_sec'] = report['embedded'] / report['seconds'] if report['seconds'] > 0 else 0.0
+        report['inputs_per_sec'] = report['total'] / report['seconds'] if report['seconds'] > 0 else 0.0
+        print(f"Bulk ingest: {report['added']} added, {report['skipped_exact']} exact and "
+              f"{report['skipped_near']} near duplicates skipped, {report['embedded']} embedded at "
+              f"{report['images_per_sec']:.1f} images/sec ({report['inputs_per_sec']:.1f} inputs/sec overall)")
+        return report
+    
+    @serialised_write
+    def remove_content(self, image_id):
+        """Remove an entry from the shard that holds it"""
+        shard_id = self.index.shard_of(image_id)
+        if shard_id is None or not self.get_shard(shard_id).remove(image_id):
+            return False
+        
+        sha256 = self.index.records[image_id].get('sha256')
+        self.index.remove(image_id)
+        self.tiles.remove(image_id)
+        self.compressed.remove(image_id)
+        if sha256 and not any(record.get('sha256') == sha256 for record in self.index.records.values()):
+            self.blobs.delete(sha256)
+        shard = self.get_shard(shard_id)
+        info = self.manifest['shards'][shard_id]
+        info['count'] = len(shard)
+        info['owners'] = sorted(shard.owners())
+        self._dirty_shards.add(shard_id)
+        self.save_database()
+        return True
+    
+    @serialised_write
+    def clear_database(self):
+        """Delete every shard"""
+        for shard_id in list(self.manifest['shards']):
+            self.get_shard(shard_id).delete_files()
+        self.shards = {}
+        self._dirty_shards.clear()
+        self.manifest['shards'] = {}
+        self.index.clear()
+        self.tiles.clear()
+        self.videos.clear()
+        self.compressed.clear()
+        self.blobs.garbage_collect(set())
+        self.save_database()
+    
+    def shards_for_owners(self, owners=None):
+        """Shard ids that can contain content from the given owners (all shards if None)"""
+        if owners is None:
+            return list(self.manifest['shards'])
+        owners = set(owners)
+        return [shard_id for shard_id, info in self.manifest['shards'].items()
+                if owners.intersection(info['owners'])]
+    
+    def _get_process_pool(self):
+        if self._process_pool is None:
+            self._process_pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._process_pool
+    
+    def search_candidates(self, query_fp, top_k=3, min_similarity=None, owners=None,
+                          added_after=None, added_before=None, tags=None, text=None, namespace=None):
+        """Fan a fingerprint query out over the relevant shards and merge the top-k
+        
+        Metadata filters are resolved against the secondary indexes first, so
+        only matching rows (and only shards holding them) are scored. namespace
+        picks the backbone whose fingerprints are searched (None = ResNet50).
+        Once compress_fingerprints has run, ResNet50 queries are scored
+        against the compressed index instead of the shards, and the best
+        hits rescored exactly, so scores are always raw cosines.
+        """
+        self._check_embedding()
+        if namespace is None and self.compressed_search and self.compressed.fitted:
+            return self._search_compressed(query_fp, top_k, min_similarity,
+                                           self.index.filter(owners, added_after, added_before, tags, text))
+        
+        other_filters = (added_after, added_before, tags, text)
+        if self.partition == "owner" and all(f is None for f in other_filters):
+            # Owner partitions already are the owner filter
+            shard_ids = {shard_id: None for shard_id in self.shards_for_owners(owners)}
+        else:
+            candidate_ids = self.index.filter(owners, added_after, added_before, tags, text)
+            if candidate_ids is None:
+                shard_ids = {shard_id: None for shard_id in self.manifest['shards']}
+            else:
+                shard_ids = {}
+                for image_id in candidate_ids:
+                    shard_ids.setdefault(self.index.shard_of(image_id), set()).add(image_id)
+        
+        if not shard_ids:
+            return []
+        
+        query_unit = np.asarray(query_fp, dtype=np.float32)
+        query_unit = query_unit / max(np.linalg.norm(query_unit), 1e-12)
+        
+        if self.executor == "process" and len(shard_ids) > 1:
+            pool = self._get_process_pool()
+            futures = [pool.submit(search_shard_file, self.shard_dir, shard_id, query_unit,
+                                   top_k, ids, min_similarity, namespace)
+                       for shard_id, ids in shard_ids.items()]
+            shard_results = [future.result() for future in futures]
+        else:
+            def search_shard(item):
+                shard_id, ids = item
+                results = self.get_shard(shard_id).search(query_unit, top_k, ids, min_similarity, namespace)
+                return [(score, image_id, shard_id) for score, image_id in results]
+            
+            if len(shard_ids) == 1:
+                shard_results = [search_shard(next(iter(shard_ids.items())))]
+            else:
+                # numpy releases the GIL for the matrix products, so threads scale here
+                with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                    shard_results = list(pool.map(search_shard, shard_ids.items()))
+        
+        return heapq.nlargest(top_k, (hit for hits in shard_results for hit in hits),
+                              key=lambda hit: hit[0])
+    
+    def _search_compressed(self, query_fp, top_k, min_similarity, candidate_ids):
+        """Brute-force search over the compressed codes, then exact cosines for the best top_k * rerank_factor
+        
+        Compressed scores live in the whitened PCA space (and are quantised),
+        so they only choose which hits get rescored: min_similarity and the
+        returned scores are exact cosines, as without compression.
+        """
+        hits = self.compressed.search(query_fp, top_k * max(self.rerank_factor, 1), candidate_ids)
+        query_unit = np.asarray(query_fp, dtype=np.float32)
+        query_unit = query_unit / max(np.linalg.norm(query_unit), 1e-12)
+        rescored = []
+        for _, image_id in hits:
+            shard = self.get_shard(self.index.shard_of(image_id))
+            rescored.append((float(shard.normalized_matrix()[shard.row_of(image_id)] @ query_unit), image_id))
+        hits = heapq.nlargest(top_k, rescored, key=lambda hit: hit[0])
+        
+        return [(score, image_id, self.index.shard_of(image_id)) for score, image_id in hits
+                if min_similarity is None or score > min_similarity]
+    
+    def search_similar_content(self, query_image_path, top_k=3, owners=None, min_similarity=0.3,
+                               added_after=None, added_before=None, tags=None, text=None,
+                               query_descriptors=None, cascade_backbone=None, uncertain_band=(0.5, 0.9),
+                               early_exit=False, tta=None):
+        """Search for similar content in the database and return top matches with full analysis
+        
+        The query gets one forward pass; database entries use their stored
+        descriptors, so re-ranking runs no model passes on the reference side.
+        With early_exit, each candidate starts from its stored fingerprint and
+        only loads its descriptors if that leaves the risk level open.
+        With tta (a view count or augmentation names, see
+        fingerprint.tta_views) the query is embedded as several augmented
+        views in one forward pass; each candidate keeps its best-scoring view,
+        which is also the view its full analysis uses (match['tta_view']).
+        With cascade_backbone (a namespace of this database) candidates come
+        from the cheap backbone and only those below the uncertain band skip
+        the ResNet50 analysis; see AdvancedAnalyzer.run_cascade_analysis. It
+        cannot be combined with tta or early_exit (ValueError).
+        """
+        self.refresh()
+        if cascade_backbone is not None:
+            if early_exit or len(tta_views(tta)) > 1:
+                raise ValueError("tta and early_exit are not supported with cascade_backbone")
+            return self._search_cascade(query_image_path, cascade_backbone, uncertain_band, top_k, owners,
+                                        min_similarity, added_after, added_before, tags, text, query_descriptors)
+        
+        views = tta_views(tta)
+        if query_descriptors is None or (len(views) > 1 and 'views' not in query_descriptors):
+            query_descriptors = analyzer.extract_descriptors(
+                [query_image_path], augmentations=views if len(views) > 1 else None)[0]
+        if query_descriptors is None:
+            return []
+        
+        matches = []
+        if len(views) > 1:
+            candidates, candidate_views = self._search_views(query_descriptors['views'], views, top_k, min_similarity,
+                                                             owners, added_after, added_before, tags, text)
+        else:
+            candidates = self.search_candidates(query_descriptors['final'], top_k, min_similarity, owners,
+                                                added_after, added_before, tags, text)
+            candidate_views = [None] * len(candidates)
+        view_descriptors = lambda view: query_descriptors if view is None else query_descriptors['views'][view]
+        
+        # Only the top-k candidates by fingerprint similarity get the full analysis,
+        # scored together from their stored descriptors
+        entries = [self.get_shard(shard_id).entries[image_id] for _, image_id, shard_id in candidates]
+        if early_exit:
+            analyses = []
+            for (_, image_id, shard_id), data, view in zip(candidates, entries, candidate_views):
+                shard = self.get_shard(shard_id)
+                analyses.append(analyzer.run_comprehensive_analysis(
+                    query_image_path, self.reference_path(data),
+                    reference_descriptors=lambda data=data: self.get_reference_descriptors(data),
+                    query_descriptors=view_descriptors(view), early_exit=True,
+                    reference_fingerprint=shard.namespace_matrix(None)[shard.row_of(image_id)]))
+        else:
+            # One batch per query view
+            analyses = [None] * len(candidates)
+            groups = {}
+            for position, view in enumerate(candidate_views):
+                groups.setdefault(view, []).append(position)
+            for view, positions in groups.items():
+                references = [self.get_reference_descriptors(entries[position]) for position in positions]
+                for position, analysis in zip(positions, analyzer.run_batch_analysis(view_descriptors(view),
+                                                                                     references)):
+                    analyses[position] = analysis
+        for (similarity, image_id, shard_id), data, full_analysis, view in zip(candidates, entries, analyses,
+                                                                                candidate_views):
+            reference_path = self.reference_path(data)
+            matches.append({
+                'image_id': image_id,
+                'similarity': float(similarity),
+                'title': data['title'],
+                'owner': data['owner'],
+                'description': data['description'],
+                'path': reference_path,
+                'thumbnail': data.get('thumbnail'),
+                'full_analysis': full_analysis
+            })
+            if view is not None:
+                matches[-1]['tta_view'] = view
+        
+        return matches
+    
+    def _search_views(self, view_descriptors, views, top_k, min_similarity, owners, added_after, added_before,
+                      tags, text):
+        """Top-k over several query views, each entry scored by its best view (max-pooled similarity)
+        
+        Returns (candidates, views) with candidates as from search_candidates
+        and the name of the view each one matched best.
+        """
+        best = {}
+        for view in views:
+            for similarity, image_id, shard_id in self.search_candidates(
+                    view_descriptors[view]['final'], top_k, min_similarity, owners,
+                    added_after, added_before, tags, text):
+                if image_id not in best or similarity > best[image_id][0][0]:
+                    best[image_id] = ((similarity, image_id, shard_id), view)
+        ranked = heapq.nlargest(top_k, best.values(), key=lambda item: item[0][0])
+        return [candidate for candidate, _ in ranked], [view for _, view in ranked]
+    
+    def _search_cascade(self, query_image_path, backbone, uncertain_band, top_k, owners, min_similarity,
+                        added_after, added_before, tags, text, query_descriptors):
+        if backbone not in self.namespaces:
+            raise ValueError(f"{backbone} fingerprints are not stored; call add_namespace('{backbone}') first")
+        query_embedding = get_fingerprinter(backbone).get_fingerprint(query_image_path)
+        if query_embedding is None:
+            return []
+        
+        matches = []
+        candidates = self.search_candidates(query_embedding, top_k, min_similarity, owners,
+                                            added_after, added_before, tags, text, namespace=backbone)
+        for similarity, image_id, shard_id in candidates:
+            shard = self.get_shard(shard_id)
+            data = shard.entries[image_id]
+            reference_path = self.reference_path(data)
+            reference_descriptors = None
+            if analyzer.cascade_stage(similarity, uncertain_band) != "reject":
+                # Descriptors are only needed (and the query only described once) past triage
+                if query_descriptors is None:
+                    query_descriptors = analyzer.extract_descriptors([query_image_path])[0]
+                reference_descriptors = self.get_reference_descriptors(data)
+            full_analysis = analyzer.run_cascade_analysis(
+                query_image_path, reference_path, backbone, uncertain_band,
+                query_embedding=query_embedding,
+                reference_embedding=shard.namespace_matrix(backbone)[shard.row_of(image_id)],
+                reference_descriptors=reference_descriptors, query_descriptors=query_descriptors)
+            
+            matches.append({
+                'image_id': image_id,
+                'similarity': float(similarity),
+                'title': data['title'],
+                'owner': data['owner'],
+                'description': data['description'],
+                'path': reference_path,
+                'thumbnail': data.get('thumbnail'),
+                'full_analysis': full_analysis
+            })
+        return matches
+    
+    def search_partial_matches(self, query_image_path, top_k=3, min_similarity=0.8, min_votes=3,
+                               query_descriptors=None):
+        """Detect crops, letterboxed or collaged copies of database entries via tile voting
+        
+        Uses the query's layer3 tiles from a single forward pass; no crops are
+        re-embedded. Matches carry the agreeing query/reference regions.
+        """
+        if query_descriptors is None or 'tiles' not in query_descriptors:
+            query_descriptors = analyzer.extract_descriptors([query_image_path], with_tiles=True)[0]
+        if query_descriptors is None:
+            return []
+        
+        self.refresh()
+        matches = []
+        for match in self.tiles.search(query_descriptors['tiles'], top_k, min_similarity, min_votes):
+            shard_id = self.index.shard_of(match['image_id'])
+            if shard_id is None:
+                continue
+            data = self.get_shard(shard_id).entries[match['image_id']]
+            match.update({
+                'title': data['title'],
+                'owner': data['owner'],
+                'path': self.reference_path(data),
+                'thumbnail': data.get('thumbnail')
+            })
+            matches.append(match)
+        return matches
+    
+    @serialised_write
+    def rebuild_tile_index(self, batch_size=16):
+        """Recompute tile descriptors for every entry (e.g. for databases created before tiles)"""
+        self.tiles.clear()
+        entries = [entry for entry in self.database.values()]
+        for start in range(0, len(entries), batch_size):
+            batch = entries[start:start + batch_size]
+            descriptor_batch = analyzer.extract_descriptors([self.reference_path(entry) for entry in batch],
+                                                            batch_size, with_tiles=True)
+            for entry, descriptors in zip(batch, descriptor_batch):
+                if descriptors is not None:
+                    self.tiles.add(entry['image_id'], descriptors['tiles'])
+        self.save_database()
+        return len(self.tiles.entry_ids)
+    
+    def batch_video_analysis(self, video_path, top_matches_per_frame=2, filters=None, frames_dir=None,
+                             progress_callback=None):
+        """Analyze video against entire database (optionally restricted by metadata filters)
+        
+        Progress goes to progress_callback(fraction, message) when given (background
+        jobs), otherwise to a Streamlit progress bar.
+        """
         from video_analyzer import video_analyzer
         
-        keyframes = video_analyzer.extract_keyframes(video_path)
+        keyframes = video_analyzer.extract_keyframes(video_path, output_dir=frames_dir)
         all_frame_results = []
         
-        progress_bar = st.progress(0)
+        progress_bar = st.progress(0) if progress_callback is None else None
         
         for i, frame in enumerate(keyframes):
             progress = (i + 1) / len(keyframes)
-            progress_bar.progress(progress)
+            if progress_bar is not None:
+                progress_bar.progress(progress)
+            else:
+                progress_callback(progress, f"Scanning frame {i + 1}/{len(keyframes)}")
             
             # Search database for this frame
-            frame_matches = self.search_similar_content(frame['path'], top_k=top_matches_per_frame)
+            frame_matches = self.search_similar_content(frame['path'], top_k=top_matches_per_frame,
+                                                        **(filters or {}))
             
             all_frame_results.append({
                 'frame_info': frame,
@@ -105,14 +1003,100 @@ class CopyrightDatabase:
                 'best_match': frame_matches[0] if frame_matches else None
             })
         
-        progress_bar.empty()
+        if progress_bar is not None:
+            progress_bar.empty()
         return all_frame_results
     
+    @serialised_write
+    def add_reference_video(self, video_path, title, owner, description="", tags=None, interval=1.0,
+                            progress_callback=None):
+        """Add a reference video as a per-interval fingerprint sequence; returns the video id or None"""
+        from video_analyzer import video_analyzer
+        
+        self._check_embedding()
+        times, fingerprints, first_frame = video_analyzer.fingerprint_sequence(
+            video_path, interval, progress_callback=progress_callback)
+        if not len(times):
+            print(f"No frames could be read from {video_path}")
+            return None
+        
+        sha256, blob_path = self.blobs.put(video_path, thumbnail=False)
+        self.blobs.save_thumbnail(sha256, first_frame)
+        
+        video_id = f"{owner}_{title}_{os.path.basename(video_path)}"
+        self.videos.add(video_id, {
+            'title': title,
+            'owner': owner,
+            'description': description,
+            'path': blob_path,
+            'source_name': os.path.basename(video_path),
+            'thumbnail': self.blobs.thumbnail_path(sha256),
+            'video_id': video_id,
+            'tags': list(tags or []),
+            'added_at': time.time(),
+            'sha256': sha256,
+            'interval': interval,
+            'duration': float(times[-1] + interval)
+        }, times, fingerprints)
+        self.save_database()
+        return video_id
+    
+    @serialised_write
+    def remove_video(self, video_id):
+        """Remove a reference video and, if nothing else uses it, its blob"""
+        self.videos.load()
+        data = self.videos.videos.get(video_id)
+        if data is None or not self.videos.remove(video_id):
+            return False
+        if not any(other.get('sha256') == data['sha256'] for other in self.videos.videos.values()):
+            self.blobs.delete(data['sha256'])
+        self.save_database()
+        return True
+    
+    def search_video_segments(self, video_path, interval=1.0, top_k=5, min_similarity=0.85, min_frames=3,
+                              progress_callback=None):
+        """Align a suspect video against the reference videos
+        
+        Returns matched segments (query span, reference span and offset in
+        seconds) with the reference title/owner attached, best first.
+        """
+        from video_analyzer import video_analyzer
+        
+        self.refresh()
+        if not len(self.videos):
+            return []
+        self._check_embedding()
+        times, fingerprints, _ = video_analyzer.fingerprint_sequence(video_path, interval,
+                                                                     progress_callback=progress_callback)
+        if not len(times):
+            return []
+        
+        segments = self.videos.search(times, fingerprints, interval, top_k, min_similarity, min_frames)
+        for segment in segments:
+            data = self.videos.videos[segment['video_id']]
+            segment.update({'title': data['title'], 'owner': data['owner'],
+                            'path': data['path'], 'thumbnail': data.get('thumbnail')})
+        if self.videos.dirty and not self.read_only:
+            # Persist a freshly trained coarse quantizer; if the index changed on
+            # disk meanwhile, the reload drops it and a later search retrains
+            with self._writing():
+                if self.videos.dirty:
+                    self.save_database()
+        return segments
+    
     def get_database_stats(self):
         """Get database statistics"""
+        self.refresh()
         return {
-            'total_images': len(self.database),
-            'owners': list(set(item['owner'] for item in self.database.values()))
+            'total_images': len(self.index.records),
+            'total_videos': len(self.videos),
+            'owners': self.index.owners(),
+            'tags': self.index.tags(),
+            'shards': len(self.manifest['shards']),
+            'namespaces': list(self.namespaces),
+            'embedding': self.embedding,
+            'compressed': (f"{self.compressed.projection.dim}d {self.compressed.codec.name}"
+                           if self.compressed.fitted else None)
         }
 
 # Global instance
@@ -0,0 +1,145 @@
+import bisect
+import json
+import os
+import re
+from shards import atomic_write_json
+
+
+def tokenize(text):
+    """Lower-case alphanumeric tokens used by the full-text index"""
+    return re.findall(r'[a-z0-9]+', (text or "").lower())
+
+
+class MetadataIndex:
+    """Secondary indexes over database entries: owner, ingestion time, tags and title/description text"""
+
+    def __init__(self, index_file):
+        self.index_file = index_file
+        self.records = {}      # image_id -> {'shard', 'owner', 'added_at', 'tags', 'terms'}
+        self.by_owner = {}     # owner -> set of image_ids
+        self.by_tag = {}       # tag -> set of image_ids
+        self.by_term = {}      # token -> set of image_ids
+        self.by_time = []      # sorted (added_at, image_id)
+        self.by_hash = {}      # content sha256 -> set of image_ids
+
+    def load(self):
+        """Load the index file; returns False if it is missing or unreadable"""
+        if not os.path.exists(self.index_file):
+            return False
+        try:
+            with open(self.index_file, 'r') as f:
+                records = json.load(f)
+        except Exception as e:
+            print(f"Error loading metadata index: {e}")
+            return False
+
+        self.clear()
+        for image_id, record in records.items():
+            self._link(image_id, record)
+        self.by_time.sort()
+        return True
+
+    def save(self):
+        atomic_write_json(self.index_file, self.records)
+
+    def clear(self):
+        self.records, self.by_owner, self.by_tag, self.by_term, self.by_time = {}, {}, {}, {}, []
+        self.by_hash = {}
+
+    def _link(self, image_id, record, keep_sorted=False):
+        self.records[image_id] = record
+        self.by_owner.setdefault(record['owner'], set()).add(image_id)
+        for tag in record.get('tags', []):
+            self.by_tag.setdefault(tag, set()).add(image_id)
+        for term in record.get('terms', []):
+            self.by_term.setdefault(term, set()).add(image_id)
+        if record.get('sha256'):
+            self.by_hash.setdefault(record['sha256'], set()).add(image_id)
+        if keep_sorted:
+            bisect.insort(self.by_time, (record['added_at'], image_id))
+        else:
+            self.by_time.append((record.get('added_at', 0.0), image_id))
+
+    @staticmethod
+    def _unlink_from(mapping, key, image_id):
+        ids = mapping.get(key)
+        if ids is not None:
+            ids.discard(image_id)
+            if not ids:
+                del mapping[key]
+
+    def add(self, image_id, entry, shard_id):
+        """Index an entry (replacing any previous record for the same id)"""
+        if image_id in self.records:
+            self.remove(image_id)
+
+        tags = sorted(set(tag.strip().lower() for tag in entry.get('tags', []) if tag.strip()))
+        record = {
+            'shard': shard_id,
+            'owner': entry['owner'],
+            'added_at': entry.get('added_at', 0.0),
+            'tags': tags,
+            'terms': sorted(set(tokenize(entry.get('title')) + tokenize(entry.get('description')))),
+            'sha256': entry.get('sha256')
+        }
+        self._link(image_id, record, keep_sorted=True)
+
+    def remove(self, image_id):
+        record = self.records.pop(image_id, None)
+        if record is None:
+            return
+        self._unlink_from(self.by_owner, record['owner'], image_id)
+        for tag in record['tags']:
+            self._unlink_from(self.by_tag, tag, image_id)
+        for term in record['terms']:
+            self._unlink_from(self.by_term, term, image_id)
+        if record.get('sha256'):
+            self._unlink_from(self.by_hash, record['sha256'], image_id)
+        position = bisect.bisect_left(self.by_time, (record['added_at'], image_id))
+        if position < len(self.by_time) and self.by_time[position][1] == image_id:
+            del self.by_time[position]
+
+    def shard_of(self, image_id):
+        record = self.records.get(image_id)
+        return record['shard'] if record else None
+
+    def find_by_hash(self, sha256):
+        """image_id of an entry with identical file content, if any (the smallest, when there are several)"""
+        ids = self.by_hash.get(sha256)
+        return min(ids) if ids else None
+
+    def owners(self):
+        return sorted(self.by_owner)
+
+    def tags(self):
+        return sorted(self.by_tag)
+
+    def filter(self, owners=None, added_after=None, added_before=None, tags=None, text=None):
+        """Return the set of image_ids matching every given filter, or None if no filter was given"""
+        candidate_sets = []
+
+        if owners is not None:
+            candidate_sets.append(set().union(*(self.by_owner.get(owner, set()) for owner in owners)))
+
+        if added_after is not None or added_before is not None:
+            low = 0 if added_after is None else bisect.bisect_left(self.by_time, (added_after, ''))
+            high = len(self.by_time) if added_before is None else bisect.bisect_left(self.by_time, (added_before, ''))
+            candidate_sets.append(set(image_id for _, image_id in self.by_time[low:high]))
+
+        for tag in tags or []:
+            candidate_sets.append(self.by_tag.get(tag.strip().lower(), set()))
+
+        for term in tokenize(text):
+            candidate_sets.append(self.by_term.get(term, set()))
+
+        if not candidate_sets:
+            return None
+
+        # Intersect smallest-first so the work is bounded by the most selective filter
+        candidate_sets.sort(key=len)
+        result = set(candidate_sets[0])
+        for ids in candidate_sets[1:]:
+            result &= ids
+            if not result:
+                break
+        return result
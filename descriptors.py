@@ -0,0 +1,71 @@
+import os
+import numpy as np
+
+# Adaptive-average-pool grid per ResNet stage; keeps coarse spatial layout
+# while shrinking layer1 from 802,816 to 16,384 values
+DESCRIPTOR_GRIDS = {'layer1': 8, 'layer2': 4, 'layer3': 4, 'layer4': 2}
+
+DESCRIPTOR_DTYPES = ('float32', 'float16', 'int8')
+
+
+def pack_descriptors(descriptors, dtype="float16"):
+    """Convert {layer: float vector} into arrays ready for np.savez
+
+    int8 uses symmetric per-layer scaling; the scale is stored as '<layer>__scale'.
+    """
+    if dtype not in DESCRIPTOR_DTYPES:
+        raise ValueError(f"Unsupported descriptor dtype: {dtype}")
+
+    packed = {}
+    for name, vector in descriptors.items():
+        vector = np.asarray(vector, dtype=np.float32)
+        if dtype == "int8":
+            scale = max(float(np.abs(vector).max()), 1e-12) / 127.0
+            packed[name] = np.round(vector / scale).astype(np.int8)
+            packed[f"{name}__scale"] = np.float32(scale)
+        else:
+            packed[name] = vector.astype(dtype)
+    return packed
+
+
+def unpack_descriptors(packed):
+    """Inverse of pack_descriptors; always returns float32 vectors"""
+    descriptors = {}
+    for name in packed:
+        if name.endswith("__scale") or name.startswith("__"):
+            continue
+        vector = np.asarray(packed[name]).astype(np.float32)
+        if f"{name}__scale" in packed:
+            vector *= float(packed[f"{name}__scale"])
+        descriptors[name] = vector
+    return descriptors
+
+
+def save_descriptors(path, descriptors, version, dtype="float16"):
+    """Write descriptors to an .npz tagged with the model/transform version"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(tmp_path, __version__=np.array(version), **pack_descriptors(descriptors, dtype))
+    os.replace(tmp_path, path)
+
+
+def load_descriptors(path, version):
+    """Load descriptors, returning None if missing, unreadable or from another version"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            if str(data['__version__']) != version:
+                return None
+            return unpack_descriptors({name: data[name] for name in data.files})
+    except Exception as e:
+        print(f"Error loading descriptors {path}: {e}")
+        return None
+
+
+def cosine(a, b):
+    """Cosine similarity of two 1-D vectors"""
+    denominator = np.linalg.norm(a) * np.linalg.norm(b)
+    if denominator == 0:
+        return 0.0
+    return float(np.dot(a, b) / denominator)
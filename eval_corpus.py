@@ -0,0 +1,241 @@
+import io
+import json
+import os
+import random
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageEnhance, ImageFilter, ImageOps
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+CORPUS_VERSION = 1
+
+
+def _crop(image, rng):
+    """Random crop keeping 55-85% of each side"""
+    keep = rng.uniform(0.55, 0.85)
+    width, height = int(image.width * keep), int(image.height * keep)
+    left, top = rng.randint(0, image.width - width), rng.randint(0, image.height - height)
+    return image.crop((left, top, left + width, top + height))
+
+
+def _recompress(image, rng):
+    """Downscale and re-encode at a low JPEG quality, twice"""
+    for _ in range(2):
+        scale = rng.uniform(0.4, 0.8)
+        image = image.resize((max(int(image.width * scale), 32), max(int(image.height * scale), 32)), Image.BILINEAR)
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=rng.randint(10, 35))
+        image = Image.open(io.BytesIO(buffer.getvalue())).convert('RGB')
+    return image
+
+
+def _colour_jitter(image, rng):
+    """Brightness, contrast, saturation and a hue rotation"""
+    image = ImageEnhance.Brightness(image).enhance(rng.uniform(0.6, 1.4))
+    image = ImageEnhance.Contrast(image).enhance(rng.uniform(0.6, 1.4))
+    image = ImageEnhance.Color(image).enhance(rng.uniform(0.3, 1.8))
+    hue, saturation, value = image.convert('HSV').split()
+    hue = hue.point(lambda level, shift=rng.randint(0, 255): (level + shift) % 256)
+    return Image.merge('HSV', (hue, saturation, value)).convert('RGB')
+
+
+def _style_posterize(image, rng):
+    return ImageOps.posterize(image.filter(ImageFilter.SMOOTH_MORE), rng.choice([2, 3]))
+
+
+def _style_sketch(image, rng):
+    edges = ImageOps.invert(ImageOps.grayscale(image).filter(ImageFilter.FIND_EDGES))
+    return ImageOps.autocontrast(edges).convert('RGB')
+
+
+def _style_painting(image, rng):
+    painted = image.filter(ImageFilter.ModeFilter(rng.choice([5, 7]))).filter(ImageFilter.EDGE_ENHANCE_MORE)
+    return ImageEnhance.Color(painted).enhance(1.5)
+
+
+# Edits applied to a reference to make a labelled copy; style_* approximate
+# style transfer with plain filters
+TRANSFORMS = {
+    "crop": _crop,
+    "recompress": _recompress,
+    "flip": lambda image, rng: ImageOps.mirror(image),
+    "colour_jitter": _colour_jitter,
+    "style_posterize": _style_posterize,
+    "style_sketch": _style_sketch,
+    "style_painting": _style_painting,
+}
+
+
+def apply_transform(image, name, rng):
+    return TRANSFORMS[name](image.convert('RGB'), rng)
+
+
+def synthetic_seeds(output_dir, count, seed=0, size=(480, 360)):
+    """Write count procedurally drawn seed images (gradient plus random shapes); returns their paths"""
+    rng = np.random.RandomState(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for i in range(count):
+        start, end = rng.randint(0, 255, 3), rng.randint(0, 255, 3)
+        ramp = np.linspace(0, 1, size[0])[None, :, None]
+        background = (start + (end - start) * ramp).repeat(size[1], axis=0).astype(np.uint8)
+        image = Image.fromarray(background)
+        draw = ImageDraw.Draw(image)
+        for _ in range(rng.randint(4, 12)):
+            x0, y0 = rng.randint(0, size[0]), rng.randint(0, size[1])
+            x1, y1 = x0 + rng.randint(20, size[0] // 2), y0 + rng.randint(20, size[1] // 2)
+            fill = tuple(int(v) for v in rng.randint(0, 255, 3))
+            shape = rng.randint(3)
+            if shape == 0:
+                draw.rectangle((x0, y0, x1, y1), fill=fill)
+            elif shape == 1:
+                draw.ellipse((x0, y0, x1, y1), fill=fill)
+            else:
+                draw.line((x0, y0, x1, y1), fill=fill, width=int(rng.randint(3, 15)))
+        path = os.path.join(output_dir, f"seed_{i:05d}.jpg")
+        image.save(path, quality=92)
+        paths.append(path)
+    return paths
+
+
+def _write_video(path, frames, fps, size):
+    import cv2
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    try:
+        for frame in frames:
+            writer.write(cv2.cvtColor(np.asarray(frame.convert('RGB').resize(size, Image.BILINEAR)),
+                                      cv2.COLOR_RGB2BGR))
+    finally:
+        writer.release()
+
+
+def _pan(image, seconds, fps, rng):
+    """Slow zoom-and-pan over a still, as slideshow videos do"""
+    frames = []
+    steps = max(int(seconds * fps), 1)
+    zoom_from, zoom_to = rng.uniform(0.85, 1.0), rng.uniform(0.75, 0.95)
+    for step in range(steps):
+        keep = zoom_from + (zoom_to - zoom_from) * step / steps
+        width, height = int(image.width * keep), int(image.height * keep)
+        left = int((image.width - width) * step / steps)
+        top = int((image.height - height) / 2)
+        frames.append(image.crop((left, top, left + width, top + height)))
+    return frames
+
+
+def make_video(path, references, backgrounds, rng, duration=20.0, fps=10, size=(320, 240), inserts=2):
+    """A slideshow of background stills with transformed references shown for a few seconds each
+
+    Returns the ground-truth segments [{start, end, reference, transform}].
+    """
+    plan = ['background'] * max(int(duration // 4) - inserts, 1) + ['insert'] * inserts
+    rng.shuffle(plan)
+    frames, segments, time_seconds = [], [], 0.0
+    for kind in plan:
+        seconds = rng.uniform(2.0, 4.0)
+        if kind == 'insert':
+            reference = rng.choice(references)
+            transform = rng.choice(["crop", "colour_jitter", "recompress", "flip"])
+            image = apply_transform(Image.open(reference), transform, rng)
+            segments.append({'start': time_seconds, 'end': time_seconds + seconds,
+                              'reference': os.path.basename(reference), 'transform': transform})
+        else:
+            image = apply_transform(Image.open(rng.choice(backgrounds)), rng.choice(list(TRANSFORMS)), rng)
+        frames.extend(_pan(image, seconds, fps, rng))
+        time_seconds += seconds
+    _write_video(path, frames, fps, size)
+    return segments
+
+
+def build_corpus(seed_paths, output_dir, references=100, positives_per_reference=3, negatives=100,
+                 transforms=None, videos=0, video_duration=20.0, seed=0):
+    """Derive a labelled evaluation corpus from seed images
+
+    The first `references` seeds become database references and each gets
+    positives_per_reference edited copies (one TRANSFORMS edit each). The
+    remaining seeds are held out: `negatives` queries are edited versions
+    of them, so positives and negatives carry the same artefacts. Videos
+    are slideshows of held-out stills with inserted, edited references.
+    Writes references/, queries/, videos/ and labels.json (paths relative
+    to output_dir) and returns the labels.
+    """
+    rng = random.Random(seed)
+    transforms = list(transforms or TRANSFORMS)
+    seed_paths = sorted(seed_paths)
+    rng.shuffle(seed_paths)
+    if len(seed_paths) < references + 1:
+        raise ValueError(f"Need more than {references} seed images (got {len(seed_paths)})")
+    reference_seeds, held_out = seed_paths[:references], seed_paths[references:]
+
+    for name in ("references", "queries", "videos"):
+        os.makedirs(os.path.join(output_dir, name), exist_ok=True)
+    labels = {'version': CORPUS_VERSION, 'seed': seed, 'transforms': transforms,
+              'references': [], 'queries': [], 'videos': []}
+
+    reference_paths = []
+    for i, source in enumerate(reference_seeds):
+        name = f"ref_{i:05d}.jpg"
+        Image.open(source).convert('RGB').save(os.path.join(output_dir, "references", name), quality=95)
+        reference_paths.append(os.path.join(output_dir, "references", name))
+        labels['references'].append({'path': os.path.join("references", name), 'source': source})
+        for j in range(positives_per_reference):
+            transform = transforms[(i * positives_per_reference + j) % len(transforms)]
+            query = os.path.join("queries", f"pos_{i:05d}_{j}_{transform}.jpg")
+            apply_transform(Image.open(source), transform, rng).save(os.path.join(output_dir, query), quality=90)
+            labels['queries'].append({'path': query, 'reference': name, 'transform': transform})
+
+    for i in range(negatives):
+        source = held_out[i % len(held_out)]
+        transform = rng.choice(transforms)
+        query = os.path.join("queries", f"neg_{i:05d}_{transform}.jpg")
+        apply_transform(Image.open(source), transform, rng).save(os.path.join(output_dir, query), quality=90)
+        labels['queries'].append({'path': query, 'reference': None, 'transform': transform})
+
+    for i in range(videos):
+        video = os.path.join("videos", f"video_{i:03d}.mp4")
+        segments = make_video(os.path.join(output_dir, video), reference_paths, held_out, rng, video_duration)
+        labels['videos'].append({'path': video, 'duration': video_duration, 'segments': segments})
+
+    with open(os.path.join(output_dir, "labels.json"), 'w') as f:
+        json.dump(labels, f, indent=1)
+    return labels
+
+
+def load_corpus(corpus_dir):
+    """labels.json of a corpus with every path made absolute"""
+    with open(os.path.join(corpus_dir, "labels.json")) as f:
+        labels = json.load(f)
+    for item in labels['references'] + labels['queries'] + labels['videos']:
+        item['path'] = os.path.join(corpus_dir, item['path'])
+    return labels
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate a labelled copy-detection corpus from seed images")
+    parser.add_argument("output_dir")
+    parser.add_argument("--seeds", help="directory of seed images (default: procedurally drawn ones)")
+    parser.add_argument("--synthetic", type=int, default=300, help="seed images to draw when --seeds is not given")
+    parser.add_argument("--references", type=int, default=100)
+    parser.add_argument("--positives", type=int, default=3, help="edited copies per reference")
+    parser.add_argument("--negatives", type=int, default=100)
+    parser.add_argument("--transforms", help=f"comma-separated subset of {','.join(TRANSFORMS)}")
+    parser.add_argument("--videos", type=int, default=0)
+    parser.add_argument("--video-duration", type=float, default=20.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.seeds:
+        seeds = [os.path.join(args.seeds, name) for name in os.listdir(args.seeds)
+                 if name.lower().endswith(IMAGE_EXTENSIONS)]
+    else:
+        seeds = synthetic_seeds(os.path.join(args.output_dir, "seeds"), args.synthetic, args.seed)
+    labels = build_corpus(seeds, args.output_dir, args.references, args.positives, args.negatives,
+                          args.transforms.split(",") if args.transforms else None,
+                          args.videos, args.video_duration, args.seed)
+    positives = sum(query['reference'] is not None for query in labels['queries'])
+    print(f"✅ {len(labels['references'])} references, {positives} positive and "
+          f"{len(labels['queries']) - positives} negative queries, {len(labels['videos'])} videos "
+          f"in {args.output_dir}")
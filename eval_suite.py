@@ -0,0 +1,259 @@
+import contextlib
+import io
+import json
+import os
+import time
+
+import numpy as np
+from sklearn.metrics import roc_auc_score
+
+from eval_corpus import load_corpus
+
+# Engine configurations under test: search_similar_content keyword arguments,
+# plus 'compression' (dim, codec) for a compressed fingerprint index
+ENGINE_CONFIGS = {
+    "baseline": {},
+    "early-exit": {'early_exit': True},
+    "tta-2": {'tta': 2},
+    "tta-4": {'tta': 4},
+    "cascade": {'cascade_backbone': "mobilenet_v3_small"},
+    "int8-128": {'compression': (128, "int8")},
+    "pq-128": {'compression': (128, "pq")},
+}
+# Largest accuracy drops still counted as "free" (absolute, on a 0-1 scale)
+DEFAULT_TOLERANCE = {'auc': 0.01, 'recall_at_k': 0.01, 'video_recall': 0.02}
+
+
+def build_database(corpus, db_file, namespaces=None):
+    """Ingest the corpus references into a CopyrightDatabase at db_file (reused if already built)
+
+    Near-duplicate skipping is off so every reference is stored. Returns
+    (db, {reference file name: image_id}).
+    """
+    from copyright_db import CopyrightDatabase
+
+    db = CopyrightDatabase(db_file, partition="hash", namespaces=namespaces)
+    if not db.database:
+        db.add_bulk_content([reference['path'] for reference in corpus['references']], owner="eval",
+                            near_duplicate_threshold=1.01)
+    return db, {entry['source_name']: image_id for image_id, entry in db.database.items()}
+
+
+def _detection_scores(matches, expected_id):
+    """(copy score, rank of the true reference) for one query's matches
+
+    A positive scores its true reference's weighted score (0 when it was
+    not retrieved, or rejected by cascade triage without a score); a
+    negative scores its best match, since any match is a false alarm.
+    """
+    if expected_id is None:
+        return max((match['full_analysis']['weighted_score'] or 0.0 for match in matches), default=0.0), None
+    for rank, match in enumerate(matches, 1):
+        if match['image_id'] == expected_id:
+            return match['full_analysis']['weighted_score'] or 0.0, rank
+    return 0.0, None
+
+
+def _summary(labels, scores, ranks, thresholds):
+    labels, scores = np.asarray(labels, dtype=bool), np.asarray(scores, dtype=np.float64)
+    positives = max(int(labels.sum()), 1)
+    summary = {
+        'auc': float(roc_auc_score(labels, scores)) if 0 < labels.sum() < len(labels) else None,
+        'recall_at_1': sum(rank == 1 for rank in ranks) / positives,
+        'recall_at_k': sum(rank is not None for rank in ranks) / positives,
+    }
+    # Operating points at the score model's MEDIUM and HIGH thresholds
+    for name, threshold in zip(("medium", "high"), thresholds):
+        summary[f'tpr_{name}'] = float((scores[labels] >= threshold).mean()) if labels.any() else None
+        summary[f'fpr_{name}'] = float((scores[~labels] >= threshold).mean()) if (~labels).any() else None
+    return summary
+
+
+def evaluate_images(db, corpus, ids, search_kwargs, top_k=5):
+    """ROC AUC, recall@1/@k, TPR/FPR at the risk thresholds and images/sec over the corpus queries"""
+    from scoring import score_model
+
+    queries = corpus['queries']
+    # Warm-up so model loading and first shard reads are not timed
+    with contextlib.redirect_stdout(io.StringIO()):
+        db.search_similar_content(queries[0]['path'], top_k=top_k, min_similarity=None, **search_kwargs)
+
+    labels, scores, ranks, by_transform = [], [], [], {}
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for query in queries:
+            matches = db.search_similar_content(query['path'], top_k=top_k, min_similarity=None, **search_kwargs)
+            expected_id = ids.get(query['reference']) if query['reference'] else None
+            score, rank = _detection_scores(matches, expected_id)
+            labels.append(expected_id is not None)
+            scores.append(score)
+            if expected_id is not None:
+                ranks.append(rank)
+                by_transform.setdefault(query['transform'], []).append(rank is not None)
+    seconds = time.time() - start
+
+    report = _summary(labels, scores, ranks, score_model.thresholds)
+    report['images_per_sec'] = len(queries) / seconds if seconds > 0 else 0.0
+    report['recall_by_transform'] = {name: sum(hits) / len(hits) for name, hits in sorted(by_transform.items())}
+    return report
+
+
+def evaluate_videos(db, corpus, ids, search_kwargs, top_k=5, interval=1.0):
+    """Per-frame recall inside the labelled insert segments, false alarms outside them, and frames/sec
+
+    A frame counts as a hit when the inserted reference is among its top_k
+    matches with a MEDIUM/HIGH risk, and as a false alarm when a frame
+    outside every segment has any MEDIUM/HIGH match.
+    """
+    from video_analyzer import video_analyzer
+
+    hits, inside, alarms, outside, frames_seen, seconds = 0, 0, 0, 0, 0, 0.0
+    for video in corpus['videos']:
+        frames = list(video_analyzer.sample_frames(video['path'], interval))
+        start = time.time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for time_seconds, frame in frames:
+                matches = db.search_similar_content(frame, top_k=top_k, min_similarity=None, **search_kwargs)
+                flagged = [match['image_id'] for match in matches if match['full_analysis']['risk_level'] != 'LOW']
+                expected = [ids.get(segment['reference']) for segment in video['segments']
+                            if segment['start'] <= time_seconds < segment['end']]
+                if expected:
+                    inside += 1
+                    hits += any(image_id in flagged for image_id in expected)
+                else:
+                    outside += 1
+                    alarms += bool(flagged)
+        seconds += time.time() - start
+        frames_seen += len(frames)
+    return {
+        'video_recall': hits / inside if inside else None,
+        'video_false_alarms': alarms / outside if outside else None,
+        'frames_per_sec': frames_seen / seconds if seconds > 0 else 0.0
+    }
+
+
+@contextlib.contextmanager
+def engine(db, config):
+    """Prepare db for one engine configuration and yield its search keyword arguments"""
+    search_kwargs = dict(config)
+    compression = search_kwargs.pop('compression', None)
+    backbone = search_kwargs.get('cascade_backbone')
+    if backbone is not None and backbone not in db.namespaces:
+        db.add_namespace(backbone)
+    if compression is not None:
+        db.compress_fingerprints(dim=compression[0], codec=compression[1])
+    try:
+        yield search_kwargs
+    finally:
+        if compression is not None:
+            db.drop_compression()
+
+
+def run_suite(corpus_dir, db_file=None, configs=None, top_k=5, videos=True):
+    """Evaluate every engine configuration on one corpus; returns {config: report}
+
+    Each report carries its accuracy metrics and throughput, plus the
+    speedup and accuracy deltas against the "baseline" configuration and
+    whether the speedup came for free (no metric dropped by more than
+    DEFAULT_TOLERANCE).
+    """
+    corpus = load_corpus(corpus_dir)
+    db, ids = build_database(corpus, db_file or os.path.join(corpus_dir, "eval_db", "db.json"))
+    configs = configs or list(ENGINE_CONFIGS)
+    if "baseline" in configs:
+        configs = ["baseline"] + [name for name in configs if name != "baseline"]
+
+    reports = {}
+    for name in configs:
+        print(f"Evaluating {name}...")
+        with engine(db, ENGINE_CONFIGS[name]) as search_kwargs:
+            report = evaluate_images(db, corpus, ids, search_kwargs, top_k)
+            if videos and corpus['videos']:
+                report.update(evaluate_videos(db, corpus, ids, search_kwargs, top_k))
+        report['config'] = ENGINE_CONFIGS[name]
+        reports[name] = report
+
+    if "baseline" in reports:
+        for report in reports.values():
+            report.update(compare(reports["baseline"], report))
+    return reports
+
+
+def compare(reference, report, tolerance=None):
+    """Speedup and accuracy deltas of report against reference, and the metrics that regressed"""
+    tolerance = tolerance or DEFAULT_TOLERANCE
+    deltas = {metric: report[metric] - reference[metric] for metric in tolerance
+              if report.get(metric) is not None and reference.get(metric) is not None}
+    regressions = [metric for metric, delta in deltas.items() if delta < -tolerance[metric]]
+    return {
+        'speedup': report['images_per_sec'] / reference['images_per_sec'] if reference['images_per_sec'] else None,
+        'deltas': deltas,
+        'regressions': regressions,
+        'free': not regressions
+    }
+
+
+def check_against_baseline(reports, baseline, tolerance=None, max_slowdown=0.25):
+    """Regressions of this run against a saved run: {config: [messages]}, empty when everything holds"""
+    failures = {}
+    for name, report in reports.items():
+        if name not in baseline:
+            continue
+        comparison = compare(baseline[name], report, tolerance)
+        problems = [f"{metric} {comparison['deltas'][metric]:+.4f}" for metric in comparison['regressions']]
+        if baseline[name]['images_per_sec'] and \
+                report['images_per_sec'] < baseline[name]['images_per_sec'] * (1 - max_slowdown):
+            problems.append(f"images/sec {report['images_per_sec']:.1f} vs {baseline[name]['images_per_sec']:.1f}")
+        if problems:
+            failures[name] = problems
+    return failures
+
+
+def print_suite_report(reports):
+    print(f"{'config':<11} {'AUC':>6} {'R@1':>6} {'R@k':>6} {'TPR/FPR high':>13} {'img/s':>7} {'speedup':>8} "
+          f"{'video R/FA':>11}  verdict")
+    for name, report in reports.items():
+        auc = f"{report['auc']:.3f}" if report['auc'] is not None else "-"
+        operating = (f"{report['tpr_high']:.2f}/{report['fpr_high']:.2f}"
+                     if report['tpr_high'] is not None and report['fpr_high'] is not None else "-")
+        video = (f"{report['video_recall']:.2f}/{report['video_false_alarms']:.2f}"
+                 if report.get('video_recall') is not None and report.get('video_false_alarms') is not None else "-")
+        speedup = f"{report['speedup']:.2f}x" if report.get('speedup') else "-"
+        verdict = ("" if name == "baseline" or 'free' not in report else
+                   "✅ no accuracy cost" if report['free'] else f"❌ costs {', '.join(report['regressions'])}")
+        print(f"{name:<11} {auc:>6} {report['recall_at_1']:>6.2f} {report['recall_at_k']:>6.2f} {operating:>13} "
+              f"{report['images_per_sec']:>7.1f} {speedup:>8} {video:>11}  {verdict}")
+    for name, report in reports.items():
+        print(f"{name}: " + ", ".join(f"{transform} {recall:.0%}"
+                                      for transform, recall in report['recall_by_transform'].items()))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Accuracy/throughput regression suite over a labelled corpus "
+                                                 "(build one with eval_corpus.py)")
+    parser.add_argument("corpus_dir")
+    parser.add_argument("--db", help="database manifest for the corpus references (default: CORPUS/eval_db/db.json)")
+    parser.add_argument("--configs", help=f"comma-separated subset of {','.join(ENGINE_CONFIGS)}")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--no-videos", action="store_true")
+    parser.add_argument("--output", help="write the reports as JSON (e.g. to use as a later --baseline)")
+    parser.add_argument("--baseline", help="earlier --output to check this run against; exits 1 on a regression")
+    parser.add_argument("--max-slowdown", type=float, default=0.25, help="allowed throughput drop vs --baseline")
+    args = parser.parse_args()
+
+    reports = run_suite(args.corpus_dir, args.db, args.configs.split(",") if args.configs else None,
+                        args.top_k, not args.no_videos)
+    print_suite_report(reports)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(reports, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = check_against_baseline(reports, json.load(f), max_slowdown=args.max_slowdown)
+        for name, problems in failures.items():
+            print(f"❌ {name} regressed: {'; '.join(problems)}")
+        if failures:
+            raise SystemExit(1)
+        print("✅ No regressions against the baseline run")
@@ -0,0 +1,480 @@
+import base64
+import hashlib
+import html
+import io
+import json
+import os
+import time
+import zipfile
+from PIL import Image, ImageDraw, ImageFont
+from blob_store import file_sha256
+from previews import preview_cache
+from scoring import RISK_LEVELS, score_model, format_metric, is_estimate
+
+EXPORT_FORMATS = ("zip", "html", "pdf")
+EVIDENCE_IMAGE_SIZE = (480, 480)
+RISK_COLOURS = {'LOW': '#06d6a0', 'MEDIUM': '#ffd166', 'HIGH': '#ff6b6b'}
+PAGE_SIZE = (1240, 1754)        # A4 at 150 dpi
+
+
+def evidence_items(job, min_risk="MEDIUM"):
+    """Matches worth reporting from a finished image or video scan job, in report order
+
+    Each item carries a label, the query image (the uploaded image or the
+    extracted video frame), the frame time for videos and the stored match
+    with its full analysis. Only matches at min_risk or above are kept.
+    """
+    floor = RISK_LEVELS.index(min_risk)
+    result = job['result'] or {}
+    items = []
+    if job['kind'] == "image_scan":
+        for rank, match in enumerate(result.get('matches', []), 1):
+            if RISK_LEVELS.index(match['full_analysis']['risk_level']) >= floor:
+                items.append({'label': f"Match {rank}", 'query_image': job['payload']['query_path'],
+                              'time': None, 'match': match})
+    elif job['kind'] == "video_scan":
+        for index, frame in enumerate(result.get('frames', []), 1):
+            for match in frame['top_matches'] or []:
+                if RISK_LEVELS.index(match['full_analysis']['risk_level']) >= floor:
+                    seconds = frame['frame_info']['time_seconds']
+                    items.append({'label': f"Frame {index} at {format_time(seconds)}",
+                                  'query_image': frame['frame_info']['path'], 'time': seconds, 'match': match})
+    else:
+        raise ValueError(f"Evidence export needs an image_scan or video_scan job, not {job['kind']}")
+    return items
+
+
+def format_time(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+def chart_specs(job, items):
+    """Plain-data chart specs built from the stored scores (no model or matplotlib involved)
+
+    Kinds: 'bars' (labels/values, optional score thresholds) and
+    'timeline' (times/values). Specs are written to the bundle as
+    charts.json and rendered as SVG in the HTML and drawn on PDF pages.
+    """
+    counts = {level: 0 for level in RISK_LEVELS}
+    for item in items:
+        counts[item['match']['full_analysis']['risk_level']] += 1
+    specs = {'risk_summary': {'kind': 'bars', 'title': "Reported matches by risk level",
+                              'labels': list(RISK_LEVELS), 'values': [counts[level] for level in RISK_LEVELS],
+                              'colours': [RISK_COLOURS[level] for level in RISK_LEVELS]}}
+    if job['kind'] == "video_scan":
+        frames = job['result'].get('frames', [])
+        values = [(frame['best_match']['full_analysis']['weighted_score'] or 0.0) if frame['best_match'] else 0.0
+                  for frame in frames]
+        specs['timeline'] = {'kind': 'timeline', 'title': "Best match score per frame",
+                             'times': [frame['frame_info']['time_seconds'] for frame in frames], 'values': values,
+                             'range': [0, max([1.0] + values)], 'thresholds': list(score_model.thresholds)}
+    for number, item in enumerate(items):
+        analysis = item['match']['full_analysis']
+        # Scores that were not computed (cascade rejects, early-exit skips) are left out; estimates are labelled
+        bars = [(label + (" (est.)" if is_estimate(analysis, key) else ""), analysis[key])
+                for label, key in (("Direct", 'direct_similarity'), ("Style", 'style_similarity'),
+                                   ("Content", 'content_similarity'), ("Weighted", 'weighted_score'))
+                if analysis[key] is not None]
+        if not bars:
+            continue
+        values = [value for _, value in bars]
+        specs[f"item_{number}"] = {'kind': 'bars', 'title': "Similarity scores",
+                                   'labels': [label for label, _ in bars], 'values': values,
+                                   'colours': [_score_colour(value) for value in values],
+                                   # Uncalibrated weighted scores can exceed 1
+                                   'range': [0, max([1.0] + values)],
+                                   'thresholds': list(score_model.thresholds)}
+    return specs
+
+
+def _score_colour(value):
+    low, high = score_model.thresholds
+    return RISK_COLOURS['HIGH' if value >= high else 'MEDIUM' if value >= low else 'LOW']
+
+
+def svg_chart(spec, width=420, height=150):
+    """Inline SVG for a chart spec"""
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+             f'font-family="sans-serif" font-size="11">',
+             f'<text x="4" y="13" font-weight="bold">{html.escape(spec["title"])}</text>']
+    top, bottom = 22, height - 6
+    if spec['kind'] == 'bars':
+        left, right = 70, width - 50
+        maximum = spec.get('range', [0, max(max(spec['values']), 1)])[1]
+        row = (bottom - top) / max(len(spec['values']), 1)
+        for i, (label, value, colour) in enumerate(zip(spec['labels'], spec['values'], spec['colours'])):
+            y = top + i * row
+            length = (right - left) * min(value / maximum, 1.0) if maximum else 0
+            shown = f"{value:.3f}" if isinstance(value, float) else str(value)
+            parts.append(f'<text x="4" y="{y + row * 0.65:.1f}">{html.escape(label)}</text>'
+                         f'<rect x="{left}" y="{y + row * 0.15:.1f}" width="{length:.1f}" height="{row * 0.7:.1f}" '
+                         f'fill="{colour}"/><text x="{left + length + 4:.1f}" y="{y + row * 0.65:.1f}">{shown}</text>')
+        for threshold in spec.get('thresholds', []):
+            x = left + (right - left) * threshold / maximum
+            parts.append(f'<line x1="{x:.1f}" y1="{top}" x2="{x:.1f}" y2="{bottom}" stroke="#999" '
+                         f'stroke-dasharray="3,3"/>')
+    else:
+        left, right, top, bottom = 30, width - 6, top + 6, bottom - 12
+        duration = max(spec['times'][-1], 1e-6) if spec['times'] else 1.0
+        maximum = spec['range'][1]
+        to_x = lambda t: left + (right - left) * t / duration
+        to_y = lambda v: bottom - (bottom - top) * min(max(v / maximum, 0.0), 1.0)
+        for threshold in spec.get('thresholds', []):
+            parts.append(f'<line x1="{left}" y1="{to_y(threshold):.1f}" x2="{right}" y2="{to_y(threshold):.1f}" '
+                         f'stroke="#999" stroke-dasharray="3,3"/>')
+        points = " ".join(f"{to_x(t):.1f},{to_y(v):.1f}" for t, v in zip(spec['times'], spec['values']))
+        parts.append(f'<polyline points="{points}" fill="none" stroke="#118ab2" stroke-width="1.5"/>'
+                     f'<text x="{left}" y="{height - 1}">0:00</text>'
+                     f'<text x="{right - 40}" y="{height - 1}">{format_time(duration)}</text>')
+    parts.append('</svg>')
+    return "".join(parts)
+
+
+def _image_source(path, thumbnail=None):
+    """Display-sized copy of an image for the report: the stored thumbnail if any, else a cached preview"""
+    if thumbnail and os.path.exists(thumbnail):
+        return thumbnail
+    if path and os.path.exists(path):
+        return preview_cache.get(path, EVIDENCE_IMAGE_SIZE)
+    return None
+
+
+def _summary_rows(job, items):
+    payload = job['payload']
+    source = payload.get('query_path') or payload.get('video_path')
+    try:
+        source_sha256 = file_sha256(source)
+    except (OSError, TypeError):
+        source_sha256 = "unavailable"
+    return [("Scan job", f"{job['id']} ({job['kind'].replace('_', ' ')})"),
+            ("Scanned file", os.path.basename(source or "")),
+            ("Scanned file SHA-256", source_sha256),
+            ("Scan finished", time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(job['finished_at'] or 0))),
+            ("Report generated", time.strftime("%Y-%m-%d %H:%M:%S")),
+            ("Score model", score_model.describe()),
+            ("Reported matches", str(len(items)))]
+
+
+def html_report(job, items, specs, image_src):
+    """Yield the report HTML in chunks; image_src(name, path) gives each <img> src"""
+    yield ("<!DOCTYPE html><html><head><meta charset='utf-8'><title>Copyscale evidence report</title><style>"
+           "body{font-family:sans-serif;margin:2em;color:#222}table{border-collapse:collapse}"
+           "td,th{border:1px solid #ccc;padding:3px 8px;text-align:left;vertical-align:top}"
+           ".item{page-break-inside:avoid;border-top:2px solid #333;margin-top:1.5em;padding-top:.5em}"
+           ".images img{max-width:360px;max-height:360px;margin-right:1em}"
+           "</style></head><body><h1>Copyscale evidence report</h1><table>")
+    for key, value in _summary_rows(job, items):
+        yield f"<tr><th>{html.escape(key)}</th><td>{html.escape(value)}</td></tr>"
+    yield "</table><p>" + svg_chart(specs['risk_summary'])
+    if 'timeline' in specs:
+        yield svg_chart(specs['timeline'], width=840)
+    yield "</p>"
+
+    for number, item in enumerate(items):
+        match, analysis = item['match'], item['match']['full_analysis']
+        yield f"<div class='item'><h2>{html.escape(item['label'])}: {html.escape(match['title'])}</h2><p class='images'>"
+        for name, caption in ((f"item_{number}_query", "Scanned frame" if item['time'] is not None else "Scanned image"),
+                              (f"item_{number}_reference", f"Reference: {match['title']}")):
+            src = image_src(name)
+            if src:
+                yield f"<img src='{src}' alt='{html.escape(caption)}' title='{html.escape(caption)}'>"
+        yield "</p><table>"
+        rows = [("Reference", f"{match['title']} by {match['owner']} ({match['image_id']})"),
+                ("Fingerprint similarity", f"{match['similarity']:.4f}"),
+                ("Weighted score", format_metric(analysis, 'weighted_score', ".4f")),
+                ("Risk level", analysis['risk_level']),
+                ("Direct / style / content", " / ".join(format_metric(analysis, key, ".4f") for key in
+                                                       ('direct_similarity', 'style_similarity', 'content_similarity')))]
+        if 'raw_similarities' in analysis:
+            rows.append(("Layer similarities", ", ".join(f"{layer} {value:.4f}"
+                                                         for layer, value in analysis['raw_similarities'].items())))
+        if match.get('tta_view', "identity") != "identity":
+            rows.append(("Matched view", match['tta_view']))
+        for key, value in rows:
+            yield f"<tr><th>{html.escape(key)}</th><td>{html.escape(value)}</td></tr>"
+        notes = "".join(f"<li>{html.escape(note)}</li>" for note in analysis.get('analysis_notes', []))
+        chart = svg_chart(specs[f"item_{number}"]) if f"item_{number}" in specs else ""
+        yield f"</table><p>{chart}</p><ul>{notes}</ul></div>"
+
+    segments = (job['result'] or {}).get('segments') or []
+    if segments:
+        yield "<h2>Matching reference video segments</h2><table><tr><th>Reference</th><th>Scanned</th><th>Reference span</th></tr>"
+        for segment in segments:
+            yield (f"<tr><td>{html.escape(segment['title'])} by {html.escape(segment['owner'])}</td>"
+                   f"<td>{format_time(segment['query_start'])}-{format_time(segment['query_end'])}</td>"
+                   f"<td>{format_time(segment['reference_start'])}-{format_time(segment['reference_end'])}</td></tr>")
+        yield "</table>"
+    partial = (job['result'] or {}).get('partial_matches') or []
+    if partial:
+        yield "<h2>Crops and partial copies</h2><table><tr><th>Reference</th><th>Region score</th><th>Agreeing tiles</th></tr>"
+        for match in partial:
+            yield (f"<tr><td>{html.escape(match['title'])} by {html.escape(match['owner'])}</td>"
+                   f"<td>{match['score']:.3f}</td><td>{match['votes']}</td></tr>")
+        yield "</table>"
+    yield "</body></html>"
+
+
+def _report_images(items):
+    """{name: display-sized image path} for every image the report shows"""
+    images = {}
+    for number, item in enumerate(items):
+        images[f"item_{number}_query"] = _image_source(item['query_image'])
+        images[f"item_{number}_reference"] = _image_source(item['match']['path'], item['match'].get('thumbnail'))
+    return {name: path for name, path in images.items() if path}
+
+
+class _HashingWriter:
+    """File-like wrapper that hashes what passes through it"""
+
+    def __init__(self, f):
+        self.f = f
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self.f.write(data)
+
+
+def _write_zip(path, job, items, specs, images, progress):
+    manifest = []
+    # One archive member per distinct image: a reference matched by many frames is stored once
+    sources = {source: f"images/{number:05d}.jpg" for number, source in enumerate(dict.fromkeys(images.values()))}
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as bundle:
+        for i, (source, arcname) in enumerate(sources.items()):
+            # JPEG previews are already compressed; store them as they are
+            bundle.write(source, arcname, compress_type=zipfile.ZIP_STORED)
+            manifest.append((file_sha256(source), arcname))
+            if i % 50 == 0:
+                progress(0.1 + 0.6 * i / max(len(sources), 1), f"Packing images ({i}/{len(sources)})")
+        progress(0.7, "Writing report")
+        for arcname, chunks in (("report.html", html_report(job, items, specs,
+                                                          lambda name: sources.get(images.get(name)))),
+                                ("results.json", [json.dumps(job, indent=1)]),
+                                ("charts.json", [json.dumps(specs, indent=1)])):
+            with bundle.open(arcname, 'w') as f:
+                writer = _HashingWriter(f)
+                for chunk in chunks:
+                    writer.write(chunk.encode('utf-8'))
+            manifest.append((writer.sha256.hexdigest(), arcname))
+        # Integrity manifest in sha256sum format, so recipients can verify every file
+        bundle.writestr("MANIFEST.sha256", "".join(f"{digest}  {arcname}\n" for digest, arcname in manifest))
+
+
+def _write_html(path, job, items, specs, images, progress):
+    def data_uri(name):
+        if name not in images:
+            return None
+        with open(images[name], 'rb') as f:
+            return "data:image/jpeg;base64," + base64.b64encode(f.read()).decode('ascii')
+
+    with open(path, 'w', encoding='utf-8') as f:
+        for i, chunk in enumerate(html_report(job, items, specs, data_uri)):
+            f.write(chunk)
+            if i % 200 == 0:
+                progress(0.1 + 0.8 * i / max(len(items) * 12, 1), "Writing report")
+
+
+class PdfWriter:
+    """Minimal PDF writer with one JPEG image per page, streamed to disk page by page
+
+    Each page is written as soon as it is added and only the object
+    offsets are kept, so memory does not grow with the page count.
+    """
+
+    def __init__(self, path, page_size=PAGE_SIZE, dpi=150):
+        self.f = open(path, 'wb')
+        self.page_size = page_size
+        self.points = (page_size[0] * 72 / dpi, page_size[1] * 72 / dpi)
+        self.offsets = {}
+        self.pages = []
+        self.next_id = 3            # 1 = catalog, 2 = page tree (both written on close)
+        self.f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _object(self, object_id, body, stream=None):
+        self.offsets[object_id] = self.f.tell()
+        self.f.write(f"{object_id} 0 obj\n".encode() + body)
+        if stream is not None:
+            self.f.write(b"\nstream\n" + stream + b"\nendstream")
+        self.f.write(b"\nendobj\n")
+
+    def add_page(self, image):
+        buffer = io.BytesIO()
+        image.convert('RGB').save(buffer, "JPEG", quality=85)
+        jpeg = buffer.getvalue()
+        image_id, content_id, page_id = self.next_id, self.next_id + 1, self.next_id + 2
+        self.next_id += 3
+        width, height = self.points
+        self._object(image_id, (f"<< /Type /XObject /Subtype /Image /Width {image.width} /Height {image.height} "
+                                f"/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /DCTDecode "
+                                f"/Length {len(jpeg)} >>").encode(), jpeg)
+        content = f"q {width:.2f} 0 0 {height:.2f} 0 0 cm /Im0 Do Q".encode()
+        self._object(content_id, f"<< /Length {len(content)} >>".encode(), content)
+        self._object(page_id, (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width:.2f} {height:.2f}] "
+                               f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> "
+                               f"/Contents {content_id} 0 R >>").encode())
+        self.pages.append(page_id)
+
+    def close(self):
+        kids = " ".join(f"{page_id} 0 R" for page_id in self.pages)
+        self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        self._object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>".encode())
+        xref = self.f.tell()
+        self.f.write(f"xref\n0 {self.next_id}\n0000000000 65535 f \n".encode())
+        for object_id in range(1, self.next_id):
+            self.f.write(f"{self.offsets[object_id]:010d} 00000 n \n".encode())
+        self.f.write(f"trailer\n<< /Size {self.next_id} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+        self.f.close()
+
+
+def _font(size):
+    """DejaVu Sans from the matplotlib install when available, else PIL's built-in font"""
+    try:
+        from matplotlib import font_manager
+        return ImageFont.truetype(font_manager.findfont("DejaVu Sans"), size)
+    except Exception:
+        try:
+            return ImageFont.load_default(size=size)
+        except TypeError:
+            return ImageFont.load_default()
+
+
+def _draw_chart(draw, spec, box, font):
+    """Draw a chart spec into box (left, top, right, bottom) on a PIL page"""
+    left, top, right, bottom = box
+    draw.text((left, top), spec['title'], fill="black", font=font)
+    top += 24
+    if spec['kind'] == 'bars':
+        label_width = 110
+        maximum = spec.get('range', [0, max(max(spec['values']), 1)])[1]
+        row = (bottom - top) / max(len(spec['values']), 1)
+        for i, (label, value, colour) in enumerate(zip(spec['labels'], spec['values'], spec['colours'])):
+            y = top + i * row
+            length = (right - left - label_width - 70) * min(value / maximum, 1.0) if maximum else 0
+            draw.text((left, y + row * 0.2), label, fill="black", font=font)
+            draw.rectangle((left + label_width, y + row * 0.15, left + label_width + length, y + row * 0.85), fill=colour)
+            draw.text((left + label_width + length + 6, y + row * 0.2),
+                      f"{value:.3f}" if isinstance(value, float) else str(value), fill="black", font=font)
+    else:
+        top += 12
+        duration = max(spec['times'][-1], 1e-6) if spec['times'] else 1.0
+        maximum = spec['range'][1]
+        to_xy = lambda t, v: (left + (right - left) * t / duration,
+                              bottom - (bottom - top) * min(max(v / maximum, 0.0), 1.0))
+        for threshold in spec.get('thresholds', []):
+            draw.line((left, to_xy(0, threshold)[1], right, to_xy(0, threshold)[1]), fill="#999999")
+        points = [to_xy(t, v) for t, v in zip(spec['times'], spec['values'])]
+        if len(points) > 1:
+            draw.line(points, fill="#118ab2", width=2)
+
+
+def _paste_image(page, path, box):
+    if path is None:
+        return
+    with Image.open(path) as image:
+        image = image.convert('RGB')
+        image.thumbnail((box[2] - box[0], box[3] - box[1]))
+        page.paste(image, (box[0], box[1]))
+
+
+def _write_pdf(path, job, items, specs, images, progress, per_page=3):
+    font, heading = _font(22), _font(34)
+    margin = 80
+    pdf = PdfWriter(path)
+    try:
+        page = Image.new('RGB', PAGE_SIZE, "white")
+        draw = ImageDraw.Draw(page)
+        draw.text((margin, margin), "Copyscale evidence report", fill="black", font=heading)
+        y = margin + 70
+        for key, value in _summary_rows(job, items):
+            draw.text((margin, y), f"{key}: {value}", fill="black", font=font)
+            y += 34
+        _draw_chart(draw, specs['risk_summary'], (margin, y + 30, PAGE_SIZE[0] - margin, y + 230), font)
+        if 'timeline' in specs:
+            _draw_chart(draw, specs['timeline'], (margin, y + 280, PAGE_SIZE[0] - margin, y + 560), font)
+        pdf.add_page(page)
+
+        slot = (PAGE_SIZE[1] - 2 * margin) // per_page
+        for start in range(0, len(items), per_page):
+            page = Image.new('RGB', PAGE_SIZE, "white")
+            draw = ImageDraw.Draw(page)
+            for offset, item in enumerate(items[start:start + per_page]):
+                number = start + offset
+                match, analysis = item['match'], item['match']['full_analysis']
+                top = margin + offset * slot
+                draw.text((margin, top), f"{item['label']}: {match['title']} by {match['owner']}",
+                          fill="black", font=font)
+                _paste_image(page, images.get(f"item_{number}_query"), (margin, top + 36, margin + 300, top + 336))
+                _paste_image(page, images.get(f"item_{number}_reference"),
+                             (margin + 320, top + 36, margin + 620, top + 336))
+                text_left = margin + 650
+                for line_number, line in enumerate((
+                        f"Risk: {analysis['risk_level']}",
+                        f"Weighted score: {format_metric(analysis, 'weighted_score', '.4f')}",
+                        f"Fingerprint similarity: {match['similarity']:.4f}",
+                        f"Reference id: {match['image_id']}")):
+                    draw.text((text_left, top + 40 + 30 * line_number), line, fill="black", font=font)
+                if f"item_{number}" in specs:
+                    _draw_chart(draw, specs[f"item_{number}"], (text_left, top + 170, PAGE_SIZE[0] - margin, top + 330),
+                                font)
+            pdf.add_page(page)
+            progress(0.1 + 0.85 * min(start + per_page, len(items)) / max(len(items), 1),
+                     f"Rendering PDF pages ({min(start + per_page, len(items))}/{len(items)} matches)")
+    finally:
+        pdf.close()
+
+
+def export_evidence(job, output_path, fmt="zip", min_risk="MEDIUM", progress=None):
+    """Build an evidence bundle for a finished scan job from its stored results
+
+    Nothing is re-analysed: scores, notes and frame times come from the job
+    record, images from the blob store thumbnails and the preview cache,
+    and charts from chart_specs. The bundle is streamed to
+    output_path + ".part" and renamed when complete. fmt is "zip" (HTML
+    report, images, results.json, charts.json and a SHA-256 manifest),
+    "html" (one self-contained file) or "pdf". Returns a summary.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt} (available: {', '.join(EXPORT_FORMATS)})")
+    progress = progress or (lambda fraction, message="": None)
+    progress(0.0, "Collecting matches")
+    items = evidence_items(job, min_risk)
+    specs = chart_specs(job, items)
+    progress(0.05, "Preparing images")
+    images = _report_images(items)
+
+    part_path = output_path + ".part"
+    writer = {'zip': _write_zip, 'html': _write_html, 'pdf': _write_pdf}[fmt]
+    try:
+        writer(part_path, job, items, specs, images, progress)
+        os.replace(part_path, output_path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    progress(1.0, "Evidence bundle written")
+    return {'path': output_path, 'format': fmt, 'matches': len(items),
+            'bytes': os.path.getsize(output_path), 'sha256': file_sha256(output_path)}
+
+
+if __name__ == "__main__":
+    import argparse
+    from job_queue import JobQueue
+
+    parser = argparse.ArgumentParser(description="Export an evidence bundle for a finished scan job")
+    parser.add_argument("job_id")
+    parser.add_argument("output")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="zip")
+    parser.add_argument("--min-risk", choices=RISK_LEVELS, default="MEDIUM")
+    parser.add_argument("--db", default="copyscale_jobs.sqlite3")
+    parser.add_argument("--jobs-dir", default="copyscale_jobs")
+    args = parser.parse_args()
+
+    job = JobQueue(args.db, args.jobs_dir).get(args.job_id)
+    if job is None or job['status'] != 'done':
+        raise SystemExit(f"❌ No finished job {args.job_id}")
+    start = time.time()
+    summary = export_evidence(job, args.output, args.format, args.min_risk,
+                              lambda fraction, message="": print(f"\r{fraction:4.0%} {message:<60}", end=""))
+    print(f"\n✅ {summary['matches']} matches, {summary['bytes'] / 1024:.0f} KB in {time.time() - start:.1f}s "
+          f"-> {summary['path']} (sha256 {summary['sha256'][:16]}…)")
@@ -1,31 +1,254 @@
 import torch
-import torchvision.models as models
-import torchvision.transforms as transforms
-from PIL import Image
+import torch.nn.functional as F
 import numpy as np
+from preprocess import FastPreprocessor
+from backbones import backbone_spec
+from memory_budget import memory_budget
+import threading
+
+# "logits" is the classifier output (the original fingerprint); the others pool
+# the last convolutional feature map into an L2-normalised retrieval embedding
+EMBEDDINGS = ("logits", "avg", "gem", "rmac")
+DEFAULT_EMBEDDING = "gem"
+
+class GeM(torch.nn.Module):
+    """Generalised-mean pooling: p=1 is average pooling, large p approaches max pooling"""
+    def __init__(self, p=3.0, eps=1e-6):
+        super().__init__()
+        self.p = p
+        self.eps = eps
+    
+    def forward(self, x):
+        return F.adaptive_avg_pool2d(x.clamp(min=self.eps).pow(self.p), 1).pow(1.0 / self.p)
+
+class RMAC(torch.nn.Module):
+    """Regional max pooling: L2-normalised max-pooled square regions at a few scales, summed"""
+    def __init__(self, levels=3):
+        super().__init__()
+        self.levels = levels
+    
+    def forward(self, x):
+        height, width = x.shape[-2:]
+        total = F.normalize(F.adaptive_max_pool2d(x, 1).flatten(1), dim=1)
+        for level in range(2, self.levels + 1):
+            # level regions across the shorter side, ~40% overlap along the longer one
+            size = max(1, int(2 * min(height, width) / (level + 1)))
+            for top in np.linspace(0, height - size, level if height <= width else level + 1).astype(int):
+                for left in np.linspace(0, width - size, level + 1 if height <= width else level).astype(int):
+                    region = x[..., top:top + size, left:left + size]
+                    total = total + F.normalize(F.adaptive_max_pool2d(region, 1).flatten(1), dim=1)
+        return total.view(*total.shape, 1, 1)
+
+class L2Normalize(torch.nn.Module):
+    def forward(self, x):
+        return F.normalize(x.flatten(1), dim=1)
+
+def make_pooling(embedding, gem_p=3.0):
+    if embedding == "avg":
+        return torch.nn.AdaptiveAvgPool2d(1)
+    if embedding == "gem":
+        return GeM(gem_p)
+    if embedding == "rmac":
+        return RMAC()
+    raise ValueError(f"Unknown embedding: {embedding} (available: {', '.join(EMBEDDINGS)})")
+
+def _zoom(images, fraction=0.8):
+    """Centre crop to fraction of each side, resized back"""
+    height, width = images.shape[-2:]
+    top, left = int(height * (1 - fraction) / 2), int(width * (1 - fraction) / 2)
+    crop = images[..., top:height - top, left:width - left]
+    return F.interpolate(crop, size=(height, width), mode="bilinear", align_corners=False)
+
+def _downscale(images, factor=0.5):
+    """Downscale and upscale back, as a low-resolution re-encode would"""
+    height, width = images.shape[-2:]
+    small = F.interpolate(images, scale_factor=factor, mode="bilinear", align_corners=False, antialias=True)
+    return F.interpolate(small, size=(height, width), mode="bilinear", align_corners=False)
+
+def _autocontrast(images):
+    """Stretch each channel to the full range, undoing most brightness/contrast shifts"""
+    low = images.amin(dim=(-2, -1), keepdim=True)
+    high = images.amax(dim=(-2, -1), keepdim=True)
+    return (images - low) / (high - low).clamp(min=1e-6)
+
+# Test-time augmentations on a batch of un-normalised [0, 1] crops; each
+# undoes (or mimics) an edit that common copies carry
+TTA_AUGMENTATIONS = {
+    "identity": lambda images: images,
+    "hflip": lambda images: images.flip(-1),
+    "grayscale": lambda images: (images * torch.tensor([0.299, 0.587, 0.114]).view(1, 3, 1, 1))
+                                .sum(dim=1, keepdim=True).expand_as(images),
+    "zoom": _zoom,
+    "downscale": _downscale,
+    "autocontrast": _autocontrast,
+}
+DEFAULT_TTA = ("identity", "hflip", "grayscale", "zoom", "downscale", "autocontrast")
+
+def tta_views(spec):
+    """Augmentation names from a TTA setting: K (the first K of DEFAULT_TTA), "hflip,grayscale" or a list
+    
+    The unaugmented view always comes first, so descriptors of view 0 are
+    the ordinary single-view ones. None, 0 and 1 mean no TTA.
+    """
+    if spec is None or spec is False:
+        return ("identity",)
+    if isinstance(spec, int):
+        if spec < 0 or spec > len(DEFAULT_TTA):
+            raise ValueError(f"TTA view count must be between 1 and {len(DEFAULT_TTA)}")
+        return DEFAULT_TTA[:max(spec, 1)]
+    names = [name.strip() for name in spec.split(",")] if isinstance(spec, str) else list(spec)
+    unknown = [name for name in names if name not in TTA_AUGMENTATIONS]
+    if unknown:
+        raise ValueError(f"Unknown augmentation: {', '.join(unknown)} (available: {', '.join(TTA_AUGMENTATIONS)})")
+    return ("identity",) + tuple(dict.fromkeys(name for name in names if name and name != "identity"))
+
+def make_views(batch, augmentations, mean, std):
+    """Stack len(augmentations) views of every image in a normalised batch, image-major
+    
+    Row i * K + k of the result is view k of image i, so one forward pass
+    embeds all of them.
+    """
+    mean = torch.tensor(mean, dtype=batch.dtype).view(1, 3, 1, 1)
+    std = torch.tensor(std, dtype=batch.dtype).view(1, 3, 1, 1)
+    images = batch * std + mean
+    views = [(TTA_AUGMENTATIONS[name](images).clamp(0, 1) - mean) / std for name in augmentations]
+    return torch.stack(views, dim=1).flatten(0, 1)
 
 class ImageFingerprinter:
-    def __init__(self):
-        # Use modern weights syntax instead of deprecated 'pretrained=True'
-        self.model = models.resnet50(weights=models.ResNet50_Weights.DEFAULT)
+    def __init__(self, backbone="resnet50", embedding=DEFAULT_EMBEDDING, gem_p=3.0):
+        # Any registered torchvision backbone; fingerprints from different
+        # backbones live in separate database namespaces
+        spec = backbone_spec(backbone)
+        self.backbone = backbone
+        self.cost = spec['cost']
+        self.embedding = embedding
+        self.gem_p = gem_p
+        self.model = spec['builder'](weights=spec['weights'])
+        if embedding != "logits":
+            # Swap the pooling and classifier head so model(batch) returns the
+            # embedding; the layer1-layer4 stages (and hooks on them) are unchanged
+            self.model.avgpool = make_pooling(embedding, gem_p)
+            if hasattr(self.model, 'fc'):
+                self.model.fc = L2Normalize()
+            else:
+                self.model.classifier = L2Normalize()
         self.model.eval()
+        self._dim = None
+        # Every forward pass holds this lock: hooks registered for one caller's
+        # pass (AdvancedAnalyzer.extract_descriptors) would fire on another's
+        self.model_lock = threading.RLock()
         
         # Use the transforms that match the weights
-        self.transform = models.ResNet50_Weights.DEFAULT.transforms()
+        self.transform = spec['weights'].transforms()
+        # Same resize/crop/normalise, with draft-mode JPEG decode and batched normalisation
+        self.preprocessor = FastPreprocessor.from_transform(self.transform)
+    
+    def describe(self):
+        """Backbone and embedding behind these fingerprints, e.g. resnet50/gem3"""
+        if self.embedding == "gem":
+            return f"{self.backbone}/gem{self.gem_p:g}"
+        return f"{self.backbone}/{self.embedding}"
+    
+    @property
+    def dim(self):
+        """Fingerprint length (one dummy forward pass, then cached)"""
+        if self._dim is None:
+            crop = self.preprocessor.crop_size
+            with self.model_lock, torch.no_grad():
+                self._dim = self.model(torch.zeros(1, 3, crop, crop)).shape[1]
+        return self._dim
     
     def get_fingerprint(self, image_path):
         """Extract a feature vector (fingerprint) from an image"""
         try:
-            image = Image.open(image_path).convert('RGB')
-            image = self.transform(image).unsqueeze(0)  # Add batch dimension
+            image, positions = self.preprocessor.load_batch([image_path])
+            if image is None:
+                return None
             
-            with torch.no_grad():
+            with self.model_lock, torch.no_grad():
                 features = self.model(image)
             
             return features.numpy().flatten()
         except Exception as e:
             print(f"Error processing image: {e}")
             return None
+    
+    def get_fingerprints(self, image_paths, batch_size=16):
+        """Extract fingerprints for many images, batching the forward passes
+        
+        Returns a list aligned with image_paths; unreadable images give None.
+        """
+        fingerprints = [None] * len(image_paths)
+        
+        start = 0
+        while start < len(image_paths):
+            # Shrinks when the process nears its memory budget
+            batch_paths = image_paths[start:start + memory_budget.batch_size(batch_size)]
+            with memory_budget.measure_batch(len(batch_paths)):
+                batch, positions = self.load_batch(batch_paths)
+                if batch is not None:
+                    with self.model_lock, torch.no_grad():
+                        features = self.model(batch).numpy()
+                    del batch
+                    for position, row in zip(positions, features):
+                        fingerprints[start + position] = row
+            start += len(batch_paths)
+        
+        return fingerprints
+    
+    def get_tta_fingerprints(self, image_paths, augmentations=DEFAULT_TTA, batch_size=16):
+        """Fingerprints of K augmented views per image, all views of a batch in one forward pass
+        
+        Returns a list aligned with image_paths of (K, dim) arrays in the
+        order of augmentations; unreadable images give None. batch_size
+        counts views, so K views cost about as much memory as K images.
+        """
+        views = len(augmentations)
+        fingerprints = [None] * len(image_paths)
+        
+        start = 0
+        while start < len(image_paths):
+            batch_paths = image_paths[start:start + max(1, memory_budget.batch_size(batch_size) // views)]
+            with memory_budget.measure_batch(len(batch_paths) * views):
+                batch, positions = self.load_batch(batch_paths)
+                if batch is not None:
+                    batch = make_views(batch, augmentations, self.preprocessor.mean, self.preprocessor.std)
+                    with self.model_lock, torch.no_grad():
+                        features = self.model(batch).numpy().reshape(len(positions), views, -1)
+                    del batch
+                    for position, rows in zip(positions, features):
+                        fingerprints[start + position] = rows
+            start += len(batch_paths)
+        
+        return fingerprints
+    
+    def load_batch(self, image_paths):
+        """Decode and transform images into one batch tensor
+        
+        Items may also be in-memory PIL images (e.g. decoded video frames).
+        Returns (batch, positions) where positions index the readable images
+        in image_paths; batch is None if none could be read.
+        """
+        return self.preprocessor.load_batch(image_paths)
+
+# One loaded model per (backbone, embedding) per process
+_fingerprinters = {}
+_fingerprinters_lock = threading.Lock()
+
+def release_fingerprinters():
+    """Drop loaded triage backbones (reloaded on next use); the main ResNet50 model stays"""
+    with _fingerprinters_lock:
+        for key in [key for key in _fingerprinters if key[0] != "resnet50"]:
+            del _fingerprinters[key]
+
+memory_budget.register(release_fingerprinters)
+
+def get_fingerprinter(backbone="resnet50", embedding=DEFAULT_EMBEDDING):
+    """Shared ImageFingerprinter for a registered backbone, loaded on first use"""
+    with _fingerprinters_lock:
+        if (backbone, embedding) not in _fingerprinters:
+            _fingerprinters[(backbone, embedding)] = ImageFingerprinter(backbone, embedding)
+        return _fingerprinters[(backbone, embedding)]
 
 if __name__ == "__main__":
     fingerprinter = ImageFingerprinter()
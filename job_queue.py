@@ -0,0 +1,437 @@
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+from memory_budget import memory_budget
+
+
+class JobCancelled(BaseException):
+    """Raised inside a handler when its job has been cancelled
+
+    Derives from BaseException so the analysis code's broad
+    `except Exception` handlers don't swallow it.
+    """
+
+
+# kind -> handler(payload, job_dir, progress); handlers return a JSON-serialisable result
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    """Register a function as the handler for a job kind"""
+    def register(function):
+        JOB_HANDLERS[kind] = function
+        return function
+    return register
+
+
+class JobQueue:
+    """Persistent SQLite-backed queue of long-running scans and their results
+
+    A claimed job is leased to one worker (worker_id) until lease_expires.
+    Workers renew the lease while the job runs; a job whose lease has run
+    out belongs to a crashed or killed worker and goes back to the queue,
+    while jobs still leased by live workers in other processes are left
+    alone.
+    """
+
+    def __init__(self, db_path="copyscale_jobs.sqlite3", jobs_dir="copyscale_jobs", lease_seconds=120):
+        self.db_path = db_path
+        self.jobs_dir = jobs_dir
+        self.lease_seconds = lease_seconds
+        os.makedirs(jobs_dir, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress REAL DEFAULT 0,
+                    message TEXT DEFAULT '',
+                    result TEXT,
+                    error TEXT,
+                    cancel_requested INTEGER DEFAULT 0,
+                    created_at REAL,
+                    started_at REAL,
+                    finished_at REAL,
+                    worker_id TEXT,
+                    lease_expires REAL
+                )""")
+            # Queues created before leases existed
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, sql_type in (('worker_id', 'TEXT'), ('lease_expires', 'REAL')):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {sql_type}")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        conn = self._connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def job_dir(self, job_id):
+        """Per-job directory for uploaded inputs and extracted frames"""
+        path = os.path.join(self.jobs_dir, job_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def new_job_id(self):
+        return uuid.uuid4().hex[:12]
+
+    def submit(self, kind, payload, job_id=None):
+        """Queue a job; inputs should already be in job_dir(job_id). Returns the job id."""
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = job_id or self.new_job_id()
+        with self._connection() as conn:
+            conn.execute("INSERT INTO jobs (id, kind, payload, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                         (job_id, kind, json.dumps(payload), time.time()))
+        return job_id
+
+    def claim_next(self, worker_id):
+        """Atomically lease the oldest queued job to worker_id, mark it running and return it (or None)
+
+        Jobs whose lease has expired are requeued first, so work lost with a
+        dead worker is picked up without waiting for a process restart.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            self._requeue_expired(conn, now)
+            row = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute("UPDATE jobs SET status = 'running', started_at = ?, worker_id = ?, lease_expires = ? "
+                         "WHERE id = ?", (now, worker_id, now + self.lease_seconds, row['id']))
+            conn.execute("COMMIT")
+            return dict(row)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def update_progress(self, job_id, progress, message="", worker_id=None):
+        """Record progress (renewing worker_id's lease); returns True if cancellation has been requested"""
+        with self._connection() as conn:
+            conn.execute("UPDATE jobs SET progress = ?, message = ? WHERE id = ?", (progress, message, job_id))
+            if worker_id is not None:
+                self._renew(conn, job_id, worker_id)
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row['cancel_requested'])
+
+    def _renew(self, conn, job_id, worker_id):
+        return conn.execute("UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                            (time.time() + self.lease_seconds, job_id, worker_id)).rowcount == 1
+
+    def heartbeat(self, job_id, worker_id):
+        """Extend worker_id's lease on a running job; returns False if the lease has been lost"""
+        with self._connection() as conn:
+            return self._renew(conn, job_id, worker_id)
+
+    def _finish(self, job_id, status, result=None, error=None, worker_id=None):
+        """Record a final status; with worker_id, only while that worker still holds the job"""
+        query = ("UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_expires = NULL, "
+                 "progress = CASE WHEN ? = 'done' THEN 1 ELSE progress END WHERE id = ?")
+        params = [status, json.dumps(result) if result is not None else None, error, time.time(), status, job_id]
+        if worker_id is not None:
+            query += " AND worker_id = ? AND status = 'running'"
+            params.append(worker_id)
+        with self._connection() as conn:
+            finished = conn.execute(query, params).rowcount == 1
+        if not finished:
+            print(f"⚠️ Job {job_id} was requeued after its lease expired; dropping this worker's {status} result")
+        return finished
+
+    def complete(self, job_id, result, worker_id=None):
+        return self._finish(job_id, 'done', result=result, worker_id=worker_id)
+
+    def replace_result(self, job_id, result):
+        """Overwrite a finished job's result (e.g. after re-scoring it)"""
+        with self._connection() as conn:
+            conn.execute("UPDATE jobs SET result = ? WHERE id = ?", (json.dumps(result), job_id))
+
+    def fail(self, job_id, error, worker_id=None):
+        return self._finish(job_id, 'failed', error=error, worker_id=worker_id)
+
+    def mark_cancelled(self, job_id, worker_id=None):
+        return self._finish(job_id, 'cancelled', worker_id=worker_id)
+
+    def cancel(self, job_id):
+        """Cancel a queued job immediately, or ask a running one to stop"""
+        with self._connection() as conn:
+            conn.execute("UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                         (time.time(), job_id))
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+
+    def get(self, job_id):
+        """Job record with payload/result decoded, or None"""
+        with self._connection() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def list_jobs(self, limit=20, kinds=None):
+        """Most recent jobs first (without results)"""
+        query = "SELECT id, kind, status, progress, message, error, created_at, finished_at FROM jobs"
+        params = []
+        if kinds:
+            query += f" WHERE kind IN ({','.join('?' * len(kinds))})"
+            params.extend(kinds)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._connection() as conn:
+            return [dict(row) for row in conn.execute(query, params).fetchall()]
+
+    @staticmethod
+    def _requeue_expired(conn, now):
+        # Rows without a lease were claimed before leases existed
+        return conn.execute("UPDATE jobs SET status = 'queued', progress = 0, message = 'requeued', "
+                            "worker_id = NULL, lease_expires = NULL "
+                            "WHERE status = 'running' AND (lease_expires IS NULL OR lease_expires < ?)",
+                            (now,)).rowcount
+
+    def requeue_interrupted(self):
+        """Put jobs whose worker died (lease expired) back in the queue; returns how many
+
+        Jobs still leased by live workers, in this or any other process,
+        are not touched.
+        """
+        with self._connection() as conn:
+            return self._requeue_expired(conn, time.time())
+
+    def delete(self, job_id):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        shutil.rmtree(os.path.join(self.jobs_dir, job_id), ignore_errors=True)
+
+
+class WorkerPool:
+    """Background threads that pull jobs from a JobQueue and run their handlers
+
+    Each thread claims jobs under its own worker id and renews the job's
+    lease every lease_seconds / 3 while the handler runs.
+    """
+
+    def __init__(self, queue, num_workers=2, poll_interval=1.0):
+        self.queue = queue
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._run, name=f"copyscale-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    @staticmethod
+    def worker_id():
+        """Identity of the calling worker thread, unique across hosts and processes"""
+        return f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+
+    def _run(self):
+        worker_id = self.worker_id()
+        while not self._stop.is_set():
+            job = self.queue.claim_next(worker_id)
+            if job is None:
+                self._stop.wait(self.poll_interval)
+                continue
+            self.run_job(job, worker_id)
+
+    def _keep_leased(self, job_id, worker_id, done):
+        while not done.wait(self.queue.lease_seconds / 3):
+            if not self.queue.heartbeat(job_id, worker_id):
+                print(f"⚠️ Lost the lease on job {job_id}")
+                return
+
+    def run_job(self, job, worker_id=None):
+        job_id = job['id']
+        worker_id = worker_id or self.worker_id()
+
+        def progress(fraction, message=""):
+            if self.queue.update_progress(job_id, fraction, message, worker_id):
+                raise JobCancelled()
+
+        done = threading.Event()
+        threading.Thread(target=self._keep_leased, args=(job_id, worker_id, done),
+                         name=f"{threading.current_thread().name}-lease", daemon=True).start()
+        try:
+            handler = JOB_HANDLERS[job['kind']]
+            with memory_budget.task():
+                result = handler(json.loads(job['payload']), self.queue.job_dir(job_id), progress)
+            self.queue.complete(job_id, result, worker_id)
+        except JobCancelled:
+            self.queue.mark_cancelled(job_id, worker_id)
+        except Exception as e:
+            print(f"❌ Job {job_id} failed: {e}")
+            self.queue.fail(job_id, f"{e}\n{traceback.format_exc()}", worker_id)
+        finally:
+            done.set()
+
+
+def _serialisable_frame(frame_info):
+    """Frame metadata without the in-memory PIL image"""
+    return {key: value for key, value in frame_info.items() if key != 'image'}
+
+
+def scan_image(db, query_path, options, progress):
+    """Search one image against a CopyrightDatabase; options as in an image_scan payload"""
+    from analyzer import analyzer
+    from fingerprint import tta_views
+
+    progress(0.1, "Scanning image against database")
+    partial = options.get('partial', False)
+    cascade_backbone = options.get('cascade_backbone')
+    tta = options.get('tta')
+    views = tta_views(tta)
+    query_descriptors = None
+    if partial or cascade_backbone is None:
+        # One forward pass serves the whole-image search, every TTA view and the tile search
+        query_descriptors = analyzer.extract_descriptors([query_path], with_tiles=partial,
+                                                         augmentations=views if len(views) > 1 else None)[0]
+    matches = db.search_similar_content(query_path, top_k=options.get('top_k', 3),
+                                        query_descriptors=query_descriptors,
+                                        cascade_backbone=cascade_backbone,
+                                        early_exit=options.get('early_exit', False), tta=tta,
+                                        **options.get('filters', {}))
+    result = {'matches': matches}
+    if partial:
+        progress(0.8, "Searching for crops and partial copies")
+        result['partial_matches'] = db.search_partial_matches(query_path, top_k=options.get('top_k', 3),
+                                                              query_descriptors=query_descriptors)
+    return result
+
+
+def scan_video(db, video_path, options, frames_dir, progress):
+    """Search one video's keyframes (and optionally aligned segments) against a CopyrightDatabase"""
+    results = db.batch_video_analysis(video_path,
+                                      top_matches_per_frame=options.get('top_k', 2),
+                                      filters=options.get('filters'),
+                                      frames_dir=frames_dir,
+                                      progress_callback=progress)
+    for result in results:
+        result['frame_info'] = _serialisable_frame(result['frame_info'])
+    result = {'frames': results}
+    if options.get('temporal'):
+        result['segments'] = db.search_video_segments(
+            video_path, progress_callback=lambda fraction, message="": progress(
+                fraction, f"Aligning against reference videos: {message}"))
+    return result
+
+
+@job_handler("image_scan")
+def run_image_scan(payload, job_dir, progress):
+    from copyright_db import copyright_db
+    from fingerprint import tta_views
+
+    if payload.get('incremental') and payload.get('cascade_backbone') is None and len(tta_views(payload.get('tta'))) == 1:
+        # Reuse stored analyses (single-view only); only pairs with new or changed entries are computed
+        from result_store import ResultStore, scan_image_incremental
+        store = ResultStore(payload.get('result_store', "copyscale_results.sqlite3"))
+        return scan_image_incremental(copyright_db, store, payload['query_path'], payload, progress)
+    return scan_image(copyright_db, payload['query_path'], payload, progress)
+
+
+@job_handler("video_scan")
+def run_video_scan(payload, job_dir, progress):
+    from copyright_db import copyright_db
+
+    return scan_video(copyright_db, payload['video_path'], payload, job_dir, progress)
+
+
+@job_handler("video_ingest")
+def run_video_ingest(payload, job_dir, progress):
+    from copyright_db import copyright_db
+
+    video_id = copyright_db.add_reference_video(payload['video_path'], payload['title'], payload['owner'],
+                                                payload.get('description', ""), payload.get('tags'),
+                                                progress_callback=progress)
+    if video_id is None:
+        raise ValueError("No frames could be read from the video")
+    return {'video_id': video_id}
+
+
+@job_handler("embedding_migration")
+def run_embedding_migration(payload, job_dir, progress):
+    from copyright_db import copyright_db
+
+    return {'embedded': copyright_db.migrate_embeddings(progress_callback=progress),
+            'embedding': copyright_db.embedding}
+
+
+@job_handler("video_analysis")
+def run_video_analysis(payload, job_dir, progress):
+    from video_analyzer import video_analyzer
+
+    results = video_analyzer.analyze_video_against_image(payload['video_path'], payload['reference_path'],
+                                                         frames_dir=job_dir, progress_callback=progress)
+    for result in results:
+        result['frame_info'] = _serialisable_frame(result['frame_info'])
+    return {'frames': results}
+
+
+@job_handler("evidence_export")
+def run_evidence_export(payload, job_dir, progress):
+    """Evidence bundle for a finished scan job, built from its stored results without any model pass"""
+    from evidence import export_evidence
+
+    queue = JobQueue(payload.get('queue_db', "copyscale_jobs.sqlite3"), payload.get('jobs_dir', "copyscale_jobs"))
+    job = queue.get(payload['source_job'])
+    if job is None or job['status'] != 'done':
+        raise ValueError(f"Scan job {payload['source_job']} has no stored results")
+    fmt = payload.get('format', "zip")
+    return export_evidence(job, os.path.join(job_dir, f"evidence_{job['id']}.{fmt}"), fmt,
+                           payload.get('min_risk', "MEDIUM"), progress)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run Copyscale background workers")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--db", default="copyscale_jobs.sqlite3")
+    parser.add_argument("--jobs-dir", default="copyscale_jobs")
+    parser.add_argument("--memory-budget", help="RSS budget, e.g. 4G (default: COPYSCALE_MEMORY_BUDGET)")
+    args = parser.parse_args()
+
+    if args.memory_budget:
+        memory_budget.configure(args.memory_budget)
+    job_queue = JobQueue(args.db, args.jobs_dir)
+    print(f"Requeued {job_queue.requeue_interrupted()} interrupted jobs")
+    pool = WorkerPool(job_queue, args.workers).start()
+    print(f"✅ {args.workers} workers polling {args.db}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pool.stop()
@@ -0,0 +1,264 @@
+import ctypes
+import gc
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:             # Windows
+    resource = None
+
+# Rough peak working memory of one ResNet50 inference image at 224x224 (input,
+# activations of the widest stage, hook outputs); refined from measurements
+DEFAULT_BYTES_PER_IMAGE = 24 * 1024 ** 2
+# Rough extra memory of one comprehensive analysis / scan job in flight
+DEFAULT_BYTES_PER_TASK = 256 * 1024 ** 2
+
+
+def parse_size(text):
+    """Bytes from '4G', '512M', '1.5GB' or a plain number; None for empty input"""
+    if text in (None, ""):
+        return None
+    text = str(text).strip().upper().rstrip('B')
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(float(text))
+
+
+def current_rss():
+    """Resident set size of this process in bytes (0 if it cannot be measured)"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return peak_rss()
+
+
+def peak_rss():
+    """Highest RSS this process has reached, in bytes"""
+    if resource is None:
+        return current_rss() if psutil is not None else 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+def trim_heap():
+    """Collect garbage and ask glibc to hand freed arenas back to the OS"""
+    gc.collect()
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+class MemoryBudget:
+    """Process-wide RSS budget that batch sizes, caches and concurrency adapt to
+
+    limit is in bytes (None = unlimited, everything runs at the requested
+    sizes). Above soft_fraction of the limit, registered caches are asked to
+    shrink and the heap is trimmed; batch sizes are cut to what the
+    remaining headroom can hold at the measured per-image cost; and new
+    tasks wait for running ones to finish instead of starting alongside them.
+    """
+
+    def __init__(self, limit=None, soft_fraction=0.8, bytes_per_image=DEFAULT_BYTES_PER_IMAGE,
+                 bytes_per_task=DEFAULT_BYTES_PER_TASK):
+        self.limit = limit
+        self.soft_fraction = soft_fraction
+        self.bytes_per_image = bytes_per_image
+        self.bytes_per_task = bytes_per_task
+        self._releasers = []
+        self._lock = threading.Lock()
+        self._tasks = threading.Condition()
+        self._active_tasks = 0
+        self._last_release = 0.0
+
+    @property
+    def soft_limit(self):
+        return self.limit * self.soft_fraction if self.limit else None
+
+    def configure(self, limit):
+        """Change the limit at runtime (bytes, a size string like '4G', or None)"""
+        self.limit = parse_size(limit) if isinstance(limit, str) else limit
+
+    def register(self, release):
+        """Register a callable that frees memory (e.g. clears a cache) under pressure
+
+        Bound methods are held weakly so registering does not keep their
+        object alive.
+        """
+        ref = weakref.WeakMethod(release) if hasattr(release, '__self__') else (lambda: release)
+        with self._lock:
+            self._releasers.append(ref)
+
+    def release(self):
+        """Run every registered releaser and trim the heap; returns the RSS afterwards"""
+        with self._lock:
+            releasers = [ref() for ref in self._releasers]
+            self._releasers = [ref for ref, release in zip(self._releasers, releasers) if release is not None]
+        for release in releasers:
+            if release is not None:
+                try:
+                    release()
+                except Exception as e:
+                    print(f"Memory release failed: {e}")
+        trim_heap()
+        self._last_release = time.time()
+        return current_rss()
+
+    def under_pressure(self):
+        return self.limit is not None and current_rss() > self.soft_limit
+
+    def check(self):
+        """Free memory if over the soft limit (at most once a second); returns the current RSS"""
+        rss = current_rss()
+        if self.limit is not None and rss > self.soft_limit and time.time() - self._last_release > 1.0:
+            rss = self.release()
+        return rss
+
+    def batch_size(self, requested, bytes_per_item=None):
+        """Largest batch up to requested that fits in the headroom under the soft limit (at least 1)"""
+        if self.limit is None:
+            return requested
+        headroom = self.soft_limit - self.check()
+        fits = int(headroom // (bytes_per_item or self.bytes_per_image))
+        return max(1, min(requested, fits))
+
+    @contextmanager
+    def measure_batch(self, size):
+        """Raise bytes_per_image if a batch of size images pushed peak RSS past its previous high
+
+        Freed activations are usually handed straight back to the OS, so
+        current RSS after a batch says little; a new peak, though, bounds
+        what the batch needed. The estimate only ever tightens.
+        """
+        before, peak_before = current_rss(), peak_rss()
+        try:
+            yield
+        finally:
+            peak_after = peak_rss()
+            if self.limit is not None and size and peak_after > peak_before:
+                self.bytes_per_image = max(self.bytes_per_image, int((peak_after - before) / size))
+
+    @contextmanager
+    def task(self):
+        """Run one analysis or job; waits while the budget cannot fit another alongside the running ones"""
+        with self._tasks:
+            while (self.limit is not None and self._active_tasks > 0
+                   and self.check() + self.bytes_per_task > self.soft_limit):
+                self._tasks.wait(timeout=1.0)
+            self._active_tasks += 1
+        try:
+            yield
+        finally:
+            with self._tasks:
+                self._active_tasks -= 1
+                self._tasks.notify_all()
+            if self.limit is not None:
+                self.check()
+
+    def stats(self):
+        return {'limit': self.limit, 'rss': current_rss(), 'peak_rss': peak_rss(),
+                'bytes_per_image': self.bytes_per_image, 'active_tasks': self._active_tasks}
+
+
+# Configured from COPYSCALE_MEMORY_BUDGET (e.g. "4G"); unlimited when unset
+memory_budget = MemoryBudget(parse_size(os.environ.get("COPYSCALE_MEMORY_BUDGET")))
+
+
+def stress_test(num_images=10000, budget="2G", image_size=(640, 480), work_dir=None, batch_size=64,
+                report_every=500):
+    """Ingest and scan num_images synthetic images under a memory budget, tracking peak RSS
+
+    Builds a database in work_dir (a temporary directory by default) with
+    adaptive-batch bulk ingestion, then runs a stage-1 search for every
+    image. Returns the budget, peak RSS and throughput; 'within_budget' is
+    the pass/fail result.
+    """
+    import shutil
+    import tempfile
+    import numpy as np
+    from PIL import Image
+
+    memory_budget.configure(budget)
+    keep = work_dir is not None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="copyscale_stress_")
+    image_dir = os.path.join(work_dir, "images")
+    os.makedirs(image_dir, exist_ok=True)
+    rng = np.random.RandomState(0)
+    paths = []
+    for i in range(num_images):
+        path = os.path.join(image_dir, f"{i:05d}.jpg")
+        if not os.path.exists(path):
+            # Low-frequency noise upsampled, so images differ but compress like photos
+            small = rng.randint(0, 255, (image_size[1] // 32, image_size[0] // 32, 3), dtype=np.uint8)
+            Image.fromarray(small).resize(image_size, Image.BILINEAR).save(path, quality=85)
+        paths.append(path)
+
+    from copyright_db import CopyrightDatabase
+    from analyzer import analyzer
+
+    db = CopyrightDatabase(os.path.join(work_dir, "stress_db.json"), partition="hash")
+    start = time.time()
+    ingest = db.add_bulk_content(paths, "stress", batch_size=batch_size, near_duplicate_threshold=1.01)
+    ingest_seconds = time.time() - start
+
+    start = time.time()
+    samples = []
+    for first in range(0, len(paths), batch_size):
+        batch_paths = paths[first:first + batch_size]
+        with memory_budget.task():
+            for descriptors in analyzer.extract_descriptors(batch_paths, batch_size):
+                if descriptors is not None:
+                    db.search_candidates(descriptors['final'], top_k=3)
+        if first // batch_size % max(1, report_every // batch_size) == 0:
+            samples.append(current_rss())
+            print(f"Scanned {first + len(batch_paths)}/{len(paths)}, RSS {current_rss() / 1024 ** 2:.0f} MB, "
+                  f"batch {memory_budget.batch_size(batch_size)}")
+    scan_seconds = time.time() - start
+
+    report = {
+        'images': num_images,
+        'budget': memory_budget.limit,
+        'peak_rss': peak_rss(),
+        'rss_samples': samples,
+        'added': ingest['added'],
+        'ingest_images_per_sec': num_images / ingest_seconds if ingest_seconds else 0.0,
+        'scan_images_per_sec': num_images / scan_seconds if scan_seconds else 0.0,
+        'bytes_per_image': memory_budget.bytes_per_image,
+        'within_budget': peak_rss() <= memory_budget.limit,
+        'work_dir': work_dir
+    }
+    if not keep:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check that a large scan stays within a memory budget")
+    parser.add_argument("--images", type=int, default=10000)
+    parser.add_argument("--budget", default="2G")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--work-dir", help="keep the synthetic images and database here")
+    args = parser.parse_args()
+
+    report = stress_test(args.images, args.budget, work_dir=args.work_dir, batch_size=args.batch_size)
+    print(f"{report['images']} images: peak RSS {report['peak_rss'] / 1024 ** 2:.0f} MB of "
+          f"{report['budget'] / 1024 ** 2:.0f} MB budget, ingest {report['ingest_images_per_sec']:.1f} img/s, "
+          f"scan {report['scan_images_per_sec']:.1f} img/s, ~{report['bytes_per_image'] / 1024 ** 2:.1f} MB per image")
+    print("✅ Peak memory stayed within the budget" if report['within_budget'] else "❌ Peak memory exceeded the budget")
+    raise SystemExit(0 if report['within_budget'] else 1)
@@ -0,0 +1,287 @@
+import gc
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def process_memory(pid="self"):
+    """RSS, PSS and USS of a process in bytes
+
+    RSS counts every shared page in full in every process that maps it; PSS
+    splits shared pages between the processes sharing them, so the PSS of
+    a parent and its forked workers adds up to what they really cost. USS
+    is the memory private to the process.
+    """
+    try:
+        fields = {}
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1]) * 1024
+        return {'rss': fields.get('Rss', 0), 'pss': fields.get('Pss', 0),
+                'uss': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)}
+    except OSError:
+        if psutil is None:
+            return {'rss': 0, 'pss': 0, 'uss': 0}
+        info = psutil.Process(None if pid == "self" else pid).memory_full_info()
+        return {'rss': info.rss, 'pss': getattr(info, 'pss', info.rss), 'uss': info.uss}
+
+
+def preload(db=None, backbones=()):
+    """Load the ResNet50 model, extra backbones and a database in this process before forking
+
+    Children forked afterwards share the weights and the loaded indexes
+    copy-on-write, and the memory-mapped fingerprint matrices through the
+    page cache. Everything loaded so far is then frozen out of the garbage
+    collector, whose bookkeeping writes would otherwise copy those pages
+    into every child. No inference runs here: the children set up their
+    own torch thread pools after the fork.
+    """
+    from analyzer import analyzer
+    from fingerprint import get_fingerprinter
+
+    for backbone in list(backbones) + (list(db.namespaces) if db is not None else []):
+        get_fingerprinter(backbone)
+    if db is not None:
+        db.preload()
+    gc.collect()
+    gc.freeze()
+    return analyzer
+
+
+class PreforkServer:
+    """Forks num_workers children from a preloaded parent and restarts any that die
+
+    target(index) runs in each child until it returns; children get SIGTERM
+    on stop() and should finish their current job and return. Each child
+    uses threads torch intra-op threads (default: the cores split between
+    the workers).
+    """
+
+    def __init__(self, num_workers, target, threads=None, respawn=True):
+        self.num_workers = num_workers
+        self.target = target
+        self.threads = threads or max(1, (os.cpu_count() or 1) // num_workers)
+        self.respawn = respawn
+        self.children = {}          # pid -> worker index
+        self._running = False
+
+    def _spawn(self, index):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = index
+            return pid
+
+        status = 0
+        try:
+            import torch
+
+            # Ctrl+C reaches the whole process group; the parent decides when children stop
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            torch.set_num_threads(self.threads)
+            self.target(index)
+        except BaseException:
+            traceback.print_exc()
+            status = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+
+    def start(self):
+        self._running = True
+        for index in range(self.num_workers):
+            self._spawn(index)
+        return self
+
+    def wait(self):
+        """Reap children until all have exited, restarting crashed ones while running"""
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            index = self.children.pop(pid, None)
+            if index is not None and self._running and self.respawn:
+                print(f"⚠️ Worker {index} (pid {pid}) exited with status {status}; restarting")
+                self._spawn(index)
+
+    def stop(self):
+        self._running = False
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+
+def run_job_worker(queue_db, jobs_dir, threads=1, poll_interval=1.0):
+    """Child target: a WorkerPool on the shared job queue, drained on SIGTERM"""
+    from job_queue import JobQueue, WorkerPool
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    pool = WorkerPool(JobQueue(queue_db, jobs_dir), threads, poll_interval).start()
+    while not stop.wait(1.0):
+        pass
+    pool.stop()
+
+
+def run_scan_worker(url, db, poll_interval=2.0):
+    """Child target: a ScanWorker serving units against the preloaded database snapshot"""
+    from scan_coordinator import ScanWorker
+
+    worker = ScanWorker(url, db_file=db.db_file, blob_dir=db.blobs.root, poll_interval=poll_interval)
+    worker.add_database(db)
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    worker.run()
+
+
+def _sample_images(work_dir, count=4):
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.RandomState(0)
+    paths = []
+    for i in range(count):
+        path = os.path.join(work_dir, f"sample_{i}.jpg")
+        small = rng.randint(0, 255, (15, 20, 3), dtype=np.uint8)
+        Image.fromarray(small).resize((640, 480), Image.BILINEAR).save(path, quality=85)
+        paths.append(path)
+    return paths
+
+
+def measure_sharing(num_workers=4, db=None, image_paths=None, threads=1, timeout=600):
+    """Fork num_workers preloaded workers, run one scan in each and report their real memory cost
+
+    Every worker fingerprints image_paths (synthetic images by default) and
+    searches db with them, so the weights and fingerprint pages they touch
+    are resident. Returns per-process RSS/PSS/USS, the summed PSS of parent
+    plus workers, and the ratio of that total to what one standalone worker
+    would use: close to 1 means the model and database are held once,
+    num_workers means they are copied into every worker.
+    """
+    with tempfile.TemporaryDirectory(prefix="copyscale_prefork_") as work_dir:
+        image_paths = image_paths or _sample_images(work_dir)
+        analyzer = preload(db)
+        parent_preloaded = process_memory()
+        read_fd, write_fd = os.pipe()
+
+        def work(index):
+            os.close(read_fd)
+            for descriptors in analyzer.extract_descriptors(image_paths):
+                if descriptors is not None and db is not None and not db.embedding_stale:
+                    db.search_candidates(descriptors['final'], top_k=3)
+            os.write(write_fd, b'.')
+            while True:
+                signal.pause()
+
+        server = PreforkServer(num_workers, work, threads, respawn=False).start()
+        os.close(write_fd)
+        ready, deadline = 0, time.time() + timeout
+        while ready < num_workers and time.time() < deadline:
+            chunk = os.read(read_fd, num_workers)
+            if not chunk:
+                break
+            ready += len(chunk)
+        os.close(read_fd)
+
+        workers = [process_memory(pid) for pid in server.children]
+        parent = process_memory()
+        server.stop()
+        server.wait()
+
+    if ready < num_workers:
+        raise RuntimeError(f"Only {ready} of {num_workers} workers finished their scan")
+    # A standalone worker loads what the parent preloaded and then does the same work
+    single = parent_preloaded['rss'] + max(worker['uss'] for worker in workers)
+    total_pss = parent['pss'] + sum(worker['pss'] for worker in workers)
+    return {
+        'workers': num_workers,
+        'parent_preloaded_rss': parent_preloaded['rss'],
+        'parent': parent,
+        'per_worker': workers,
+        'single_process_rss': single,
+        'total_pss': total_pss,
+        'unshared_estimate': single * num_workers,
+        'cost_in_processes': total_pss / single if single else 0.0
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Preload the model and database once, then fork workers sharing them")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int, help="torch intra-op threads per worker (default: cores / workers)")
+    parser.add_argument("--memory-budget", help="per-worker RSS budget, e.g. 4G (default: COPYSCALE_MEMORY_BUDGET)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    jobs_parser = subparsers.add_parser("jobs", help="job queue workers")
+    jobs_parser.add_argument("--db", default="copyscale_jobs.sqlite3")
+    jobs_parser.add_argument("--jobs-dir", default="copyscale_jobs")
+    jobs_parser.add_argument("--threads-per-worker", type=int, default=1, help="concurrent jobs per worker process")
+
+    scan_parser = subparsers.add_parser("scan", help="scan coordinator workers")
+    scan_parser.add_argument("--url", default="http://127.0.0.1:8765")
+    scan_parser.add_argument("--db", required=True, help="local copy of the snapshot manifest")
+    scan_parser.add_argument("--blob-dir")
+    scan_parser.add_argument("--poll-interval", type=float, default=2.0)
+
+    measure_parser = subparsers.add_parser("measure", help="report the memory N preloaded workers really use")
+    measure_parser.add_argument("--database", help="database manifest to preload and search")
+    measure_parser.add_argument("images", nargs="*")
+    args = parser.parse_args()
+
+    if args.memory_budget:
+        from memory_budget import memory_budget
+        memory_budget.configure(args.memory_budget)
+
+    if args.command == "measure":
+        from copyright_db import CopyrightDatabase
+
+        db = CopyrightDatabase(args.database) if args.database else None
+        report = measure_sharing(args.workers, db, args.images, args.threads or 1)
+        mb = 1024 ** 2
+        for i, worker in enumerate(report['per_worker']):
+            print(f"worker {i}: RSS {worker['rss'] / mb:.0f} MB, PSS {worker['pss'] / mb:.0f} MB, "
+                  f"private {worker['uss'] / mb:.0f} MB")
+        print(f"parent: RSS {report['parent']['rss'] / mb:.0f} MB, PSS {report['parent']['pss'] / mb:.0f} MB")
+        print(f"{report['workers']} workers + parent use {report['total_pss'] / mb:.0f} MB in total "
+              f"({report['cost_in_processes']:.2f}x one {report['single_process_rss'] / mb:.0f} MB process; "
+              f"{report['unshared_estimate'] / mb:.0f} MB if nothing were shared)")
+        raise SystemExit(0)
+
+    if args.command == "jobs":
+        from job_queue import JobQueue
+
+        print(f"Requeued {JobQueue(args.db, args.jobs_dir).requeue_interrupted()} interrupted jobs")
+        from copyright_db import copyright_db
+        preload(copyright_db)
+        target = lambda index: run_job_worker(args.db, args.jobs_dir, args.threads_per_worker)
+    else:
+        from copyright_db import CopyrightDatabase
+
+        db = CopyrightDatabase(args.db, blob_dir=args.blob_dir, read_only=True)
+        preload(db)
+        target = lambda index: run_scan_worker(args.url, db, args.poll_interval)
+
+    server = PreforkServer(args.workers, target, args.threads).start()
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+    print(f"✅ {args.workers} preloaded {args.command} workers running (pids {', '.join(map(str, server.children))})")
+    try:
+        server.wait()
+    except KeyboardInterrupt:
+        server.stop()
+        server.wait()
@@ -0,0 +1,193 @@
+import os
+import threading
+import time
+import numpy as np
+import torch
+from PIL import Image, ImageDraw, ImageFilter
+
+# Largest per-image mean absolute difference (normalised units) from the
+# reference transform that the fast path may show; ~0.003 is typical
+PARITY_MAX_MEAN_DIFF = 0.01
+
+
+class FastPreprocessor:
+    """Decode-light replacement for torchvision's ImageClassification transform
+
+    The stock transform decodes the full image, converts it to a tensor and
+    resizes it in torch. Here JPEGs are decoded with draft() at the smallest
+    DCT scale (1/2, 1/4, 1/8) that still leaves draft_margin x the resize
+    size, only the centre-crop region is resampled (PIL's C resize with a
+    source box), pixels land in a reused per-thread uint8 batch buffer, and
+    normalisation is one vectorised op over the whole batch. Output matches
+    the reference transform to within interpolation noise; see check_parity.
+    """
+
+    def __init__(self, resize_size=232, crop_size=224, mean=(0.485, 0.456, 0.406), std=(0.229, 0.224, 0.225),
+                 use_draft=True, draft_margin=2.0, interpolation="bilinear"):
+        self.resize_size = resize_size
+        self.crop_size = crop_size
+        self.interpolation = interpolation
+        self._resample = {'bilinear': Image.BILINEAR, 'bicubic': Image.BICUBIC,
+                          'nearest': Image.NEAREST}[interpolation]
+        self.use_draft = use_draft
+        self.draft_margin = draft_margin
+        self.mean = tuple(mean)
+        self.std = tuple(std)
+        # (x / 255 - mean) / std == x * scale + shift
+        self._scale = torch.tensor([1.0 / (255.0 * s) for s in std]).view(1, 3, 1, 1)
+        self._shift = torch.tensor([-m / s for m, s in zip(mean, std)]).view(1, 3, 1, 1)
+        self._local = threading.local()
+
+    @classmethod
+    def from_transform(cls, transform, **kwargs):
+        """Build from a torchvision ImageClassification preset (e.g. ResNet50_Weights.DEFAULT.transforms())"""
+        return cls(resize_size=transform.resize_size[0], crop_size=transform.crop_size[0],
+                   mean=tuple(transform.mean), std=tuple(transform.std),
+                   interpolation=transform.interpolation.value, **kwargs)
+
+    def describe(self):
+        """Stable description of the preprocessing, for descriptor versioning"""
+        return (f"fast(resize={self.resize_size},crop={self.crop_size},draft={self.use_draft},"
+                f"margin={self.draft_margin},{self.interpolation})")
+
+    def _crop_box(self, width, height):
+        """Source-space box of the centre crop after the shorter-side resize (torchvision's rounding)"""
+        if width <= height:
+            new_width, new_height = self.resize_size, int(self.resize_size * height / width)
+        else:
+            new_width, new_height = int(self.resize_size * width / height), self.resize_size
+        top = int(round((new_height - self.crop_size) / 2.0))
+        left = int(round((new_width - self.crop_size) / 2.0))
+        scale_x, scale_y = width / new_width, height / new_height
+        return (left * scale_x, top * scale_y,
+                (left + self.crop_size) * scale_x, (top + self.crop_size) * scale_y)
+
+    def load_array(self, source, out=None):
+        """Decode one image (path or PIL image) into a crop_size x crop_size x 3 uint8 array"""
+        image = source if isinstance(source, Image.Image) else Image.open(source)
+        if self.use_draft and image.format == 'JPEG' and not isinstance(source, Image.Image):
+            shorter = min(image.size)
+            target = self.resize_size * self.draft_margin
+            if shorter > target:
+                ratio = target / shorter
+                image.draft('RGB', (int(image.width * ratio), int(image.height * ratio)))
+        image = image.convert('RGB')
+
+        box = self._crop_box(*image.size)
+        cropped = image.resize((self.crop_size, self.crop_size), self._resample, box=box)
+        if out is None:
+            return np.asarray(cropped)
+        out[...] = np.asarray(cropped)
+        return out
+
+    def _buffer(self, size):
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None or buffer.shape[0] < size:
+            buffer = np.empty((size, self.crop_size, self.crop_size, 3), dtype=np.uint8)
+            self._local.buffer = buffer
+        return buffer
+
+    def load_batch(self, sources):
+        """Decode and normalise images into one float batch; returns (batch or None, positions)"""
+        buffer = self._buffer(len(sources))
+        positions = []
+        for position, source in enumerate(sources):
+            try:
+                self.load_array(source, out=buffer[len(positions)])
+                positions.append(position)
+            except Exception as e:
+                print(f"Error processing image {source}: {e}")
+
+        if not positions:
+            return None, []
+        batch = torch.from_numpy(buffer[:len(positions)]).permute(0, 3, 1, 2).float()
+        return batch.mul_(self._scale).add_(self._shift), positions
+
+    def __call__(self, image):
+        """Single-image tensor (C, H, W), a drop-in for the torchvision transform"""
+        batch, _ = self.load_batch([image])
+        return batch[0]
+
+
+def parity_images(directory, seed=0):
+    """Write the images the parity check runs on; returns their paths
+
+    Landscape, portrait and square scenes (gradients plus blurred shapes),
+    each saved as JPEG and PNG: large enough that JPEG draft decoding kicks
+    in, near the resize size, and with an odd aspect ratio that exercises
+    the crop rounding.
+    """
+    rng = np.random.RandomState(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for width, height in ((1600, 1000), (1000, 1600), (400, 300), (300, 400), (233, 500), (1000, 1000)):
+        y, x = np.mgrid[0:height, 0:width]
+        pixels = np.stack([x * 255 // width, y * 255 // height, (x + y) % 256], axis=-1).astype(np.uint8)
+        image = Image.fromarray(pixels)
+        draw = ImageDraw.Draw(image)
+        for _ in range(15):
+            left, top = rng.randint(0, width), rng.randint(0, height)
+            draw.ellipse((left, top, left + rng.randint(10, width // 3), top + rng.randint(10, height // 3)),
+                         fill=tuple(int(v) for v in rng.randint(0, 255, 3)))
+        image = image.filter(ImageFilter.GaussianBlur(1))
+        for extension in ("jpg", "png"):
+            path = os.path.join(directory, f"parity_{width}x{height}.{extension}")
+            image.save(path, quality=90) if extension == "jpg" else image.save(path)
+            paths.append(path)
+    return paths
+
+
+def check_parity(image_paths, reference_transform, preprocessor):
+    """Compare preprocessor output with the reference transform
+
+    Returns per-image max/mean absolute differences (in normalised units)
+    plus timings for both paths.
+    """
+    report = {'images': [], 'reference_seconds': 0.0, 'fast_seconds': 0.0}
+    for path in image_paths:
+        start = time.time()
+        expected = reference_transform(Image.open(path).convert('RGB'))
+        report['reference_seconds'] += time.time() - start
+
+        start = time.time()
+        actual, positions = preprocessor.load_batch([path])
+        report['fast_seconds'] += time.time() - start
+        if not positions:
+            report['images'].append({'path': path, 'error': 'unreadable'})
+            continue
+
+        difference = (actual[0] - expected).abs()
+        report['images'].append({'path': path, 'max_abs_diff': float(difference.max()),
+                                 'mean_abs_diff': float(difference.mean())})
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    from backbones import BACKBONES, backbone_spec
+
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Check fast preprocessing against a backbone's torchvision transform")
+    parser.add_argument("images", nargs="*", help="images to check (default: generated parity_images)")
+    parser.add_argument("--backbone", default="resnet50", choices=sorted(BACKBONES))
+    parser.add_argument("--max-mean-diff", type=float, default=PARITY_MAX_MEAN_DIFF,
+                        help="fail if any image's mean absolute difference exceeds this")
+    parser.add_argument("--no-draft", action="store_true")
+    args = parser.parse_args()
+
+    reference = backbone_spec(args.backbone)['weights'].transforms()
+    images = args.images or parity_images(tempfile.mkdtemp(prefix="copyscale_parity_"))
+    report = check_parity(images, reference,
+                          FastPreprocessor.from_transform(reference, use_draft=not args.no_draft))
+    failed = False
+    for item in report['images']:
+        if 'error' in item:
+            print(f"❌ {item['path']}: {item['error']}")
+            failed = True
+            continue
+        ok = item['mean_abs_diff'] <= args.max_mean_diff
+        failed = failed or not ok
+        print(f"{'✅' if ok else '❌'} {item['path']}: max {item['max_abs_diff']:.4f}, mean {item['mean_abs_diff']:.4f}")
+    print(f"Reference {report['reference_seconds']:.2f}s, fast {report['fast_seconds']:.2f}s")
+    raise SystemExit(1 if failed else 0)
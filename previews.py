@@ -0,0 +1,84 @@
+import hashlib
+import os
+from PIL import Image
+
+PREVIEW_SIZE = (1024, 1024)
+
+
+def open_downscaled(path, max_size=PREVIEW_SIZE):
+    """Open an image already reduced to fit max_size, without a full-resolution decode
+
+    For JPEGs, draft() lets libjpeg decode at 1/2, 1/4 or 1/8 scale in the
+    DCT domain; other formats use reduce() (box filter by an integer factor)
+    before the final resample, so the cost tracks the output size rather
+    than the source resolution.
+    """
+    image = Image.open(path)
+    # draft() keeps both sides >= the request, so ask for the aspect-fitted size
+    scale = min(max_size[0] / image.width, max_size[1] / image.height, 1.0)
+    image.draft('RGB', (max(int(image.width * scale), 1), max(int(image.height * scale), 1)))
+    image = image.convert('RGB')
+    factor = int(max(image.width / max_size[0], image.height / max_size[1]))
+    if factor >= 2:
+        image = image.reduce(factor)
+    image.thumbnail(max_size, Image.BICUBIC)
+    return image
+
+
+class PreviewCache:
+    """On-disk cache of display-sized JPEG previews for any image path
+
+    Keys combine the absolute path, size and mtime, so edited files get a
+    fresh preview. All result lists and comparison charts read from here,
+    making render time and memory independent of source resolution.
+    """
+
+    def __init__(self, root="copyscale_previews", max_size=PREVIEW_SIZE, max_files=2000):
+        self.root = root
+        self.max_size = tuple(max_size)
+        self.max_files = max_files
+        self._writes = 0
+
+    def _key(self, path, max_size):
+        stat = os.stat(path)
+        spec = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}|{max_size[0]}x{max_size[1]}"
+        return hashlib.sha1(spec.encode('utf-8')).hexdigest()
+
+    def get(self, path, max_size=None):
+        """Path of a cached preview for path (generated on first use); falls back to path itself"""
+        max_size = tuple(max_size or self.max_size)
+        try:
+            key = self._key(path, max_size)
+            preview_path = os.path.join(self.root, key[:2], f"{key}.jpg")
+            if not os.path.exists(preview_path):
+                os.makedirs(os.path.dirname(preview_path), exist_ok=True)
+                tmp_path = f"{preview_path}.tmp"
+                open_downscaled(path, max_size).save(tmp_path, "JPEG", quality=85)
+                os.replace(tmp_path, preview_path)
+                self._writes += 1
+                if self._writes % 100 == 0:
+                    self.prune()
+            return preview_path
+        except Exception as e:
+            print(f"Error creating preview for {path}: {e}")
+            return path
+
+    def open(self, path, max_size=None):
+        """Preview as a PIL image"""
+        return Image.open(self.get(path, max_size)).convert('RGB')
+
+    def prune(self):
+        """Drop the least recently written previews beyond max_files"""
+        previews = []
+        for directory, _, names in os.walk(self.root):
+            previews.extend(os.path.join(directory, name) for name in names if name.endswith(".jpg"))
+        if len(previews) <= self.max_files:
+            return 0
+        previews.sort(key=os.path.getmtime)
+        for path in previews[:len(previews) - self.max_files]:
+            os.remove(path)
+        return len(previews) - self.max_files
+
+
+# Global instance
+preview_cache = PreviewCache()
@@ -0,0 +1,321 @@
+import os
+import numpy as np
+
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def kmeans(vectors, num_clusters, iterations=10, seed=0, sample_size=20000):
+    """Euclidean k-means centroids (Lloyd's algorithm on a sample)"""
+    rng = np.random.RandomState(seed)
+    if len(vectors) > sample_size:
+        vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), num_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        distances = (np.sum(vectors ** 2, axis=1, keepdims=True) - 2 * vectors @ centroids.T
+                     + np.sum(centroids ** 2, axis=1))
+        assignments = distances.argmin(axis=1)
+        for cluster in range(num_clusters):
+            members = vectors[assignments == cluster]
+            if len(members):
+                centroids[cluster] = members.mean(axis=0)
+    return centroids
+
+
+class PCAProjection:
+    """Mean-centred PCA (optionally whitened) from raw fingerprints to a few unit-norm dims"""
+
+    def __init__(self, mean=None, components=None, scale=None):
+        self.mean = mean                # (D,)
+        self.components = components    # (D, d)
+        self.scale = scale              # (d,) 1/sqrt(eigenvalue) when whitening, else ones
+
+    def fit(self, vectors, dim=128, whiten=True):
+        vectors = normalize_rows(vectors)
+        self.mean = vectors.mean(axis=0)
+        centred = vectors - self.mean
+        # Thin SVD of the centred catalogue: right singular vectors are the principal axes
+        _, singular_values, vt = np.linalg.svd(centred, full_matrices=False)
+        dim = min(dim, vt.shape[0])
+        self.components = vt[:dim].T.astype(np.float32)
+        variance = singular_values[:dim] ** 2 / max(len(vectors) - 1, 1)
+        self.scale = (1.0 / np.sqrt(variance + 1e-6) if whiten else np.ones(dim)).astype(np.float32)
+        return self
+
+    @property
+    def dim(self):
+        return self.components.shape[1]
+
+    def transform(self, vectors):
+        projected = (normalize_rows(vectors) - self.mean) @ self.components * self.scale
+        return normalize_rows(projected)
+
+
+class Float32Codec:
+    """Uncompressed projected vectors"""
+    name = "float32"
+
+    def fit(self, vectors):
+        return self
+
+    def encode(self, vectors):
+        return np.asarray(vectors, dtype=np.float32)
+
+    def scores(self, codes, query):
+        return codes @ query
+
+    def arrays(self):
+        return {}
+
+    def load_arrays(self, arrays):
+        return self
+
+
+class Int8Codec:
+    """Symmetric per-dimension int8 scalar quantisation"""
+    name = "int8"
+
+    def __init__(self):
+        self.scale = None
+
+    def fit(self, vectors):
+        self.scale = np.maximum(np.abs(vectors).max(axis=0), 1e-6).astype(np.float32) / 127.0
+        return self
+
+    def encode(self, vectors):
+        return np.clip(np.round(vectors / self.scale), -127, 127).astype(np.int8)
+
+    def scores(self, codes, query):
+        # Fold the per-dimension scale into the query instead of dequantising every row
+        return codes.astype(np.float32) @ (query * self.scale)
+
+    def arrays(self):
+        return {'int8_scale': self.scale}
+
+    def load_arrays(self, arrays):
+        self.scale = arrays['int8_scale']
+        return self
+
+
+class PQCodec:
+    """Product quantisation: one byte per subspace, scored with asymmetric distance tables"""
+    name = "pq"
+
+    def __init__(self, num_subspaces=16, num_centroids=256):
+        self.num_subspaces = num_subspaces
+        self.num_centroids = num_centroids
+        self.codebooks = None           # (m, k, d/m)
+
+    def _split(self, vectors):
+        return np.split(np.asarray(vectors, dtype=np.float32), self.num_subspaces, axis=1)
+
+    def fit(self, vectors):
+        if vectors.shape[1] % self.num_subspaces:
+            raise ValueError(f"PQ needs the dimension ({vectors.shape[1]}) divisible by {self.num_subspaces} subspaces")
+        num_centroids = min(self.num_centroids, len(vectors))
+        self.codebooks = np.stack([kmeans(part, num_centroids, seed=i) for i, part in enumerate(self._split(vectors))])
+        return self
+
+    def encode(self, vectors):
+        codes = np.empty((len(vectors), self.num_subspaces), dtype=np.uint8)
+        for i, part in enumerate(self._split(vectors)):
+            codebook = self.codebooks[i]
+            distances = np.sum(codebook ** 2, axis=1) - 2 * part @ codebook.T
+            codes[:, i] = distances.argmin(axis=1)
+        return codes
+
+    def scores(self, codes, query):
+        # table[i, c] = <query subvector i, centroid c>; a row's score is a sum of lookups
+        table = np.einsum('mkd,md->mk', self.codebooks, query.reshape(self.num_subspaces, -1))
+        return table[np.arange(self.num_subspaces), codes].sum(axis=1)
+
+    def arrays(self):
+        return {'pq_codebooks': self.codebooks}
+
+    def load_arrays(self, arrays):
+        self.codebooks = arrays['pq_codebooks']
+        self.num_subspaces, self.num_centroids = self.codebooks.shape[:2]
+        return self
+
+
+def make_codec(name, pq_subspaces=16):
+    if name == "float32":
+        return Float32Codec()
+    if name == "int8":
+        return Int8Codec()
+    if name == "pq":
+        return PQCodec(pq_subspaces)
+    raise ValueError(f"Unknown codec: {name}")
+
+
+class CompressedIndex:
+    """Catalogue-wide compact copy of the fingerprints for fast brute-force search
+
+    Raw fingerprints are projected with a PCA fitted on the catalogue and
+    stored as float32, int8 or PQ codes. Queries go through the same
+    projection, so scores are cosines in the projected (centred, optionally
+    whitened) space rather than raw-fingerprint cosines.
+    """
+
+    def __init__(self, index_file):
+        self.index_file = index_file
+        self.projection = None
+        self.codec = None
+        self.ids = []
+        self.codes = None
+        self._rows = None
+        self.loaded = False
+        self.dirty = False
+
+    @property
+    def fitted(self):
+        self.load()
+        return self.projection is not None
+
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            with np.load(self.index_file) as data:
+                arrays = {name: data[name] for name in data.files}
+            self.projection = PCAProjection(arrays['pca_mean'], arrays['pca_components'], arrays['pca_scale'])
+            self.codec = make_codec(str(arrays['codec'])).load_arrays(arrays)
+            self.ids = [str(image_id) for image_id in arrays['ids']]
+            self.codes = arrays['codes']
+        except Exception as e:
+            print(f"Error loading compressed index: {e}")
+            self.projection, self.codec, self.ids, self.codes = None, None, [], None
+        self._rows = None
+
+    def save(self):
+        if not self.dirty:
+            return
+        if self.projection is None:
+            if os.path.exists(self.index_file):
+                os.remove(self.index_file)
+        else:
+            tmp_path = f"{self.index_file}.tmp.npz"
+            np.savez(tmp_path, codec=np.array(self.codec.name), ids=np.array(self.ids), codes=self.codes,
+                     pca_mean=self.projection.mean, pca_components=self.projection.components,
+                     pca_scale=self.projection.scale, **self.codec.arrays())
+            os.replace(tmp_path, self.index_file)
+        self.dirty = False
+
+    def fit(self, ids, vectors, dim=128, whiten=True, codec="int8", pq_subspaces=16):
+        """Fit the projection and codec on the catalogue and encode it"""
+        self.loaded = True
+        self.projection = PCAProjection().fit(vectors, dim, whiten)
+        projected = self.projection.transform(vectors)
+        self.codec = make_codec(codec, pq_subspaces).fit(projected)
+        self.ids = list(ids)
+        self.codes = self.codec.encode(projected)
+        self._rows = None
+        self.dirty = True
+        return self
+
+    def settings(self):
+        """Keyword arguments that refit the current model (e.g. after re-embedding the catalogue)"""
+        settings = {'dim': self.projection.dim, 'codec': self.codec.name,
+                    'whiten': not np.allclose(self.projection.scale, 1.0)}
+        if self.codec.name == "pq":
+            settings['pq_subspaces'] = self.codec.num_subspaces
+        return settings
+
+    def drop(self):
+        """Forget the fitted model and codes (search falls back to the raw shards)"""
+        self.loaded = True
+        self.projection, self.codec, self.ids, self.codes, self._rows = None, None, [], None, None
+        self.dirty = True
+
+    def add(self, ids, vectors):
+        """Encode new entries with the existing model (replacing ids already present)"""
+        if not self.fitted:
+            return
+        for image_id in ids:
+            self.remove(image_id)
+        codes = self.codec.encode(self.projection.transform(vectors))
+        self.ids.extend(ids)
+        self.codes = np.concatenate([self.codes, codes]) if self.codes is not None else codes
+        self._rows = None
+        self.dirty = True
+
+    def remove(self, image_id):
+        if not self.fitted:
+            return
+        row = self.row_of(image_id)
+        if row is None:
+            return
+        del self.ids[row]
+        self.codes = np.delete(self.codes, row, axis=0)
+        self._rows = None
+        self.dirty = True
+
+    def clear(self):
+        """Remove every entry but keep the fitted model"""
+        self.load()
+        if self.projection is not None:
+            self.ids, self.codes, self._rows = [], self.codes[:0], None
+            self.dirty = True
+
+    def row_of(self, image_id):
+        if self._rows is None:
+            self._rows = {image_id: row for row, image_id in enumerate(self.ids)}
+        return self._rows.get(image_id)
+
+    def search(self, query_fp, top_k, ids=None):
+        """Top (score, image_id) pairs; ids restricts scoring to a pre-filtered subset"""
+        if not self.fitted or not len(self.ids):
+            return []
+        query = self.projection.transform(np.asarray(query_fp, dtype=np.float32).reshape(1, -1))[0]
+        if ids is not None:
+            rows = np.array(sorted(row for row in (self.row_of(image_id) for image_id in ids) if row is not None),
+                            dtype=np.int64)
+            if not len(rows):
+                return []
+            scores = self.codec.scores(self.codes[rows], query)
+        else:
+            rows = None
+            scores = self.codec.scores(self.codes, query)
+
+        k = min(top_k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(float(scores[i]), self.ids[i if rows is None else rows[i]]) for i in best]
+
+    def bytes_per_entry(self):
+        return self.codes.nbytes / max(len(self.ids), 1) if self.codes is not None else 0
+
+
+def recall_report(ids, raw_vectors, index, query_vectors, k=10):
+    """Recall@k of the compressed index against exact raw-cosine top-k, plus memory and speed"""
+    import time
+
+    k = min(k, len(ids))
+    raw_units = normalize_rows(raw_vectors)
+    queries = normalize_rows(query_vectors)
+
+    start = time.time()
+    exact = [set(ids[i] for i in np.argpartition(-(raw_units @ query), k - 1)[:k]) for query in queries]
+    raw_seconds = time.time() - start
+
+    start = time.time()
+    approximate = [set(image_id for _, image_id in index.search(query, k)) for query in queries]
+    compressed_seconds = time.time() - start
+
+    recall = float(np.mean([len(a & e) / len(e) for a, e in zip(approximate, exact)])) if queries.size else 0.0
+    raw_bytes = raw_vectors.shape[1] * 4
+    return {
+        'k': k,
+        'queries': len(queries),
+        'recall_at_k': recall,
+        'raw_bytes_per_entry': raw_bytes,
+        'compressed_bytes_per_entry': index.bytes_per_entry(),
+        'memory_reduction': raw_bytes / max(index.bytes_per_entry(), 1e-9),
+        'raw_seconds': raw_seconds,
+        'compressed_seconds': compressed_seconds
+    }
@@ -0,0 +1,294 @@
+import hashlib
+import heapq
+import io
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+import numpy as np
+from blob_store import file_sha256
+from descriptors import pack_descriptors, unpack_descriptors
+
+
+class ResultStore:
+    """SQLite store of scan results, so re-scans only compute pairs involving new or changed entries
+
+    pairs holds one full analysis per (query content hash, database entry
+    id, model version), with the entry's content hash to notice replaced
+    images. queries holds each query's descriptors, so a re-scan needs no
+    forward pass for a query seen before. scans records, per query and scan
+    settings, when it was last scanned and its fingerprint candidates.
+    """
+
+    def __init__(self, db_path="copyscale_results.sqlite3"):
+        self.db_path = db_path
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS pairs (
+                    query_sha256 TEXT NOT NULL,
+                    entry_id TEXT NOT NULL,
+                    model_version TEXT NOT NULL,
+                    entry_sha256 TEXT,
+                    analysis TEXT NOT NULL,
+                    created_at REAL,
+                    PRIMARY KEY (query_sha256, entry_id, model_version)
+                )""")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS queries (
+                    query_sha256 TEXT NOT NULL,
+                    model_version TEXT NOT NULL,
+                    descriptors BLOB NOT NULL,
+                    PRIMARY KEY (query_sha256, model_version)
+                )""")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS scans (
+                    query_sha256 TEXT NOT NULL,
+                    scan_key TEXT NOT NULL,
+                    model_version TEXT NOT NULL,
+                    scanned_at REAL NOT NULL,
+                    candidates TEXT NOT NULL,
+                    PRIMARY KEY (query_sha256, scan_key, model_version)
+                )""")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        conn = self._connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def get_pairs(self, query_sha256, model_version, entry_ids):
+        """{entry_id: (entry_sha256, analysis)} for the stored pairs among entry_ids"""
+        entry_ids = list(entry_ids)
+        pairs = {}
+        with self._connection() as conn:
+            for first in range(0, len(entry_ids), 500):
+                chunk = entry_ids[first:first + 500]
+                rows = conn.execute(f"SELECT entry_id, entry_sha256, analysis FROM pairs WHERE query_sha256 = ? "
+                                    f"AND model_version = ? AND entry_id IN ({','.join('?' * len(chunk))})",
+                                    [query_sha256, model_version] + chunk).fetchall()
+                for row in rows:
+                    pairs[row['entry_id']] = (row['entry_sha256'], json.loads(row['analysis']))
+        return pairs
+
+    def put_pairs(self, query_sha256, model_version, pairs):
+        """Store [(entry_id, entry_sha256, analysis)], replacing earlier analyses of those pairs"""
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute("BEGIN")
+            conn.executemany("INSERT OR REPLACE INTO pairs VALUES (?, ?, ?, ?, ?, ?)",
+                             [(query_sha256, entry_id, model_version, entry_sha256, json.dumps(analysis), now)
+                              for entry_id, entry_sha256, analysis in pairs])
+            conn.execute("COMMIT")
+
+    def get_query_descriptors(self, query_sha256, model_version):
+        with self._connection() as conn:
+            row = conn.execute("SELECT descriptors FROM queries WHERE query_sha256 = ? AND model_version = ?",
+                               (query_sha256, model_version)).fetchone()
+        if row is None:
+            return None
+        with np.load(io.BytesIO(row['descriptors'])) as data:
+            return unpack_descriptors({name: data[name] for name in data.files})
+
+    def put_query_descriptors(self, query_sha256, model_version, descriptors, dtype="float16"):
+        buffer = io.BytesIO()
+        np.savez(buffer, **pack_descriptors({name: vector for name, vector in descriptors.items()
+                                             if name != 'tiles'}, dtype))
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO queries VALUES (?, ?, ?)",
+                         (query_sha256, model_version, buffer.getvalue()))
+
+    def get_scan(self, query_sha256, scan_key, model_version):
+        """{'scanned_at', 'candidates': [[similarity, entry_id, entry_sha256], ...]} or None"""
+        with self._connection() as conn:
+            row = conn.execute("SELECT scanned_at, candidates FROM scans WHERE query_sha256 = ? AND scan_key = ? "
+                               "AND model_version = ?", (query_sha256, scan_key, model_version)).fetchone()
+        if row is None:
+            return None
+        return {'scanned_at': row['scanned_at'], 'candidates': json.loads(row['candidates'])}
+
+    def put_scan(self, query_sha256, scan_key, model_version, scanned_at, candidates):
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO scans VALUES (?, ?, ?, ?, ?)",
+                         (query_sha256, scan_key, model_version, scanned_at, json.dumps(candidates)))
+
+    def prune(self, model_version):
+        """Delete everything computed under other model versions; returns the pairs removed"""
+        with self._connection() as conn:
+            removed = conn.execute("DELETE FROM pairs WHERE model_version != ?", (model_version,)).rowcount
+            conn.execute("DELETE FROM queries WHERE model_version != ?", (model_version,))
+            conn.execute("DELETE FROM scans WHERE model_version != ?", (model_version,))
+        return removed
+
+    def stats(self):
+        with self._connection() as conn:
+            return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                    for table in ('pairs', 'queries', 'scans')}
+
+
+def scan_key(db, top_k, min_similarity, filters):
+    """Identifies the database and settings a scan's candidate list depends on"""
+    spec = json.dumps({'db': os.path.abspath(db.db_file), 'top_k': top_k, 'min_similarity': min_similarity,
+                       'filters': filters}, sort_keys=True, default=list)
+    return hashlib.sha1(spec.encode('utf-8')).hexdigest()
+
+
+def scan_image_incremental(db, store, query_path, options, progress):
+    """scan_image that reuses stored work and only computes pairs with new or changed entries
+
+    The fingerprint search only covers entries added since the query was
+    last scanned with the same settings (re-added entries count as new);
+    stored candidates that were removed or replaced drop out. Candidates
+    are kept to twice top_k, so removals can be absorbed without searching
+    the whole database again. Analyses of pairs already in the store are
+    re-scored with the current score model; only the rest need descriptors,
+    and the query's own descriptors are stored after its first scan. Partial
+    matches (options['partial']) are not incremental and run as before.
+    """
+    from analyzer import analyzer
+    from scoring import rescore
+
+    started_at = time.time()
+    db.refresh()        # entries added by other processes since the last scan
+    version = analyzer.descriptor_version
+    top_k = options.get('top_k', 3)
+    min_similarity = options.get('min_similarity', 0.3)
+    filters = dict(options.get('filters', {}))
+    key = scan_key(db, top_k, min_similarity, filters)
+    query_sha256 = file_sha256(query_path)
+
+    progress(0.1, "Loading stored results")
+    query_descriptors = store.get_query_descriptors(query_sha256, version)
+    extracted = query_descriptors is None
+    if extracted:
+        query_descriptors = analyzer.extract_descriptors([query_path])[0]
+        if query_descriptors is None:
+            raise ValueError(f"Could not read {query_path}")
+        store.put_query_descriptors(query_sha256, version, query_descriptors, db.descriptor_dtype)
+
+    def current_sha256(image_id):
+        shard_id = db.index.shard_of(image_id)
+        if shard_id is None:
+            return None
+        return db.get_shard(shard_id).entries[image_id].get('sha256', '')
+
+    pool_size = top_k * 2
+    previous = store.get_scan(query_sha256, key, version)
+    full_search = previous is None
+    kept = []
+    if previous is not None:
+        # Entries removed or replaced since the last scan drop out
+        kept = [candidate for candidate in previous['candidates'] if current_sha256(candidate[1]) == candidate[2]]
+        full_search = len(kept) < top_k and len(previous['candidates']) >= pool_size
+
+    progress(0.3, "Searching new and changed entries" if not full_search else "Searching database")
+    search_filters = dict(filters)
+    if not full_search:
+        since = previous['scanned_at']
+        search_filters['added_after'] = max(since, filters.get('added_after') or since)
+    hits = db.search_candidates(query_descriptors['final'], pool_size, min_similarity, **search_filters)
+    new = {image_id: [float(similarity), image_id, current_sha256(image_id)] for similarity, image_id, _ in hits}
+    candidates = heapq.nlargest(pool_size, [c for c in kept if c[1] not in new] + list(new.values()),
+                                key=lambda candidate: candidate[0])
+
+    top = candidates[:top_k]
+    stored = store.get_pairs(query_sha256, version, [candidate[1] for candidate in top])
+    reused = {image_id: analysis for image_id, (entry_sha256, analysis) in stored.items()
+              if entry_sha256 == current_sha256(image_id)}
+    missing = [candidate for candidate in top if candidate[1] not in reused]
+
+    progress(0.6, f"Analysing {len(missing)} new pairs")
+    computed = {}
+    if missing:
+        entries = [db.get_shard(db.index.shard_of(image_id)).entries[image_id] for _, image_id, _ in missing]
+        analyses = analyzer.run_batch_analysis(query_descriptors,
+                                               [db.get_reference_descriptors(entry) for entry in entries])
+        computed = {candidate[1]: analysis for candidate, analysis in zip(missing, analyses)}
+        store.put_pairs(query_sha256, version, [(candidate[1], candidate[2], computed[candidate[1]])
+                                                for candidate in missing])
+    rescore(list(reused.values()))
+    store.put_scan(query_sha256, key, version, started_at, candidates)
+
+    matches = []
+    for similarity, image_id, _ in top:
+        data = db.get_shard(db.index.shard_of(image_id)).entries[image_id]
+        matches.append({
+            'image_id': image_id,
+            'similarity': similarity,
+            'title': data['title'],
+            'owner': data['owner'],
+            'description': data['description'],
+            'path': db.reference_path(data),
+            'thumbnail': data.get('thumbnail'),
+            'full_analysis': computed.get(image_id) or reused[image_id]
+        })
+    result = {'matches': matches,
+              'incremental': {'computed': len(computed), 'reused': len(reused), 'searched': len(hits),
+                              'full_search': full_search, 'query_extracted': extracted}}
+    if options.get('partial'):
+        progress(0.8, "Searching for crops and partial copies")
+        result['partial_matches'] = db.search_partial_matches(query_path, top_k=top_k)
+    return result
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Incremental scans against stored results")
+    parser.add_argument("--store", default="copyscale_results.sqlite3")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    sweep_parser = subparsers.add_parser("sweep", help="scan a library of suspect images, reusing earlier results")
+    sweep_parser.add_argument("sources", nargs="+", help="image files or directories")
+    sweep_parser.add_argument("--db", default="copyright_database.json")
+    sweep_parser.add_argument("--top-k", type=int, default=3)
+    sweep_parser.add_argument("--out", help="write the results as JSON here")
+
+    subparsers.add_parser("stats", help="count stored pairs, queries and scans")
+    prune_parser = subparsers.add_parser("prune", help="drop results from other model versions")
+    args = parser.parse_args()
+
+    store = ResultStore(args.store)
+    if args.command == "stats":
+        print(store.stats())
+    elif args.command == "prune":
+        from analyzer import analyzer
+        print(f"Removed {store.prune(analyzer.descriptor_version)} pairs from other model versions")
+    else:
+        from copyright_db import CopyrightDatabase, IMAGE_EXTENSIONS
+
+        db = CopyrightDatabase(args.db)
+        paths = []
+        for source in args.sources:
+            if os.path.isdir(source):
+                paths.extend(sorted(os.path.join(root, name) for root, _, names in os.walk(source)
+                                    for name in names if name.lower().endswith(IMAGE_EXTENSIONS)))
+            else:
+                paths.append(source)
+
+        start = time.time()
+        results, totals = {}, {'computed': 0, 'reused': 0, 'extracted': 0}
+        for path in paths:
+            try:
+                result = scan_image_incremental(db, store, path, {'top_k': args.top_k},
+                                                lambda fraction, message="": None)
+            except Exception as e:
+                print(f"❌ {path}: {e}")
+                continue
+            results[path] = result
+            totals['computed'] += result['incremental']['computed']
+            totals['reused'] += result['incremental']['reused']
+            totals['extracted'] += result['incremental']['query_extracted']
+        print(f"Swept {len(results)} images in {time.time() - start:.1f}s: {totals['computed']} pairs computed, "
+              f"{totals['reused']} reused, {totals['extracted']} queries described")
+        if args.out:
+            with open(args.out, 'w') as f:
+                json.dump(results, f, indent=2, default=float)
@@ -0,0 +1,695 @@
+import hashlib
+import hmac
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import traceback
+import urllib.parse
+import urllib.request
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from blob_store import BlobStore
+from memory_budget import memory_budget
+from shards import FingerprintShard, file_lock
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+# Shared secret the HTTP API requires (Authorization: Bearer <token>) and clients send
+TOKEN_ENV = "COPYSCALE_COORDINATOR_TOKEN"
+
+
+def manifest_sha256(db_file):
+    with open(db_file, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def snapshot_database(db_file, snapshot_dir):
+    """Copy a database's manifest, shards and indexes into snapshot_dir for read-only scanning
+
+    The copy is taken under the database's lock file, so no save lands
+    halfway through it. Blobs (reference images and descriptors) are not
+    copied: the snapshot points at the live blob store and pins every blob
+    it references, so content removed from the live database meanwhile
+    keeps its blobs until release_snapshot. Returns {'db_file', 'blob_dir',
+    'manifest_sha256', 'pin'}.
+    """
+    stem = os.path.splitext(db_file)[0]
+    snapshot_file = os.path.join(snapshot_dir, os.path.basename(db_file))
+    snapshot_stem = os.path.splitext(snapshot_file)[0]
+    pin = os.path.basename(os.path.normpath(snapshot_dir))
+    os.makedirs(snapshot_dir, exist_ok=True)
+    with file_lock(stem + ".lock"):
+        shutil.copy2(db_file, snapshot_file)
+        if os.path.isdir(stem + "_shards"):
+            shutil.copytree(stem + "_shards", snapshot_stem + "_shards", dirs_exist_ok=True)
+        for suffix in ("_index.json", "_tiles.npz", "_compressed.npz", "_videos.json", "_videos.npz"):
+            if os.path.exists(stem + suffix):
+                shutil.copy2(stem + suffix, snapshot_stem + suffix)
+        BlobStore(stem + "_blobs").pin(pin, referenced_blobs(snapshot_file))
+    return {'db_file': os.path.abspath(snapshot_file), 'blob_dir': os.path.abspath(stem + "_blobs"),
+            'manifest_sha256': manifest_sha256(snapshot_file), 'pin': pin}
+
+
+def referenced_blobs(db_file):
+    """Content hashes of every reference image and video a database's manifest points at"""
+    stem = os.path.splitext(db_file)[0]
+    with open(db_file, 'r') as f:
+        manifest = json.load(f)
+    hashes = set()
+    for shard_id in manifest.get('shards', {}):
+        hashes.update(entry['sha256'] for entry in FingerprintShard(stem + "_shards", shard_id).entries.values()
+                      if entry.get('sha256'))
+    if os.path.exists(stem + "_videos.json"):
+        with open(stem + "_videos.json", 'r') as f:
+            hashes.update(video['sha256'] for video in json.load(f)['videos'].values() if video.get('sha256'))
+    return hashes
+
+
+def release_snapshot(snapshot):
+    """Delete a snapshot's files and release its blob pin, carrying out the deletions it deferred"""
+    if snapshot.get('pin'):
+        BlobStore(snapshot['blob_dir']).unpin(snapshot['pin'])
+    shutil.rmtree(os.path.dirname(snapshot['db_file']), ignore_errors=True)
+
+
+def collect_media(sources):
+    """Image and video paths from a directory (recursively) or a list of paths/directories"""
+    if isinstance(sources, str):
+        sources = [sources]
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            for root, _, files in os.walk(source):
+                paths.extend(os.path.join(root, name) for name in sorted(files))
+        else:
+            paths.append(source)
+    return [os.path.abspath(path) for path in paths
+            if path.lower().endswith(IMAGE_EXTENSIONS + VIDEO_EXTENSIONS)]
+
+
+class ScanCoordinator:
+    """Splits scans into leased work units and merges the workers' results
+
+    State lives in SQLite, like the job queue. A worker leases one unit at a
+    time; a lease that is not completed or renewed within lease_seconds goes
+    back to the pool, and a unit that has failed or expired max_attempts
+    times is marked failed rather than retried forever. With roots, scans
+    may only read inputs and databases inside those directories.
+    """
+
+    def __init__(self, db_path="copyscale_scans.sqlite3", snapshots_dir="copyscale_snapshots",
+                 lease_seconds=300, max_attempts=3, roots=None):
+        self.db_path = db_path
+        self.roots = [os.path.realpath(root) for root in roots] if roots is not None else None
+        self.snapshots_dir = snapshots_dir
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.workers = {}               # worker id -> time of its last lease request
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS scans (
+                    id TEXT PRIMARY KEY,
+                    options TEXT NOT NULL,
+                    snapshot TEXT NOT NULL,
+                    created_at REAL
+                )""")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS units (
+                    id TEXT PRIMARY KEY,
+                    scan_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    paths TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER DEFAULT 0,
+                    worker TEXT,
+                    lease_token TEXT,
+                    lease_expires REAL,
+                    result TEXT,
+                    error TEXT,
+                    finished_at REAL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS units_status ON units (status, scan_id)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        conn = self._connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def create_scan(self, sources, db_file="copyright_database.json", options=None, images_per_unit=8):
+        """Snapshot the database and queue one unit per video and per images_per_unit images
+
+        options are the image_scan/video_scan payload options (top_k,
+        filters, partial, cascade_backbone, temporal). Returns the scan id.
+        """
+        for path in ([sources] if isinstance(sources, str) else list(sources)) + [db_file]:
+            self.check_path(path)
+        paths = collect_media(sources)
+        for path in paths:
+            self.check_path(path)
+        if not paths:
+            raise ValueError("No images or videos to scan")
+        scan_id = uuid.uuid4().hex[:12]
+        snapshot = snapshot_database(db_file, os.path.join(self.snapshots_dir, scan_id))
+
+        images = [path for path in paths if path.lower().endswith(IMAGE_EXTENSIONS)]
+        units = [('image', images[start:start + images_per_unit]) for start in range(0, len(images), images_per_unit)]
+        units += [('video', [path]) for path in paths if path.lower().endswith(VIDEO_EXTENSIONS)]
+
+        with self._connection() as conn:
+            conn.execute("BEGIN")
+            conn.execute("INSERT INTO scans (id, options, snapshot, created_at) VALUES (?, ?, ?, ?)",
+                         (scan_id, json.dumps(options or {}), json.dumps(snapshot), time.time()))
+            conn.executemany("INSERT INTO units (id, scan_id, kind, paths, status) VALUES (?, ?, ?, ?, 'pending')",
+                             [(f"{scan_id}-{i:05d}", scan_id, kind, json.dumps(unit_paths))
+                              for i, (kind, unit_paths) in enumerate(units)])
+            conn.execute("COMMIT")
+        return scan_id
+
+    def check_path(self, path):
+        """Raise PermissionError unless path (symlinks resolved) is inside one of the roots"""
+        if self.roots is None:
+            return
+        real = os.path.realpath(path)
+        if not any(os.path.commonpath([real, root]) == root for root in self.roots):
+            raise PermissionError(f"{path} is outside the directories this coordinator may read")
+
+    def lease(self, worker):
+        """Atomically hand the next pending (or lease-expired) unit to a worker, or return None"""
+        now = time.time()
+        self.workers[worker] = now
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Expired leases that have used up their attempts are given up on
+            conn.execute("UPDATE units SET status = 'failed', error = 'lease expired', finished_at = ? "
+                         "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                         (now, now, self.max_attempts))
+            row = conn.execute("SELECT units.*, scans.options, scans.snapshot FROM units "
+                               "JOIN scans ON scans.id = units.scan_id "
+                               "WHERE units.status = 'pending' OR (units.status = 'leased' AND units.lease_expires < ?) "
+                               "ORDER BY scans.created_at, units.id LIMIT 1", (now,)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            token = uuid.uuid4().hex
+            conn.execute("UPDATE units SET status = 'leased', attempts = attempts + 1, worker = ?, "
+                         "lease_token = ?, lease_expires = ? WHERE id = ?",
+                         (worker, token, now + self.lease_seconds, row['id']))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return {'unit_id': row['id'], 'scan_id': row['scan_id'], 'kind': row['kind'],
+                'paths': json.loads(row['paths']), 'options': json.loads(row['options']),
+                'snapshot': json.loads(row['snapshot']), 'lease_token': token,
+                'lease_seconds': self.lease_seconds, 'attempt': row['attempts'] + 1}
+
+    def heartbeat(self, unit_id, token):
+        """Extend a lease; returns False if the lease has been lost (expired and re-leased)"""
+        with self._connection() as conn:
+            return conn.execute("UPDATE units SET lease_expires = ? WHERE id = ? AND lease_token = ? "
+                                "AND status = 'leased'",
+                                (time.time() + self.lease_seconds, unit_id, token)).rowcount == 1
+
+    def complete(self, unit_id, token, result):
+        """Store a unit's result; results from a stale lease are ignored (returns False)"""
+        with self._connection() as conn:
+            return conn.execute("UPDATE units SET status = 'done', result = ?, error = NULL, finished_at = ? "
+                                "WHERE id = ? AND lease_token = ? AND status = 'leased'",
+                                (json.dumps(result), time.time(), unit_id, token)).rowcount == 1
+
+    def fail(self, unit_id, token, error):
+        """Return a unit to the pool for another attempt, or mark it failed after max_attempts"""
+        with self._connection() as conn:
+            return conn.execute("UPDATE units SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                                "error = ?, lease_token = NULL, finished_at = ? "
+                                "WHERE id = ? AND lease_token = ? AND status = 'leased'",
+                                (self.max_attempts, error, time.time(), unit_id, token)).rowcount == 1
+
+    def status(self, scan_id):
+        """Unit counts by status, plus whether the scan has finished"""
+        with self._connection() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM units WHERE scan_id = ? GROUP BY status",
+                                (scan_id,)).fetchall()
+        counts = {row['status']: row['n'] for row in rows}
+        total = sum(counts.values())
+        finished = counts.get('done', 0) + counts.get('failed', 0)
+        return {'scan_id': scan_id, 'units': total, 'counts': counts,
+                'progress': finished / total if total else 0.0, 'finished': total > 0 and finished == total}
+
+    def results(self, scan_id):
+        """Merged per-file results of a scan, highest-risk files first, plus failed units"""
+        with self._connection() as conn:
+            rows = conn.execute("SELECT kind, paths, status, result, error FROM units WHERE scan_id = ? ORDER BY id",
+                                (scan_id,)).fetchall()
+        items, failed = [], []
+        for row in rows:
+            if row['status'] == 'done':
+                items.extend(json.loads(row['result'])['items'])
+            elif row['status'] == 'failed':
+                failed.append({'kind': row['kind'], 'paths': json.loads(row['paths']),
+                               'error': (row['error'] or '').splitlines()[0] if row['error'] else ''})
+
+        risk_order = {'HIGH': 0, 'MEDIUM': 1, 'LOW': 2}
+        items.sort(key=lambda item: (risk_order.get(item.get('risk_level'), 3), -item.get('best_similarity', 0.0)))
+        summary = {level: sum(1 for item in items if item.get('risk_level') == level) for level in risk_order}
+        return {'scan_id': scan_id, 'items': items, 'failed': failed, 'summary': summary}
+
+    def delete_scan(self, scan_id):
+        """Forget a scan and its results, and release its database snapshot; returns False if unknown"""
+        with self._connection() as conn:
+            row = conn.execute("SELECT snapshot FROM scans WHERE id = ?", (scan_id,)).fetchone()
+            if row is None:
+                return False
+            conn.execute("BEGIN")
+            conn.execute("DELETE FROM units WHERE scan_id = ?", (scan_id,))
+            conn.execute("DELETE FROM scans WHERE id = ?", (scan_id,))
+            conn.execute("COMMIT")
+        release_snapshot(json.loads(row['snapshot']))
+        return True
+
+    def is_scan_path(self, path):
+        """True if path is an input of some unit (the only files the HTTP server will serve)"""
+        with self._connection() as conn:
+            return conn.execute("SELECT 1 FROM units WHERE instr(paths, ?) > 0 LIMIT 1",
+                                (json.dumps(path),)).fetchone() is not None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    coordinator = None
+    token = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _authorized(self):
+        """Check the shared token (if one is configured), answering 401 when it is missing or wrong"""
+        if self.token is None or hmac.compare_digest(self.headers.get('Authorization', ''), f"Bearer {self.token}"):
+            return True
+        self._send_json({'error': 'unauthorized'}, 401)
+        return False
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        url = urllib.parse.urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+        try:
+            if parts[0] == 'scans' and len(parts) == 2:
+                self._send_json(self.coordinator.status(parts[1]))
+            elif parts[0] == 'scans' and len(parts) == 3 and parts[2] == 'results':
+                self._send_json(self.coordinator.results(parts[1]))
+            elif parts[0] == 'files':
+                # Media for workers without a shared filesystem
+                path = urllib.parse.parse_qs(url.query).get('path', [''])[0]
+                self.coordinator.check_path(path)
+                if not self.coordinator.is_scan_path(path) or not os.path.exists(path):
+                    self._send_json({'error': 'not found'}, 404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Length', str(os.path.getsize(path)))
+                self.end_headers()
+                with open(path, 'rb') as f:
+                    shutil.copyfileobj(f, self.wfile)
+            else:
+                self._send_json({'error': 'not found'}, 404)
+        except PermissionError as e:
+            self._send_json({'error': str(e)}, 403)
+        except Exception as e:
+            self._send_json({'error': str(e)}, 500)
+
+    def do_DELETE(self):
+        if not self._authorized():
+            return
+        parts = self.path.strip('/').split('/')
+        try:
+            if parts[0] == 'scans' and len(parts) == 2:
+                self._send_json({'ok': self.coordinator.delete_scan(parts[1])})
+            else:
+                self._send_json({'error': 'not found'}, 404)
+        except Exception as e:
+            self._send_json({'error': str(e)}, 500)
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        parts = self.path.strip('/').split('/')
+        try:
+            data = self._read_json()
+            if parts == ['scans']:
+                scan_id = self.coordinator.create_scan(data['sources'], data.get('db_file', "copyright_database.json"),
+                                                       data.get('options'), data.get('images_per_unit', 8))
+                self._send_json({'scan_id': scan_id})
+            elif parts == ['lease']:
+                self._send_json({'unit': self.coordinator.lease(data.get('worker', 'anonymous'))})
+            elif parts[0] == 'units' and len(parts) == 3:
+                unit_id, action = parts[1], parts[2]
+                if action == 'heartbeat':
+                    ok = self.coordinator.heartbeat(unit_id, data['lease_token'])
+                elif action == 'complete':
+                    ok = self.coordinator.complete(unit_id, data['lease_token'], data['result'])
+                elif action == 'fail':
+                    ok = self.coordinator.fail(unit_id, data['lease_token'], data.get('error', ''))
+                else:
+                    self._send_json({'error': 'not found'}, 404)
+                    return
+                self._send_json({'ok': ok})
+            else:
+                self._send_json({'error': 'not found'}, 404)
+        except PermissionError as e:
+            self._send_json({'error': str(e)}, 403)
+        except Exception as e:
+            self._send_json({'error': str(e)}, 500)
+
+
+def serve(coordinator, host="127.0.0.1", port=8765, token=None):
+    """Start the coordinator's HTTP API on a background thread; returns the server
+
+    token (default: $COPYSCALE_COORDINATOR_TOKEN) is required from every
+    client when set.
+    """
+    token = token or os.environ.get(TOKEN_ENV)
+    handler = type('CoordinatorHandler', (_Handler,), {'coordinator': coordinator, 'token': token})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="copyscale-coordinator", daemon=True).start()
+    return server
+
+
+def _headers():
+    token = os.environ.get(TOKEN_ENV)
+    return {'Authorization': f"Bearer {token}"} if token else {}
+
+
+def _request(url, data=None, timeout=60, method=None):
+    body = json.dumps(data).encode('utf-8') if data is not None else None
+    request = urllib.request.Request(url, data=body, headers=dict(_headers(), **{'Content-Type': 'application/json'}),
+                                     method=method)
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def summarize_item(path, kind, result):
+    """Attach the overall risk and best similarity used to rank merged results"""
+    if kind == 'image':
+        matches = result['matches']
+    else:
+        matches = [match for frame in result['frames'] for match in frame['top_matches']]
+    levels = [match['full_analysis']['risk_level'] for match in matches]
+    risk_level = next((level for level in ('HIGH', 'MEDIUM') if level in levels), 'LOW')
+    return dict(result, path=path, kind=kind, risk_level=risk_level,
+                best_similarity=max((match['similarity'] for match in matches), default=0.0))
+
+
+class ScanWorker:
+    """Pulls units from a coordinator and scans them against the unit's database snapshot
+
+    db_file overrides the snapshot path for nodes that hold their own copy
+    of the snapshot; its manifest must match the snapshot's checksum. Input
+    files that are not visible locally are downloaded from the coordinator.
+    Requests carry the shared token from $COPYSCALE_COORDINATOR_TOKEN.
+    """
+
+    def __init__(self, url, worker_id=None, db_file=None, blob_dir=None, poll_interval=2.0):
+        self.url = url.rstrip('/')
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.db_file = db_file
+        self.blob_dir = blob_dir
+        self.poll_interval = poll_interval
+        self._databases = {}
+        self._stop = threading.Event()
+
+    def database(self, snapshot):
+        """CopyrightDatabase for a snapshot, opened once per worker"""
+        from copyright_db import CopyrightDatabase
+
+        db_file = self.db_file or snapshot['db_file']
+        key = (db_file, snapshot['manifest_sha256'])
+        if key not in self._databases:
+            if manifest_sha256(db_file) != snapshot['manifest_sha256']:
+                raise ValueError(f"{db_file} does not match the scan's database snapshot")
+            self._databases[key] = CopyrightDatabase(db_file, blob_dir=self.blob_dir or snapshot['blob_dir'],
+                                                     read_only=True)
+        return self._databases[key]
+
+    def add_database(self, db):
+        """Serve units whose snapshot matches an already opened database (e.g. one preloaded before forking)"""
+        self._databases[(db.db_file, manifest_sha256(db.db_file))] = db
+
+    @contextmanager
+    def local_copy(self, path):
+        """The path itself if readable here, otherwise a temporary download from the coordinator"""
+        if os.path.exists(path):
+            yield path
+            return
+        suffix = os.path.splitext(path)[1]
+        fd, local_path = tempfile.mkstemp(prefix="copyscale_unit_", suffix=suffix)
+        try:
+            request = urllib.request.Request(f"{self.url}/files?path={urllib.parse.quote(path)}", headers=_headers())
+            with os.fdopen(fd, 'wb') as f, urllib.request.urlopen(request, timeout=300) as response:
+                shutil.copyfileobj(response, f)
+            yield local_path
+        finally:
+            if os.path.exists(local_path):
+                os.remove(local_path)
+
+    def process(self, unit):
+        """Scan every file of a unit; returns {'items': [...]}"""
+        from job_queue import scan_image, scan_video
+
+        db = self.database(unit['snapshot'])
+        items = []
+        for path in unit['paths']:
+            with self.local_copy(path) as local_path:
+                if unit['kind'] == 'image':
+                    result = scan_image(db, local_path, unit['options'], lambda fraction, message="": None)
+                else:
+                    with tempfile.TemporaryDirectory(prefix="copyscale_frames_") as frames_dir:
+                        result = scan_video(db, local_path, unit['options'], frames_dir,
+                                            lambda fraction, message="": None)
+            items.append(summarize_item(path, unit['kind'], result))
+        return {'items': items}
+
+    def run_unit(self, unit):
+        unit_url = f"{self.url}/units/{unit['unit_id']}"
+        token = {'lease_token': unit['lease_token']}
+
+        # Renew the lease at a third of its length while the unit is running
+        done = threading.Event()
+
+        def renew():
+            while not done.wait(unit['lease_seconds'] / 3):
+                try:
+                    if not _request(f"{unit_url}/heartbeat", token)['ok']:
+                        print(f"⚠️ Lost the lease on {unit['unit_id']}")
+                        return
+                except Exception as e:
+                    print(f"⚠️ Heartbeat for {unit['unit_id']} failed: {e}")
+
+        threading.Thread(target=renew, daemon=True).start()
+        try:
+            with memory_budget.task():
+                result = self.process(unit)
+            _request(f"{unit_url}/complete", dict(token, result=result))
+        except Exception as e:
+            print(f"❌ Unit {unit['unit_id']} failed: {e}")
+            try:
+                _request(f"{unit_url}/fail", dict(token, error=f"{e}\n{traceback.format_exc()}"))
+            except Exception as report_error:
+                # The coordinator re-leases the unit once its lease expires
+                print(f"⚠️ Could not report the failure of {unit['unit_id']}: {report_error}")
+        finally:
+            done.set()
+
+    def run(self, exit_when_idle=False):
+        """Lease and process units until stopped (or, with exit_when_idle, until none are left)"""
+        while not self._stop.is_set():
+            try:
+                unit = _request(f"{self.url}/lease", {'worker': self.worker_id})['unit']
+            except Exception as e:
+                print(f"⚠️ Coordinator unreachable: {e}")
+                unit = None
+            if unit is None:
+                if exit_when_idle:
+                    return
+                self._stop.wait(self.poll_interval)
+                continue
+            self.run_unit(unit)
+
+    def stop(self):
+        self._stop.set()
+
+
+def wait_for_scan(url, scan_id, poll_interval=1.0, timeout=None):
+    """Block until a scan has finished; returns its final status"""
+    start = time.time()
+    while True:
+        status = _request(f"{url.rstrip('/')}/scans/{scan_id}")
+        if status['finished'] or (timeout is not None and time.time() - start > timeout):
+            return status
+        time.sleep(poll_interval)
+
+
+def benchmark_scaling(sources, db_file, worker_counts=(1, 2, 4), port=8766, options=None, work_dir=None):
+    """Scan the same inputs with 1..N local worker processes and report throughput per worker count
+
+    Workers load their models and start polling before the scan is queued,
+    so start-up cost is excluded. Each worker process gets an equal share of
+    the CPU cores for torch, so the numbers show how close to linear the
+    coordinator lets scans scale on this machine.
+    """
+    import subprocess
+    import sys
+
+    work_dir = work_dir or tempfile.mkdtemp(prefix="copyscale_scale_")
+    coordinator = ScanCoordinator(os.path.join(work_dir, "scans.sqlite3"), os.path.join(work_dir, "snapshots"))
+    server = serve(coordinator, port=port)
+    url = f"http://127.0.0.1:{port}"
+    files = len(collect_media(sources))
+    reports = []
+    try:
+        for count in worker_counts:
+            threads = max(1, (os.cpu_count() or 1) // count)
+            coordinator.workers.clear()
+            workers = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "worker", "--url", url,
+                                         "--threads", str(threads), "--poll-interval", "0.2"],
+                                        env=dict(os.environ, OMP_NUM_THREADS=str(threads)))
+                       for _ in range(count)]
+            try:
+                while len(coordinator.workers) < count:
+                    time.sleep(0.2)
+                scan_id = coordinator.create_scan(sources, db_file, options)
+                start = time.time()
+                while not coordinator.status(scan_id)['finished']:
+                    time.sleep(0.2)
+                seconds = time.time() - start
+            finally:
+                for worker in workers:
+                    worker.terminate()
+                    worker.wait()
+            reports.append({'workers': count, 'seconds': seconds, 'files_per_sec': files / seconds,
+                            'failed_units': coordinator.status(scan_id)['counts'].get('failed', 0)})
+            coordinator.delete_scan(scan_id)
+    finally:
+        server.shutdown()
+    base = reports[0]['files_per_sec'] / reports[0]['workers'] if reports else 0.0
+    for report in reports:
+        report['efficiency'] = report['files_per_sec'] / (base * report['workers']) if base else 0.0
+    return reports
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Distributed Copyscale scans")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="run the coordinator HTTP API")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--state", default="copyscale_scans.sqlite3")
+    serve_parser.add_argument("--lease-seconds", type=int, default=300)
+    serve_parser.add_argument("--max-attempts", type=int, default=3)
+    serve_parser.add_argument("--root", action="append",
+                              help="directory scans may read inputs and databases from (repeatable; default: cwd)")
+
+    worker_parser = subparsers.add_parser("worker", help="pull and process work units")
+    worker_parser.add_argument("--url", default="http://127.0.0.1:8765")
+    worker_parser.add_argument("--db", help="local copy of the snapshot manifest (default: the snapshot path)")
+    worker_parser.add_argument("--blob-dir")
+    worker_parser.add_argument("--threads", type=int, help="torch intra-op threads for this worker")
+    worker_parser.add_argument("--memory-budget", help="RSS budget, e.g. 4G (default: COPYSCALE_MEMORY_BUDGET)")
+    worker_parser.add_argument("--poll-interval", type=float, default=2.0)
+    worker_parser.add_argument("--exit-when-idle", action="store_true")
+
+    submit_parser = subparsers.add_parser("submit", help="queue a scan of files or directories")
+    submit_parser.add_argument("sources", nargs="+")
+    submit_parser.add_argument("--url", default="http://127.0.0.1:8765")
+    submit_parser.add_argument("--db", default="copyright_database.json")
+    submit_parser.add_argument("--top-k", type=int, default=3)
+    submit_parser.add_argument("--wait", action="store_true")
+
+    results_parser = subparsers.add_parser("results", help="print a scan's status and merged results")
+    results_parser.add_argument("scan_id")
+    results_parser.add_argument("--url", default="http://127.0.0.1:8765")
+
+    delete_parser = subparsers.add_parser("delete", help="drop a scan and release its database snapshot")
+    delete_parser.add_argument("scan_id")
+    delete_parser.add_argument("--url", default="http://127.0.0.1:8765")
+
+    scale_parser = subparsers.add_parser("scale", help="throughput with 1, 2, 4... local workers")
+    scale_parser.add_argument("sources", nargs="+")
+    scale_parser.add_argument("--db", default="copyright_database.json")
+    scale_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        roots = args.root or [os.getcwd()]
+        server = serve(ScanCoordinator(args.state, lease_seconds=args.lease_seconds, max_attempts=args.max_attempts,
+                                       roots=roots), args.host, args.port)
+        print(f"✅ Coordinator listening on http://{args.host}:{args.port}, reading from {', '.join(roots)}")
+        if not os.environ.get(TOKEN_ENV):
+            print(f"⚠️ No {TOKEN_ENV} set: any client that can reach this port can queue scans and read results")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            server.shutdown()
+    elif args.command == "worker":
+        if args.threads:
+            import torch
+            torch.set_num_threads(args.threads)
+        if args.memory_budget:
+            memory_budget.configure(args.memory_budget)
+        import copyright_db      # load the models before taking any work
+        worker = ScanWorker(args.url, db_file=args.db, blob_dir=args.blob_dir, poll_interval=args.poll_interval)
+        print(f"✅ Worker {worker.worker_id} polling {args.url}")
+        try:
+            worker.run(exit_when_idle=args.exit_when_idle)
+        except KeyboardInterrupt:
+            worker.stop()
+    elif args.command == "submit":
+        scan_id = _request(f"{args.url}/scans", {'sources': [os.path.abspath(source) for source in args.sources],
+                                                 'db_file': os.path.abspath(args.db),
+                                                 'options': {'top_k': args.top_k}})['scan_id']
+        print(f"Queued scan {scan_id}")
+        if args.wait:
+            print(wait_for_scan(args.url, scan_id))
+    elif args.command == "results":
+        print(json.dumps({'status': _request(f"{args.url}/scans/{args.scan_id}"),
+                          'results': _request(f"{args.url}/scans/{args.scan_id}/results")}, indent=2))
+    elif args.command == "delete":
+        print(_request(f"{args.url}/scans/{args.scan_id}", method="DELETE"))
+    elif args.command == "scale":
+        for report in benchmark_scaling(args.sources, args.db, args.workers):
+            print(f"{report['workers']} workers: {report['files_per_sec']:.2f} files/sec, "
+                  f"{report['efficiency']:.0%} of linear, {report['failed_units']} failed units")
@@ -0,0 +1,359 @@
+import json
+import os
+import time
+from operator import itemgetter
+import numpy as np
+
+# Raw per-pair similarities stored with every analysis: cosines of the pooled
+# layer1-layer4 descriptors and of the final fingerprint
+RAW_SIMILARITIES = ('layer1', 'layer2', 'layer3', 'layer4', 'final')
+# Scores shown to users, each the mean of some raw similarities
+DERIVED_SIMILARITIES = {'direct': ('final',), 'style': ('layer2', 'layer3'), 'content': ('layer1', 'final')}
+RISK_LEVELS = ("LOW", "MEDIUM", "HIGH")
+
+DEFAULT_WEIGHTS = {'direct': 0.5, 'style': 0.1, 'content': 0.5}
+DEFAULT_THRESHOLDS = (0.4, 0.7)         # (medium, high)
+
+
+def sigmoid(x):
+    # exp(-log(1 + e^-x)) does not overflow for large |x|
+    return np.exp(-np.logaddexp(0.0, -np.asarray(x, dtype=np.float64)))
+
+
+def derived_similarities(raw):
+    """direct/style/content from a {layer: cosine} dict"""
+    return {name: float(np.mean([raw[layer] for layer in layers])) for name, layers in DERIVED_SIMILARITIES.items()}
+
+
+class ScoreModel:
+    """Fuses raw similarities into one score, optionally calibrates it, and maps it to a risk level
+
+    weights may name raw layers or derived scores; they are expanded into one
+    vector over RAW_SIMILARITIES, so scoring N stored results is a single
+    (N, 5) matrix product with no model passes. calibration is None,
+    {'method': 'logistic', 'coef': [...], 'intercept': b} (a probability
+    fitted on the raw similarities, replacing the weights) or
+    {'method': 'isotonic', 'x': [...], 'y': [...]} (a monotone map of the
+    fused score to a probability). thresholds (medium, high) apply to the
+    final score.
+    """
+
+    def __init__(self, weights=None, thresholds=DEFAULT_THRESHOLDS, calibration=None):
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        self.thresholds = tuple(thresholds)
+        self.calibration = calibration
+        self._vector = self.weight_vector()
+
+    def weight_vector(self):
+        vector = np.zeros(len(RAW_SIMILARITIES), dtype=np.float64)
+        for name, weight in self.weights.items():
+            layers = DERIVED_SIMILARITIES.get(name, (name,))
+            for layer in layers:
+                if layer not in RAW_SIMILARITIES:
+                    raise ValueError(f"Unknown similarity in weights: {name}")
+                vector[RAW_SIMILARITIES.index(layer)] += weight / len(layers)
+        return vector
+
+    def fused(self, matrix):
+        return np.asarray(matrix, dtype=np.float64) @ self._vector
+
+    def score_matrix(self, matrix):
+        """(scores, level indices into RISK_LEVELS) for an (N, len(RAW_SIMILARITIES)) matrix"""
+        matrix = np.asarray(matrix, dtype=np.float64).reshape(-1, len(RAW_SIMILARITIES))
+        method = self.calibration['method'] if self.calibration else None
+        if method == "logistic":
+            logits = matrix @ np.asarray(self.calibration['coef']) + self.calibration['intercept']
+            scores = sigmoid(logits)
+        elif method == "isotonic":
+            scores = np.interp(self.fused(matrix), self.calibration['x'], self.calibration['y'])
+        else:
+            scores = self.fused(matrix)
+        medium, high = self.thresholds
+        levels = (scores > medium).astype(np.int64) + (scores > high)
+        return scores, levels
+
+    def _linear(self):
+        """(coefficients over RAW_SIMILARITIES, intercept) of the pre-calibration linear score"""
+        if self.calibration and self.calibration['method'] == "logistic":
+            return np.asarray(self.calibration['coef']), self.calibration['intercept']
+        return self._vector, 0.0
+
+    def _calibrate(self, linear):
+        method = self.calibration['method'] if self.calibration else None
+        if method == "logistic":
+            return sigmoid(linear)
+        if method == "isotonic":
+            return float(np.interp(linear, self.calibration['x'], self.calibration['y']))
+        return linear
+
+    def level(self, score):
+        medium, high = self.thresholds
+        return RISK_LEVELS[int(score > medium) + int(score > high)]
+
+    def bounds(self, known, ranges):
+        """(lowest, highest) score reachable from the known raw similarities, the rest anywhere in ranges
+
+        Both calibrations are monotone in the linear score, so the extremes
+        of the linear score bound the calibrated one.
+        """
+        coef, low = self._linear()
+        high = low
+        for weight, layer in zip(coef, RAW_SIMILARITIES):
+            if layer in known:
+                low += weight * known[layer]
+                high += weight * known[layer]
+            else:
+                ends = (weight * ranges[layer][0], weight * ranges[layer][1])
+                low += min(ends)
+                high += max(ends)
+        return float(self._calibrate(low)), float(self._calibrate(high))
+
+    def stage_order(self, ranges):
+        """Raw similarities other than 'final', most able to move the score first"""
+        coef = dict(zip(RAW_SIMILARITIES, self._linear()[0]))
+        return sorted((layer for layer in RAW_SIMILARITIES if layer != 'final'),
+                      key=lambda layer: -abs(coef[layer]) * (ranges[layer][1] - ranges[layer][0]))
+
+    def score(self, raw):
+        """(score, risk level) for one {layer: cosine} dict"""
+        scores, levels = self.score_matrix([[raw[layer] for layer in RAW_SIMILARITIES]])
+        return float(scores[0]), RISK_LEVELS[levels[0]]
+
+    def fit_logistic(self, matrix, labels):
+        """Calibrate with a logistic regression on the raw similarities of labelled pairs (1 = copy)"""
+        from sklearn.linear_model import LogisticRegression
+
+        # Raw similarities of real pairs sit in a narrow band, so fit on
+        # standardised features and fold the scaling back into the coefficients
+        matrix = np.asarray(matrix, dtype=np.float64)
+        mean, std = matrix.mean(axis=0), np.maximum(matrix.std(axis=0), 1e-6)
+        model = LogisticRegression().fit((matrix - mean) / std, np.asarray(labels))
+        coef = model.coef_[0] / std
+        self.calibration = {'method': 'logistic', 'coef': coef.tolist(),
+                            'intercept': float(model.intercept_[0] - coef @ mean)}
+        return self
+
+    def fit_isotonic(self, matrix, labels):
+        """Calibrate the fused score with isotonic regression on labelled pairs (1 = copy)"""
+        from sklearn.isotonic import IsotonicRegression
+
+        model = IsotonicRegression(y_min=0.0, y_max=1.0, out_of_bounds='clip')
+        model.fit(self.fused(matrix), np.asarray(labels, dtype=np.float64))
+        self.calibration = {'method': 'isotonic', 'x': model.X_thresholds_.tolist(),
+                            'y': model.y_thresholds_.tolist()}
+        return self
+
+    def describe(self):
+        medium, high = self.thresholds
+        method = self.calibration['method'] if self.calibration else "uncalibrated"
+        return f"{method} score, HIGH > {high:g}, MEDIUM > {medium:g}, LOW ≤ {medium:g}"
+
+    def to_dict(self):
+        return {'weights': self.weights, 'thresholds': list(self.thresholds), 'calibration': self.calibration}
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        """Model saved at path, or the default weighting if there is none"""
+        if not path or not os.path.exists(path):
+            return cls()
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            return cls(data.get('weights'), data.get('thresholds', DEFAULT_THRESHOLDS), data.get('calibration'))
+        except Exception as e:
+            print(f"Error loading score model {path}: {e}")
+            return cls()
+
+
+# Configured from COPYSCALE_SCORE_MODEL (a JSON file written by `python scoring.py fit`)
+score_model = ScoreModel.load(os.environ.get("COPYSCALE_SCORE_MODEL", "score_model.json"))
+
+
+def is_estimate(analysis, key):
+    """Whether analysis[key] is an early-exit estimate rather than a measured value"""
+    return key == 'weighted_score' and bool(analysis.get('early_exit', {}).get('estimated'))
+
+
+def format_metric(analysis, key, spec=".3f"):
+    """analysis[key] formatted with spec, labelled when it is an estimate
+
+    Similarities that were never measured (pairs rejected by cascade triage,
+    scores needing layers early exit skipped) are "not computed".
+    """
+    value = analysis.get(key)
+    if value is None:
+        return "not computed"
+    if is_estimate(analysis, key):
+        low, high = analysis['early_exit']['score_bounds']
+        settled = "" if analysis['early_exit'].get('settled', True) else "; risk level not settled"
+        return f"{value:{spec}} (estimated, {low:{spec}}-{high:{spec}}{settled})"
+    return f"{value:{spec}}"
+
+
+def iter_analyses(results):
+    """Every analysis dict carrying raw similarities inside a (nested) result structure"""
+    if isinstance(results, dict):
+        if 'raw_similarities' in results:
+            yield results
+            return
+        for value in results.values():
+            yield from iter_analyses(value)
+    elif isinstance(results, list):
+        for value in results:
+            yield from iter_analyses(value)
+
+
+def rescore(results, model=None):
+    """Re-apply a score model to stored analyses in place, with no model passes; returns how many changed
+
+    Pairs rejected by cascade triage, or analyses stored before raw similarities
+    were kept, have no raw similarities and are left as they are. Early-exit
+    analyses that skipped layers are re-scored from the layers they computed;
+    see rescore_estimate.
+    """
+    model = model or score_model
+    analyses, estimates = [], []
+    for analysis in iter_analyses(results):
+        (estimates if analysis.get('early_exit', {}).get('skipped') else analyses).append(analysis)
+    for analysis in estimates:
+        rescore_estimate(analysis, model)
+    if not analyses:
+        return len(estimates)
+    raw = itemgetter(*RAW_SIMILARITIES)
+    scores, levels = model.score_matrix([raw(analysis['raw_similarities']) for analysis in analyses])
+    for analysis, score, level in zip(analyses, scores.tolist(), levels.tolist()):
+        analysis['weighted_score'] = score
+        analysis['risk_level'] = RISK_LEVELS[level]
+        analysis['is_ai_trained'] = level > 0
+    return len(analyses) + len(estimates)
+
+
+def rescore_estimate(analysis, model):
+    """Re-score an early-exit analysis from its computed similarities, the skipped ones anywhere in their ranges
+
+    The new model's score bounds replace the stored ones and the estimate is
+    kept inside them. early_exit['settled'] is False when the bounds now
+    straddle a threshold, i.e. the risk level is itself an estimate until
+    the pair is analysed in full.
+    """
+    early_exit = analysis['early_exit']
+    if 'estimated' not in early_exit:
+        # Stored before the estimates were kept apart: raw_similarities already holds them
+        known = {layer: analysis['raw_similarities'][layer] for layer in early_exit['computed']}
+        early_exit['estimated'] = {layer: analysis['raw_similarities'][layer] for layer in early_exit['skipped']}
+        early_exit['ranges'] = {layer: [0.0, 1.0] for layer in early_exit['skipped']}
+        analysis['raw_similarities'] = known
+        for name, layers in DERIVED_SIMILARITIES.items():
+            if not set(layers) <= set(known):
+                analysis[f"{name}_similarity"] = None
+    known = analysis['raw_similarities']
+    ranges = {layer: early_exit['ranges'].get(layer, (0.0, 1.0)) for layer in RAW_SIMILARITIES}
+    low, high = model.bounds(known, ranges)
+    score = min(max(model.score(dict(known, **early_exit['estimated']))[0], low), high)
+    early_exit['score_bounds'] = [low, high]
+    early_exit['settled'] = model.level(low) == model.level(high)
+    analysis['weighted_score'] = score
+    analysis['risk_level'] = model.level(score)
+    analysis['is_ai_trained'] = analysis['risk_level'] != "LOW"
+
+
+def pair_similarities(pairs, batch_size=16):
+    """Raw similarity matrix for labelled pairs ({'query', 'reference'} paths or stored 'raw_similarities')
+
+    Stored similarities missing layers (early-exit analyses) are recomputed from the paths.
+    """
+    from analyzer import analyzer
+
+    def stored(pair):
+        return set(pair.get('raw_similarities', ())) >= set(RAW_SIMILARITIES)
+
+    paths = sorted(set(path for pair in pairs if not stored(pair)
+                       for path in (pair['query'], pair['reference'])))
+    descriptors = dict(zip(paths, analyzer.extract_descriptors(paths, batch_size))) if paths else {}
+    rows, kept = [], []
+    for pair in pairs:
+        if stored(pair):
+            rows.append([pair['raw_similarities'][layer] for layer in RAW_SIMILARITIES])
+        else:
+            query, reference = descriptors[pair['query']], descriptors[pair['reference']]
+            if query is None or reference is None:
+                print(f"Skipping unreadable pair {pair['query']} / {pair['reference']}")
+                continue
+            rows.append(analyzer.layer_similarities([reference], query)[0])
+        kept.append(pair)
+    return np.array(rows, dtype=np.float64).reshape(-1, len(RAW_SIMILARITIES)), kept
+
+
+def agreement(model, matrix, labels):
+    """Fraction of pairs where the model's is_ai_trained call matches the label"""
+    _, levels = model.score_matrix(matrix)
+    return float(np.mean((levels > 0) == (np.asarray(labels) > 0))) if len(labels) else 0.0
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fit, apply and benchmark the risk score model")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    fit_parser = subparsers.add_parser("fit", help="calibrate on labelled pairs (JSONL: query, reference, label)")
+    fit_parser.add_argument("pairs")
+    fit_parser.add_argument("--method", choices=["logistic", "isotonic"], default="logistic")
+    fit_parser.add_argument("--medium", type=float, default=DEFAULT_THRESHOLDS[0])
+    fit_parser.add_argument("--high", type=float, default=DEFAULT_THRESHOLDS[1])
+    fit_parser.add_argument("--out", default="score_model.json")
+
+    rescore_parser = subparsers.add_parser("rescore", help="re-score every stored job result with a model")
+    rescore_parser.add_argument("--model", default="score_model.json")
+    rescore_parser.add_argument("--jobs-db", default="copyscale_jobs.sqlite3")
+    rescore_parser.add_argument("--jobs-dir", default="copyscale_jobs")
+
+    bench_parser = subparsers.add_parser("bench", help="time re-scoring of synthetic results")
+    bench_parser.add_argument("--results", type=int, default=100000)
+    args = parser.parse_args()
+
+    if args.command == "fit":
+        with open(args.pairs) as f:
+            pairs = [json.loads(line) for line in f if line.strip()]
+        matrix, pairs = pair_similarities(pairs)
+        labels = [int(pair['label']) for pair in pairs]
+        model = ScoreModel(score_model.weights, (args.medium, args.high))
+        before = agreement(model, matrix, labels)
+        getattr(model, f"fit_{args.method}")(matrix, labels)
+        print(f"{len(labels)} pairs: label agreement {before:.1%} with the current weighting, "
+              f"{agreement(model, matrix, labels):.1%} calibrated ({model.describe()})")
+        model.save(args.out)
+        print(f"✅ Saved score model to {args.out}")
+
+    elif args.command == "rescore":
+        from job_queue import JobQueue
+
+        model = ScoreModel.load(args.model)
+        queue = JobQueue(args.jobs_db, args.jobs_dir)
+        start = time.time()
+        jobs = [queue.get(job['id']) for job in queue.list_jobs(limit=1000000)]
+        results = [job for job in jobs if job['status'] == 'done' and job['result']]
+        loaded = time.time()
+        counts = [rescore(job['result'], model) for job in results]
+        scored = time.time()
+        for job, count in zip(results, counts):
+            if count:
+                queue.replace_result(job['id'], job['result'])
+        print(f"Re-scored {sum(counts)} analyses in {sum(1 for count in counts if count)} jobs "
+              f"({(scored - loaded) * 1000:.1f} ms scoring, {(time.time() - start) * 1000:.0f} ms with storage)")
+
+    elif args.command == "bench":
+        rng = np.random.RandomState(0)
+        matrix = rng.uniform(0, 1, (args.results, len(RAW_SIMILARITIES)))
+        results = [{'raw_similarities': dict(zip(RAW_SIMILARITIES, row))} for row in matrix.tolist()]
+        model = ScoreModel()
+        start = time.time()
+        model.score_matrix(matrix)
+        scored = time.time()
+        rescore(results, model)
+        print(f"{args.results} results: {(scored - start) * 1000:.1f} ms to score the similarity matrix, "
+              f"{(time.time() - scored) * 1000:.1f} ms to re-score the stored result dicts")
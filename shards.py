@@ -0,0 +1,397 @@
+import json
+import os
+import re
+import zlib
+import hashlib
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:         # Windows
+    fcntl = None
+    import msvcrt
+
+# Fingerprint matrices are opened as read-only memory maps, so every process
+# on a host searches the same page-cache copy instead of a private one. Edits
+# copy a matrix into memory first; saving maps the new file again. Windows
+# cannot replace a file that is mapped, so it keeps plain loads.
+MMAP_MATRICES = os.name != 'nt'
+
+
+def owner_shard_id(owner):
+    """Stable shard id for an owner's partition"""
+    slug = re.sub(r'[^A-Za-z0-9]+', '-', owner).strip('-').lower()[:32] or 'owner'
+    digest = hashlib.sha1(owner.encode('utf-8')).hexdigest()[:8]
+    return f"owner-{slug}-{digest}"
+
+
+def hash_shard_id(image_id, num_shards):
+    """Stable shard id for hash-based partitioning"""
+    bucket = zlib.crc32(image_id.encode('utf-8')) % num_shards
+    return f"hash-{bucket:03d}"
+
+
+def atomic_write_json(path, data):
+    """Write JSON through a temp file so readers never see a half-written file"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on path (created if missing) across processes for the block"""
+    with open(path, 'a+') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:     # LK_LOCK gives up after ~10 seconds
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def atomic_save_npy(path, array):
+    """Save a numpy array through a temp file"""
+    tmp_path = f"{path}.tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+def load_matrix(path):
+    """Load a .npy fingerprint matrix, memory-mapped read-only where supported"""
+    return np.load(path, mmap_mode='r' if MMAP_MATRICES else None)
+
+
+class FingerprintShard:
+    """One partition of the copyright database: JSON metadata plus a .npy fingerprint matrix
+
+    Fingerprints from additional backbones ("namespaces") are kept in
+    <shard_id>.<namespace>.npy, row-aligned with the main matrix; entries
+    without a vector in a namespace have an all-zero row, which never matches.
+    """
+
+    def __init__(self, shard_dir, shard_id):
+        self.shard_dir = shard_dir
+        self.shard_id = shard_id
+        self.meta_path = os.path.join(shard_dir, f"{shard_id}.json")
+        self.matrix_path = os.path.join(shard_dir, f"{shard_id}.npy")
+        self._entries = None
+        self._ids = None
+        self._matrix = None
+        self._normalized = {}           # namespace (None = main) -> row-normalised matrix
+        self._rows = None
+        self._namespaces = []
+        self._extra = {}                # namespace -> matrix, loaded on first use
+
+    @property
+    def loaded(self):
+        return self._entries is not None
+
+    @property
+    def entries(self):
+        self.load()
+        return self._entries
+
+    @property
+    def ids(self):
+        self.load()
+        return self._ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def load(self):
+        """Load the shard from disk on first access"""
+        if self._entries is not None:
+            return
+
+        self._entries, self._ids, self._matrix = {}, [], None
+        self._namespaces, self._extra = [], {}
+        if os.path.exists(self.meta_path):
+            try:
+                with open(self.meta_path, 'r') as f:
+                    data = json.load(f)
+                entries = data.get('entries', {})
+                ids = data.get('ids', list(entries))
+                matrix = load_matrix(self.matrix_path) if os.path.exists(self.matrix_path) else None
+
+                if ids and (matrix is None or matrix.shape[0] != len(ids)):
+                    raise ValueError("fingerprint matrix does not match shard metadata")
+
+                self._entries, self._ids, self._matrix = entries, ids, matrix
+                self._namespaces = data.get('namespaces', [])
+            except Exception as e:
+                print(f"Error loading shard {self.shard_id}: {e}")
+        self._normalized = {}
+        self._rows = None
+
+    def namespace_path(self, namespace):
+        return os.path.join(self.shard_dir, f"{self.shard_id}.{namespace}.npy")
+
+    @property
+    def namespaces(self):
+        self.load()
+        return list(self._namespaces)
+
+    def namespace_matrix(self, namespace):
+        """Raw fingerprint matrix of a namespace (None for the main one), or None if absent"""
+        self.load()
+        if namespace is None:
+            return self._matrix
+        if namespace not in self._extra:
+            matrix = None
+            path = self.namespace_path(namespace)
+            if namespace in self._namespaces and os.path.exists(path):
+                matrix = load_matrix(path)
+                if matrix.shape[0] != len(self._ids):
+                    print(f"Ignoring stale {namespace} fingerprints in shard {self.shard_id}")
+                    matrix = None
+            self._extra[namespace] = matrix
+        return self._extra[namespace]
+
+    def _load_namespaces(self):
+        """Load every namespace matrix so row edits keep them aligned"""
+        for namespace in list(self._namespaces):
+            if self.namespace_matrix(namespace) is None:
+                self._namespaces.remove(namespace)
+                self._extra.pop(namespace, None)
+
+    def _namespace_for_write(self, namespace, dim):
+        if namespace not in self._namespaces:
+            self._namespaces.append(namespace)
+            self._extra[namespace] = np.zeros((len(self._ids), dim), dtype=np.float32)
+        return self._extra[namespace]
+
+    def _own_matrices(self):
+        """Copy memory-mapped matrices into private memory before editing rows in place"""
+        if self._matrix is not None and not self._matrix.flags.writeable:
+            self._matrix = np.array(self._matrix)
+        for namespace, matrix in self._extra.items():
+            if matrix is not None and not matrix.flags.writeable:
+                self._extra[namespace] = np.array(matrix)
+
+    @property
+    def mapped(self):
+        """True if the main matrix is served from a shared read-only memory map"""
+        return self._matrix is not None and not self._matrix.flags.writeable
+
+    def save(self):
+        """Persist the shard metadata and fingerprint matrix"""
+        self.load()
+        os.makedirs(self.shard_dir, exist_ok=True)
+        if self._matrix is not None:
+            atomic_save_npy(self.matrix_path, self._matrix)
+        elif os.path.exists(self.matrix_path):
+            os.remove(self.matrix_path)
+        for namespace, matrix in self._extra.items():
+            if matrix is not None:
+                atomic_save_npy(self.namespace_path(namespace), matrix)
+        atomic_write_json(self.meta_path, {'ids': self._ids, 'entries': self._entries,
+                                           'namespaces': self._namespaces})
+        if MMAP_MATRICES:
+            # Swap the private copies for maps of the files just written
+            if self._matrix is not None:
+                self._matrix = load_matrix(self.matrix_path)
+            for namespace, matrix in self._extra.items():
+                if matrix is not None:
+                    self._extra[namespace] = load_matrix(self.namespace_path(namespace))
+            self._normalized = {}
+
+    def delete_files(self):
+        """Remove the shard's files from disk"""
+        self.load()
+        for path in [self.meta_path, self.matrix_path] + [self.namespace_path(ns) for ns in self._namespaces]:
+            if os.path.exists(path):
+                os.remove(path)
+        self._entries, self._ids, self._matrix, self._normalized, self._rows = {}, [], None, {}, None
+        self._namespaces, self._extra = [], {}
+
+    def add(self, image_id, entry, fingerprint, extra=None):
+        """Insert or replace an entry and its fingerprint row (extra: {namespace: fingerprint})"""
+        self.add_many([(image_id, entry, fingerprint, extra)])
+
+    def add_many(self, items):
+        """Insert (image_id, entry, fingerprint[, extra]) items with a single matrix append per namespace"""
+        self.load()
+        self._load_namespaces()
+        new_rows = {}
+        for item in items:
+            image_id, entry, fingerprint = item[:3]
+            extra = (item[3] if len(item) > 3 else None) or {}
+            row = np.asarray(fingerprint, dtype=np.float32)
+            if image_id in self._entries and image_id not in new_rows:
+                # Replace in place
+                self._own_matrices()
+                index = self.row_of(image_id)
+                self._matrix[index] = row
+                for namespace, vector in extra.items():
+                    self._namespace_for_write(namespace, len(vector))[index] = vector
+            else:
+                new_rows[image_id] = (row, extra)
+            self._entries[image_id] = entry
+
+        if new_rows:
+            block = np.stack([row for row, _ in new_rows.values()])
+            namespaces = set(self._namespaces)
+            for _, extra in new_rows.values():
+                namespaces.update(extra)
+            for namespace in sorted(namespaces):
+                dim = next((len(extra[namespace]) for _, extra in new_rows.values() if namespace in extra), None)
+                matrix = self._namespace_for_write(namespace, dim or self._extra[namespace].shape[1])
+                extra_block = np.zeros((len(new_rows), matrix.shape[1]), dtype=np.float32)
+                for i, (_, extra) in enumerate(new_rows.values()):
+                    if namespace in extra:
+                        extra_block[i] = extra[namespace]
+                self._extra[namespace] = np.vstack([matrix, extra_block])
+            self._ids.extend(new_rows)
+            self._matrix = block if self._matrix is None else np.vstack([self._matrix, block])
+        self._normalized = {}
+        self._rows = None
+
+    def set_namespace_rows(self, namespace, vectors):
+        """Fill in {image_id: fingerprint} for a namespace (e.g. when backfilling a new backbone)"""
+        self.load()
+        self._load_namespaces()
+        self._own_matrices()
+        for image_id, vector in vectors.items():
+            if image_id in self._entries:
+                self._namespace_for_write(namespace, len(vector))[self.row_of(image_id)] = vector
+        self._normalized.pop(namespace, None)
+
+    def replace_matrix(self, matrix, namespace=None):
+        """Swap in a whole new fingerprint matrix (e.g. after re-embedding), possibly of a new width"""
+        self.load()
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if matrix.shape[0] != len(self._ids):
+            raise ValueError("replacement matrix does not match shard rows")
+        if namespace is None:
+            self._matrix = matrix
+        else:
+            if namespace not in self._namespaces:
+                self._namespaces.append(namespace)
+            self._extra[namespace] = matrix
+        self._normalized.pop(namespace, None)
+
+    def missing_in_namespace(self, namespace):
+        """Ids whose row in a namespace is empty (never embedded with that backbone)"""
+        matrix = self.namespace_matrix(namespace)
+        if matrix is None:
+            return list(self.ids)
+        return [self._ids[row] for row in np.where(~matrix.any(axis=1))[0]]
+
+    def remove(self, image_id):
+        """Remove an entry; returns False if it was not in this shard"""
+        self.load()
+        if image_id not in self._entries:
+            return False
+
+        self._load_namespaces()
+        index = self.row_of(image_id)
+        del self._ids[index]
+        del self._entries[image_id]
+        self._matrix = np.delete(self._matrix, index, axis=0) if self._ids else None
+        for namespace in self._namespaces:
+            self._extra[namespace] = np.delete(self._extra[namespace], index, axis=0)
+        self._normalized = {}
+        self._rows = None
+        return True
+
+    def owners(self):
+        """Set of owners with content in this shard"""
+        return set(entry['owner'] for entry in self.entries.values())
+
+    def normalized_matrix(self, namespace=None):
+        """Row-normalised fingerprint matrix of a namespace, cached until the shard changes
+
+        Pooled-embedding fingerprints are stored unit-norm already, so the
+        (possibly memory-mapped) matrix is used as is; only older unnormalised
+        fingerprints get a private normalised copy.
+        """
+        matrix = self.namespace_matrix(namespace)
+        if matrix is None:
+            return None
+        if namespace not in self._normalized:
+            norms = np.sqrt(np.einsum('ij,ij->i', matrix, matrix))
+            # All-zero rows (not embedded in this namespace) stay zero either way
+            if np.all((np.abs(norms - 1.0) < 1e-3) | (norms == 0)):
+                self._normalized[namespace] = matrix
+            else:
+                self._normalized[namespace] = matrix / np.maximum(norms, 1e-12)[:, None]
+        return self._normalized[namespace]
+
+    def row_of(self, image_id):
+        """Matrix row of an entry, via a lazily built id -> row map"""
+        if self._rows is None:
+            self._rows = {image_id: row for row, image_id in enumerate(self.ids)}
+        return self._rows[image_id]
+
+    def search(self, query_unit, top_k, ids=None, min_similarity=None, namespace=None):
+        """Return up to top_k (similarity, image_id) pairs for a unit-norm query vector
+
+        If ids is given only those rows are scored, so pre-filtered queries cost
+        O(len(ids)) rather than O(shard size). namespace selects which
+        backbone's fingerprints are searched (None = the main ResNet50 ones).
+        """
+        matrix = self.normalized_matrix(namespace)
+        if matrix is None:
+            return []
+
+        if ids is not None:
+            rows = np.array(sorted(self.row_of(image_id) for image_id in ids if image_id in self._entries),
+                            dtype=np.int64)
+            if not len(rows):
+                return []
+            similarities = matrix[rows] @ query_unit
+        else:
+            rows = None
+            similarities = matrix @ query_unit
+
+        k = min(top_k, len(similarities))
+        candidates = np.argpartition(-similarities, k - 1)[:k]
+        candidates = candidates[np.argsort(-similarities[candidates])]
+
+        results = []
+        for index in candidates:
+            score = float(similarities[index])
+            if min_similarity is not None and score <= min_similarity:
+                continue
+            row = index if rows is None else rows[index]
+            results.append((score, self._ids[row]))
+        return results
+
+
+# Per-process shard cache used by process-pool fan-out, keyed by file mtime so
+# workers pick up shards rewritten by the parent
+_process_shards = {}
+
+
+def search_shard_file(shard_dir, shard_id, query_unit, top_k, ids=None, min_similarity=None, namespace=None):
+    """Search a shard by id from a worker process, loading it from disk on first use"""
+    shard = FingerprintShard(shard_dir, shard_id)
+    try:
+        matrix_path = shard.matrix_path if namespace is None else shard.namespace_path(namespace)
+        stamp = (os.path.getmtime(shard.meta_path), os.path.getmtime(matrix_path))
+    except OSError:
+        return []
+
+    cached = _process_shards.get((shard_dir, shard_id, namespace))
+    if cached is None or cached[0] != stamp:
+        cached = (stamp, shard)
+        _process_shards[(shard_dir, shard_id, namespace)] = cached
+
+    results = cached[1].search(query_unit, top_k, ids, min_similarity, namespace)
+    return [(score, image_id, shard_id) for score, image_id in results]
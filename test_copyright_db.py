@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from copyright_db import CopyrightDatabase
+from memory_budget import memory_budget
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = CopyrightDatabase(str(tmp_path / "db.json"))
+    for i in range(4):
+        path = str(tmp_path / f"{i}.jpg")
+        Image.fromarray((np.random.RandomState(i).rand(64, 64, 3) * 255).astype('uint8')).save(path)
+        db.add_copyrighted_content(path, f"Image {i}", owner=f"owner{i % 2}")
+    return db
+
+
+@pytest.fixture
+def tiny_budget(monkeypatch):
+    """A budget the process is always over, releasing caches at every batch size check"""
+    monkeypatch.setattr(memory_budget, "limit", 50 * 1024 * 1024)
+    monkeypatch.setattr(memory_budget, "check", memory_budget.release)
+
+
+def test_add_namespace_under_tiny_budget(db, tiny_budget):
+    assert db.add_namespace("mobilenet_v3_small", batch_size=1) == 4
+    reopened = CopyrightDatabase(db.db_file)
+    for shard_id in reopened.manifest['shards']:
+        assert not reopened.get_shard(shard_id).missing_in_namespace("mobilenet_v3_small")
+
+
+def test_migrate_embeddings_under_tiny_budget(db, tiny_budget):
+    assert db.migrate_embeddings(batch_size=1) == 4
+    assert len(CopyrightDatabase(db.db_file).database) == 4
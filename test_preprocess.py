@@ -0,0 +1,27 @@
+import pytest
+from torchvision.models import ResNet50_Weights
+
+from preprocess import FastPreprocessor, PARITY_MAX_MEAN_DIFF, check_parity, parity_images
+
+
+@pytest.fixture(scope="module")
+def images(tmp_path_factory):
+    return parity_images(str(tmp_path_factory.mktemp("parity")))
+
+
+@pytest.mark.parametrize("use_draft", [True, False])
+def test_matches_resnet50_transform(images, use_draft):
+    reference = ResNet50_Weights.DEFAULT.transforms()
+    report = check_parity(images, reference, FastPreprocessor.from_transform(reference, use_draft=use_draft))
+    assert len(report['images']) == len(images)
+    for item in report['images']:
+        assert 'error' not in item, item['path']
+        assert item['mean_abs_diff'] <= PARITY_MAX_MEAN_DIFF, item
+
+
+def test_generated_images_cover_both_orientations_and_formats(images):
+    names = [path.rsplit("parity_", 1)[1] for path in images]
+    assert {name.rsplit(".", 1)[1] for name in names} == {"jpg", "png"}
+    sizes = [tuple(map(int, name.rsplit(".", 1)[0].split("x"))) for name in names]
+    assert any(width > height for width, height in sizes)
+    assert any(width < height for width, height in sizes)
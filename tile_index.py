@@ -0,0 +1,238 @@
+import os
+import numpy as np
+
+# Grids the layer3 activation map (14x14 at 224px) is pooled to. Matching a
+# query grid against a different reference grid covers crops (query zoomed in)
+# and letterboxed/collaged copies (query zoomed out) without extra passes.
+TILE_GRIDS = (7, 4)
+
+
+def tile_positions(grid):
+    """Normalised (x, y) centres of a grid's cells in row-major order"""
+    centres = (np.arange(grid) + 0.5) / grid
+    ys, xs = np.meshgrid(centres, centres, indexing='ij')
+    return np.stack([xs.ravel(), ys.ravel()], axis=1).astype(np.float32)
+
+
+class TileIndex:
+    """Inverted index of local (tile) descriptors for detecting crops and partial reuse
+
+    Tiles are L2-normalised layer3 cells, randomly projected to a small
+    dimension and bucketed with sign-LSH tables. A query looks up its own
+    tiles' buckets, verifies candidates by cosine, and votes for a
+    (entry, scale, translation) hypothesis; consistent votes mean the query
+    contains a region of that entry at that offset.
+    """
+
+    def __init__(self, index_file, dim=64, num_bits=8, num_tables=6, seed=0):
+        self.index_file = index_file
+        self.dim = dim
+        self.num_bits = num_bits
+        self.num_tables = num_tables
+        self.seed = seed
+        self.projection = None          # built on first use from the tile width
+        self._hyperplanes = np.random.RandomState(seed + 1).randn(num_tables, dim, num_bits).astype(np.float32)
+        self.entry_ids = []
+        self.vectors = np.zeros((0, dim), dtype=np.float16)
+        self.tile_entry = np.zeros(0, dtype=np.int32)
+        self.tile_pos = np.zeros((0, 2), dtype=np.float32)
+        self.tile_grid = np.zeros(0, dtype=np.int16)
+        self._positions = {}            # image_id -> index into entry_ids
+        self._pending = []              # tiles added since the arrays were last concatenated
+        self._tables = None             # lazily rebuilt LSH tables
+        self.loaded = False
+        self.dirty = False
+
+    def _ensure_projection(self, width):
+        if self.projection is None or self.projection.shape[0] != width:
+            q, _ = np.linalg.qr(np.random.RandomState(self.seed).randn(width, self.dim))
+            self.projection = q.astype(np.float32)
+
+    def project(self, tiles):
+        """L2-normalise raw tile descriptors, project them and re-normalise"""
+        tiles = np.asarray(tiles, dtype=np.float32)
+        tiles = tiles / np.maximum(np.linalg.norm(tiles, axis=1, keepdims=True), 1e-12)
+        self._ensure_projection(tiles.shape[1])
+        projected = tiles @ self.projection
+        return projected / np.maximum(np.linalg.norm(projected, axis=1, keepdims=True), 1e-12)
+
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            with np.load(self.index_file) as data:
+                self.entry_ids = [str(image_id) for image_id in data['entry_ids']]
+                self.vectors = data['vectors']
+                self.tile_entry = data['tile_entry']
+                self.tile_pos = data['tile_pos']
+                self.tile_grid = data['tile_grid']
+                self.projection = data['projection'] if len(data['projection']) else None
+        except Exception as e:
+            print(f"Error loading tile index: {e}")
+        self._positions = {image_id: index for index, image_id in enumerate(self.entry_ids)}
+        self._tables = None
+
+    def _flush(self):
+        """Append the pending tiles to the arrays in one concatenation"""
+        if not self._pending:
+            return
+        vectors, positions, grids, entries = zip(*self._pending)
+        self.vectors = np.vstack((self.vectors,) + vectors)
+        self.tile_pos = np.vstack((self.tile_pos,) + positions)
+        self.tile_grid = np.concatenate((self.tile_grid,) + grids)
+        self.tile_entry = np.concatenate((self.tile_entry,) + entries)
+        self._pending = []
+
+    def save(self):
+        if not self.dirty:
+            return
+        self._flush()
+        tmp_path = f"{self.index_file}.tmp.npz"
+        np.savez(tmp_path, entry_ids=np.array(self.entry_ids), vectors=self.vectors,
+                 tile_entry=self.tile_entry, tile_pos=self.tile_pos, tile_grid=self.tile_grid,
+                 projection=self.projection if self.projection is not None else np.zeros((0, self.dim)))
+        os.replace(tmp_path, self.index_file)
+        self.dirty = False
+
+    def clear(self):
+        self.loaded = True
+        self.entry_ids = []
+        self.vectors = np.zeros((0, self.dim), dtype=np.float16)
+        self.tile_entry = np.zeros(0, dtype=np.int32)
+        self.tile_pos = np.zeros((0, 2), dtype=np.float32)
+        self.tile_grid = np.zeros(0, dtype=np.int16)
+        self._positions = {}
+        self._pending = []
+        self._tables = None
+        self.dirty = True
+
+    def add(self, image_id, tile_maps):
+        """Index an entry's tiles; tile_maps is {grid: (grid*grid, channels) array}
+
+        The projected tiles are buffered and joined to the index arrays once,
+        on the next save, search or removal, so adding n entries costs O(n).
+        """
+        self.load()
+        self.remove(image_id)
+        entry_index = len(self.entry_ids)
+        self.entry_ids.append(image_id)
+        self._positions[image_id] = entry_index
+
+        vectors = np.vstack([self.project(tiles).astype(np.float16) for tiles in tile_maps.values()])
+        self._pending.append((vectors, np.vstack([tile_positions(grid) for grid in tile_maps]),
+                              np.concatenate([np.full(grid * grid, grid, dtype=np.int16) for grid in tile_maps]),
+                              np.full(len(vectors), entry_index, dtype=np.int32)))
+        self._tables = None
+        self.dirty = True
+
+    def remove(self, image_id):
+        self.load()
+        if image_id not in self._positions:
+            return
+        self._flush()
+        entry_index = self._positions[image_id]
+        keep = self.tile_entry != entry_index
+        self.vectors, self.tile_pos, self.tile_grid = self.vectors[keep], self.tile_pos[keep], self.tile_grid[keep]
+        self.tile_entry = self.tile_entry[keep]
+        self.tile_entry[self.tile_entry > entry_index] -= 1
+        del self.entry_ids[entry_index]
+        self._positions = {image_id: index for index, image_id in enumerate(self.entry_ids)}
+        self._tables = None
+        self.dirty = True
+
+    def _codes(self, vectors):
+        """LSH bucket code per table for centred vectors: (n, num_tables)"""
+        centred = vectors - self._centre
+        bits = np.einsum('nd,tdb->ntb', centred, self._hyperplanes) > 0
+        weights = 1 << np.arange(self.num_bits)
+        return (bits * weights).sum(axis=2)
+
+    def _build_tables(self):
+        """Sort tile codes per table so buckets can be found with searchsorted"""
+        vectors = self.vectors.astype(np.float32)
+        # Post-ReLU features share a dominant direction; centring keeps buckets balanced
+        self._centre = vectors.mean(axis=0) if len(vectors) else np.zeros(self.dim, dtype=np.float32)
+        codes = self._codes(vectors)
+        self._tables = []
+        for table in range(self.num_tables):
+            order = np.argsort(codes[:, table], kind='stable')
+            self._tables.append((codes[order, table], order))
+
+    def search(self, tile_maps, top_k=3, min_similarity=0.8, min_votes=3):
+        """Find entries containing regions of the query (or contained in it)
+
+        tile_maps is the query's {grid: tiles}. Returns dicts with image_id,
+        score (fraction of the overlapping tiles that agree), votes, scale and
+        the matched query/reference boxes in normalised (x0, y0, x1, y1) form.
+        """
+        self.load()
+        self._flush()
+        if not len(self.vectors):
+            return []
+        if self._tables is None:
+            self._build_tables()
+
+        vectors, positions, grids = [], [], []
+        for grid, tiles in tile_maps.items():
+            vectors.append(self.project(tiles))
+            positions.append(tile_positions(grid))
+            grids.append(np.full(grid * grid, grid))
+        query_vectors, query_pos, query_grid = np.vstack(vectors), np.vstack(positions), np.concatenate(grids)
+        query_codes = self._codes(query_vectors)
+
+        votes = {}
+        for q in range(len(query_vectors)):
+            # Inverted lookup: union of this tile's buckets across tables
+            candidates = []
+            for table, (sorted_codes, order) in enumerate(self._tables):
+                low = np.searchsorted(sorted_codes, query_codes[q, table], 'left')
+                high = np.searchsorted(sorted_codes, query_codes[q, table], 'right')
+                candidates.append(order[low:high])
+            candidates = np.unique(np.concatenate(candidates))
+            if not len(candidates):
+                continue
+
+            similarities = self.vectors[candidates].astype(np.float32) @ query_vectors[q]
+            matched = candidates[similarities >= min_similarity]
+            matched_similarities = similarities[similarities >= min_similarity]
+
+            for tile, similarity in zip(matched, matched_similarities):
+                # Query->reference mapping ref = scale * query + shift
+                scale = query_grid[q] / float(self.tile_grid[tile])
+                shift = self.tile_pos[tile] - scale * query_pos[q]
+                bin_size = 1.0 / self.tile_grid[tile]
+                key = (int(self.tile_entry[tile]), int(query_grid[q]), int(self.tile_grid[tile]),
+                       int(np.round(shift[0] / bin_size)), int(np.round(shift[1] / bin_size)))
+                bucket = votes.setdefault(key, {'weight': 0.0, 'query_tiles': set(), 'ref_tiles': set()})
+                if q not in bucket['query_tiles']:
+                    bucket['weight'] += float(similarity)
+                bucket['query_tiles'].add(q)
+                bucket['ref_tiles'].add(int(tile))
+
+        # Best hypothesis per entry
+        best = {}
+        for (entry_index, q_grid, ref_grid, _, _), bucket in votes.items():
+            count = len(bucket['query_tiles'])
+            if count < min_votes:
+                continue
+            score = bucket['weight'] / min(q_grid, ref_grid) ** 2
+            if entry_index not in best or score > best[entry_index]['score']:
+                best[entry_index] = {
+                    'image_id': self.entry_ids[entry_index],
+                    'score': float(min(score, 1.0)),
+                    'votes': count,
+                    'scale': round(q_grid / float(ref_grid), 3),
+                    'query_box': self._box(query_pos[sorted(bucket['query_tiles'])], q_grid),
+                    'reference_box': self._box(self.tile_pos[sorted(bucket['ref_tiles'])], ref_grid)
+                }
+
+        return sorted(best.values(), key=lambda match: match['score'], reverse=True)[:top_k]
+
+    @staticmethod
+    def _box(centres, grid):
+        half = 0.5 / grid
+        return [float(max(centres[:, 0].min() - half, 0)), float(max(centres[:, 1].min() - half, 0)),
+                float(min(centres[:, 0].max() + half, 1)), float(min(centres[:, 1].max() + half, 1))]
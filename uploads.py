@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+IMAGE_UPLOAD_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+VIDEO_UPLOAD_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+
+# Per-file size limits, enforced while copying
+MAX_IMAGE_BYTES = 50 * 1024 * 1024
+MAX_VIDEO_BYTES = 2 * 1024 * 1024 * 1024
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds its size limit"""
+
+
+def max_upload_bytes(filename):
+    """Size limit for an upload, chosen by its extension"""
+    if os.path.splitext(filename)[1].lower() in VIDEO_UPLOAD_EXTENSIONS:
+        return MAX_VIDEO_BYTES
+    return MAX_IMAGE_BYTES
+
+
+def copy_upload(uploaded_file, path, max_bytes=None, chunk_size=CHUNK_SIZE):
+    """Copy an uploaded file to path in chunks; returns the number of bytes written
+
+    Enforces a size cap of max_bytes (default: by extension): an upload that
+    declares a larger size is refused before anything is written, and the
+    copy is aborted, and the partial file removed, as soon as it exceeds
+    the cap. It does not bound memory, since Streamlit already holds the
+    whole upload in memory.
+    """
+    name = getattr(uploaded_file, 'name', path)
+    max_bytes = max_upload_bytes(name) if max_bytes is None else max_bytes
+    size = getattr(uploaded_file, 'size', None)
+    if size is not None and size > max_bytes:
+        raise UploadTooLarge(f"{name} is {size / 1e6:.1f} MB; the limit is {max_bytes / 1e6:.0f} MB")
+
+    uploaded_file.seek(0)
+    written = 0
+    try:
+        with open(path, "wb") as f:
+            for chunk in iter(lambda: uploaded_file.read(chunk_size), b''):
+                written += len(chunk)
+                if written > max_bytes:
+                    raise UploadTooLarge(f"{name} exceeds the {max_bytes / 1e6:.0f} MB limit")
+                f.write(chunk)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    finally:
+        uploaded_file.seek(0)
+    return written
+
+
+def upload_title(uploaded_file):
+    """Default title for an upload: its file name without the extension"""
+    return os.path.splitext(os.path.basename(uploaded_file.name))[0]
+
+
+@contextmanager
+def temporary_upload(uploaded_file, max_bytes=None, directory=None):
+    """Copy an upload to a unique temp file for the duration of the block
+
+    Every call gets its own file, so concurrent sessions never overwrite
+    each other's inputs, and the file is removed even if analysis fails.
+    """
+    suffix = os.path.splitext(getattr(uploaded_file, 'name', ''))[1].lower()
+    fd, path = tempfile.mkstemp(prefix="copyscale_upload_", suffix=suffix, dir=directory)
+    os.close(fd)
+    try:
+        copy_upload(uploaded_file, path, max_bytes)
+        yield path
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+@contextmanager
+def temporary_upload_dir(uploaded_files, max_bytes=None):
+    """Copy several uploads into a unique temp directory; yields their paths, in upload order
+
+    Files keep their (basename) upload names, except that a name already
+    taken gets a _1, _2... suffix, so two uploads with the same name never
+    overwrite each other. Titles should come from upload_title, not from
+    the (possibly suffixed) paths.
+    """
+    directory = tempfile.mkdtemp(prefix="copyscale_bulk_")
+    try:
+        paths = []
+        for uploaded_file in uploaded_files:
+            stem, extension = os.path.splitext(os.path.basename(uploaded_file.name))
+            path, number = os.path.join(directory, stem + extension), 0
+            while os.path.exists(path):
+                number += 1
+                path = os.path.join(directory, f"{stem}_{number}{extension}")
+            copy_upload(uploaded_file, path, max_bytes)
+            paths.append(path)
+        yield paths
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
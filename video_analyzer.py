@@ -10,8 +10,12 @@ class VideoAnalyzer:
     def __init__(self):
         self.supported_formats = ['.mp4', '.avi', '.mov', '.mkv']
     
-    def extract_keyframes(self, video_path, num_frames=8):
-        """Extract keyframes from video for analysis"""
+    def extract_keyframes(self, video_path, num_frames=8, output_dir=None):
+        """Extract keyframes from video for analysis
+        
+        Frames are written to output_dir (the working directory by default);
+        pass a per-job directory when several scans can run at once.
+        """
         try:
             cap = cv2.VideoCapture(video_path)
             if not cap.isOpened():
@@ -40,7 +44,7 @@ class VideoAnalyzer:
                     frame_pil = Image.fromarray(frame_rgb)
                     
                     # Save frame temporarily
-                    frame_path = f"video_frame_{i}.jpg"
+                    frame_path = os.path.join(output_dir or "", f"video_frame_{i}.jpg")
                     frame_pil.save(frame_path)
                     
                     keyframes.append({
@@ -58,11 +62,83 @@ class VideoAnalyzer:
             st.error(f"❌ Video processing error: {e}")
             return []
 
-    def analyze_video_against_image(self, video_path, reference_image_path):
-        """Analyze video frames against a reference image"""
+    def sample_frames(self, video_path, interval=1.0, max_width=640):
+        """Yield (time_seconds, PIL image) every `interval` seconds, decoding only sampled frames
+
+        Frames in between are grabbed without being decoded to RGB, and
+        sampled frames are downscaled to max_width before conversion.
+        """
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            print(f"Could not open video file {video_path}")
+            return
+
+        try:
+            fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+            step = max(interval * fps, 1.0)
+            next_sample = 0.0
+            frame_index = 0
+            while cap.grab():
+                if frame_index >= next_sample:
+                    ret, frame = cap.retrieve()
+                    if ret:
+                        height, width = frame.shape[:2]
+                        if width > max_width:
+                            frame = cv2.resize(frame, (max_width, int(height * max_width / width)),
+                                               interpolation=cv2.INTER_AREA)
+                        yield frame_index / fps, Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                    next_sample += step
+                frame_index += 1
+        finally:
+            cap.release()
+
+    def fingerprint_sequence(self, video_path, interval=1.0, batch_size=32, progress_callback=None):
+        """Per-interval fingerprints of a whole video: returns (times, fingerprints, first_frame)
+
+        Frames are embedded in batches as they are decoded, so memory stays
+        bounded by batch_size regardless of video length.
+        """
+        cap = cv2.VideoCapture(video_path)
+        duration = (cap.get(cv2.CAP_PROP_FRAME_COUNT) / cap.get(cv2.CAP_PROP_FPS)
+                    if cap.isOpened() and cap.get(cv2.CAP_PROP_FPS) > 0 else 0)
+        cap.release()
+
+        times, fingerprints, batch, first_frame = [], [], [], None
+
+        def flush():
+            # The model is shared with hook-based extractors running in other workers
+            with analyzer.model_lock:
+                rows = analyzer.fingerprinter.get_fingerprints([image for _, image in batch], batch_size)
+            for (time_seconds, _), row in zip(batch, rows):
+                if row is not None:
+                    times.append(time_seconds)
+                    fingerprints.append(row)
+            batch.clear()
+            if progress_callback and duration:
+                progress_callback(min(times[-1] / duration, 1.0) if times else 0.0,
+                                  f"Fingerprinted {len(times)} frames")
+
+        for time_seconds, image in self.sample_frames(video_path, interval):
+            if first_frame is None:
+                first_frame = image
+            batch.append((time_seconds, image))
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+
+        fingerprints = np.stack(fingerprints) if fingerprints else np.zeros((0, 0), dtype=np.float32)
+        return np.array(times, dtype=np.float32), fingerprints, first_frame
+
+    def analyze_video_against_image(self, video_path, reference_image_path, frames_dir=None,
+                                    progress_callback=None):
+        """Analyze video frames against a reference image
+        
+        progress_callback(fraction, message), if given, is called after each frame.
+        """
         try:
             # Extract keyframes from video
-            keyframes = self.extract_keyframes(video_path)
+            keyframes = self.extract_keyframes(video_path, output_dir=frames_dir)
             
             if not keyframes:
                 st.error("❌ No frames extracted from video")
@@ -70,15 +146,22 @@ class VideoAnalyzer:
             
             results = []
             
+            # The reference is the same for every frame: describe it once
+            reference_descriptors = analyzer.extract_descriptors([reference_image_path])[0]
+            
             # Analyze each frame against the reference image
-            for frame in keyframes:
+            for i, frame in enumerate(keyframes):
                 # Run comprehensive analysis for this frame
-                analysis = analyzer.run_comprehensive_analysis(frame['path'], reference_image_path)
+                analysis = analyzer.run_comprehensive_analysis(frame['path'], reference_image_path,
+                                                               reference_descriptors=reference_descriptors)
                 
                 results.append({
                     'frame_info': frame,
                     'analysis': analysis
                 })
+                
+                if progress_callback:
+                    progress_callback((i + 1) / len(keyframes), f"Analyzed frame {i + 1}/{len(keyframes)}")
             
             return results
             
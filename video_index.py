@@ -0,0 +1,233 @@
+import json
+import os
+import numpy as np
+from shards import atomic_write_json
+
+
+def kmeans(vectors, num_clusters, iterations=10, seed=0, sample_size=20000):
+    """Spherical k-means centroids for unit-norm rows (trained on a sample)"""
+    rng = np.random.RandomState(seed)
+    if len(vectors) > sample_size:
+        vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), num_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = (vectors @ centroids.T).argmax(axis=1)
+        for cluster in range(num_clusters):
+            members = vectors[assignments == cluster]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[cluster] = centroid / max(np.linalg.norm(centroid), 1e-12)
+    return centroids
+
+
+class VideoIndex:
+    """Per-second fingerprint sequences of reference videos with an IVF frame index
+
+    Frame fingerprints are unit-norm rows of one matrix; an inverted-file
+    (IVF) index over k-means cells means a query frame only scores the
+    frames in its nprobe nearest cells, so search cost grows with the cell
+    size rather than the total catalogue duration. Segments are found by
+    temporal Hough voting: every frame hit votes for a (video, time offset)
+    pair, and runs of hits on the winning diagonals become matched spans.
+    """
+
+    def __init__(self, index_path, frames_per_cell=256, nprobe=8):
+        self.meta_path = f"{index_path}.json"
+        self.matrix_path = f"{index_path}.npz"
+        self.frames_per_cell = frames_per_cell
+        self.nprobe = nprobe
+        self.videos = {}                # video_id -> metadata (title, owner, duration, ...)
+        self.video_ids = []
+        self.vectors = None
+        self.frame_video = np.zeros(0, dtype=np.int32)
+        self.frame_time = np.zeros(0, dtype=np.float32)
+        self.centroids = None
+        self.trained_size = 0
+        self._lists = None              # (order, offsets) CSR view of the IVF cells
+        self.loaded = False
+        self.dirty = False
+
+    def __len__(self):
+        self.load()
+        return len(self.video_ids)
+
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        if not os.path.exists(self.meta_path):
+            return
+        try:
+            with open(self.meta_path, 'r') as f:
+                meta = json.load(f)
+            with np.load(self.matrix_path) as data:
+                self.vectors = data['vectors']
+                self.frame_video = data['frame_video']
+                self.frame_time = data['frame_time']
+                self.centroids = data['centroids'] if len(data['centroids']) else None
+            self.videos = meta['videos']
+            self.video_ids = meta['video_ids']
+            self.trained_size = meta.get('trained_size', 0)
+        except Exception as e:
+            print(f"Error loading video index: {e}")
+        self._lists = None
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp_path = f"{self.matrix_path}.tmp.npz"
+        np.savez(tmp_path, vectors=self.vectors if self.vectors is not None else np.zeros((0, 0), np.float16),
+                 frame_video=self.frame_video, frame_time=self.frame_time,
+                 centroids=self.centroids if self.centroids is not None else np.zeros((0, 0), np.float32))
+        os.replace(tmp_path, self.matrix_path)
+        atomic_write_json(self.meta_path, {'videos': self.videos, 'video_ids': self.video_ids,
+                                           'trained_size': self.trained_size})
+        self.dirty = False
+
+    def clear(self):
+        self.loaded = True
+        self.videos, self.video_ids = {}, []
+        self.vectors, self.centroids, self.trained_size = None, None, 0
+        self.frame_video = np.zeros(0, dtype=np.int32)
+        self.frame_time = np.zeros(0, dtype=np.float32)
+        self._lists = None
+        self.dirty = True
+
+    @staticmethod
+    def normalize(fingerprints):
+        fingerprints = np.asarray(fingerprints, dtype=np.float32)
+        return fingerprints / np.maximum(np.linalg.norm(fingerprints, axis=1, keepdims=True), 1e-12)
+
+    def add(self, video_id, metadata, times, fingerprints):
+        """Index a video's fingerprint sequence (one row per sampled time)"""
+        self.load()
+        self.remove(video_id)
+        video_index = len(self.video_ids)
+        self.video_ids.append(video_id)
+        self.videos[video_id] = dict(metadata, frames=len(times))
+
+        rows = self.normalize(fingerprints).astype(np.float16)
+        self.vectors = rows if self.vectors is None or not len(self.vectors) else np.vstack([self.vectors, rows])
+        self.frame_video = np.concatenate([self.frame_video, np.full(len(rows), video_index, dtype=np.int32)])
+        self.frame_time = np.concatenate([self.frame_time, np.asarray(times, dtype=np.float32)])
+        self._lists = None
+        self.dirty = True
+
+    def remove(self, video_id):
+        self.load()
+        if video_id not in self.videos:
+            return False
+        video_index = self.video_ids.index(video_id)
+        keep = self.frame_video != video_index
+        self.vectors = self.vectors[keep]
+        self.frame_time = self.frame_time[keep]
+        self.frame_video = self.frame_video[keep]
+        self.frame_video[self.frame_video > video_index] -= 1
+        del self.video_ids[video_index]
+        del self.videos[video_id]
+        self._lists = None
+        self.dirty = True
+        return True
+
+    def _build_lists(self):
+        """(Re)train the coarse quantizer when the catalogue has grown and bucket every frame"""
+        vectors = self.vectors.astype(np.float32)
+        num_cells = max(1, len(vectors) // self.frames_per_cell)
+        if (self.centroids is None or len(vectors) > 4 * max(self.trained_size, 1) or len(self.centroids) > len(vectors)
+                or self.centroids.shape[1] != vectors.shape[1]):
+            self.centroids = kmeans(vectors, num_cells)
+            self.trained_size = len(vectors)
+            self.dirty = True
+
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), 65536):
+            assignments[start:start + 65536] = (vectors[start:start + 65536] @ self.centroids.T).argmax(axis=1)
+        order = np.argsort(assignments, kind='stable')
+        offsets = np.searchsorted(assignments[order], np.arange(len(self.centroids) + 1))
+        self._lists = (order, offsets)
+
+    def frame_hits(self, query_vectors, hits_per_frame=5, min_similarity=0.85):
+        """Top frame matches per query row via IVF probing: list of (query_row, frame_row, similarity)"""
+        self.load()
+        if self.vectors is None or not len(self.vectors):
+            return []
+        if self._lists is None:
+            self._build_lists()
+        order, offsets = self._lists
+
+        query_vectors = self.normalize(query_vectors)
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argsort(-(query_vectors @ self.centroids.T), axis=1)[:, :nprobe]
+
+        hits = []
+        for q, cells in enumerate(probes):
+            candidates = np.concatenate([order[offsets[cell]:offsets[cell + 1]] for cell in cells])
+            if not len(candidates):
+                continue
+            similarities = self.vectors[candidates].astype(np.float32) @ query_vectors[q]
+            k = min(hits_per_frame, len(candidates))
+            best = np.argpartition(-similarities, k - 1)[:k]
+            for i in best:
+                if similarities[i] >= min_similarity:
+                    hits.append((q, int(candidates[i]), float(similarities[i])))
+        return hits
+
+    def search(self, query_times, query_fingerprints, interval=1.0, top_k=5, min_similarity=0.85,
+               min_frames=3, max_gap=None, hits_per_frame=5):
+        """Matched segments between a query fingerprint sequence and indexed videos
+
+        Returns dicts with video_id, offset (reference time minus query time),
+        query_start/query_end, reference_start/reference_end, matched_frames
+        and score (mean frame similarity), best first. Assumes both sides play
+        at the same speed; max_gap (default 3 intervals) splits a diagonal into
+        separate segments.
+        """
+        query_times = np.asarray(query_times, dtype=np.float32)
+        max_gap = 3 * interval if max_gap is None else max_gap
+        hits = self.frame_hits(query_fingerprints, hits_per_frame, min_similarity)
+
+        # Temporal Hough transform: vote on (video, quantised offset)
+        votes = {}
+        for q, frame, similarity in hits:
+            offset_bin = int(np.round((self.frame_time[frame] - query_times[q]) / interval))
+            votes.setdefault((int(self.frame_video[frame]), offset_bin), []).append((q, frame, similarity))
+
+        segments, claimed = [], set()
+        for (video_index, offset_bin), _ in sorted(votes.items(), key=lambda item: -len(item[1])):
+            # Neighbouring bins belong to the same diagonal (sampling jitter)
+            if (video_index, offset_bin) in claimed:
+                continue
+            claimed.update((video_index, offset_bin + delta) for delta in (-1, 0, 1))
+            diagonal = {}
+            for delta in (-1, 0, 1):
+                for q, frame, similarity in votes.get((video_index, offset_bin + delta), []):
+                    if q not in diagonal or similarity > diagonal[q][1]:
+                        diagonal[q] = (frame, similarity)
+            if len(diagonal) < min_frames:
+                continue
+
+            run = []
+            for q in sorted(diagonal, key=lambda row: query_times[row]) + [None]:
+                if run and (q is None or query_times[q] - query_times[run[-1]] > max_gap):
+                    if len(run) >= min_frames:
+                        segments.append(self._segment(video_index, run, diagonal, query_times, interval))
+                    run = []
+                if q is not None:
+                    run.append(q)
+
+        segments.sort(key=lambda segment: (segment['matched_frames'], segment['score']), reverse=True)
+        return segments[:top_k]
+
+    def _segment(self, video_index, run, diagonal, query_times, interval):
+        frames = [diagonal[q][0] for q in run]
+        reference_times = self.frame_time[frames]
+        return {
+            'video_id': self.video_ids[video_index],
+            'offset': float(np.median(reference_times - query_times[run])),
+            'query_start': float(query_times[run[0]]),
+            'query_end': float(query_times[run[-1]] + interval),
+            'reference_start': float(reference_times.min()),
+            'reference_end': float(reference_times.max() + interval),
+            'matched_frames': len(run),
+            'score': float(np.mean([diagonal[q][1] for q in run]))
+        }
@@ -1,17 +1,113 @@
-import matplotlib.pyplot as plt
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from matplotlib.figure import Figure
 import numpy as np
-from PIL import Image
 import streamlit as st
 import io
+from blob_store import file_sha256
+from previews import open_downscaled
+from memory_budget import memory_budget
+
+try:
+    import plotly.graph_objects as go
+except ImportError:
+    go = None
 
 class ResultsVisualizer:
-    def __init__(self):
+    def __init__(self, cache_size=128):
         self.colors = {
             'high_risk': '#ff6b6b',
             'medium_risk': '#ffd166', 
             'low_risk': '#06d6a0',
             'neutral': '#118ab2'
         }
+        # Rendered PNGs keyed by a hash of the chart kind and its inputs; reruns
+        # with the same results skip matplotlib entirely
+        self.cache_size = cache_size
+        self._png_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        memory_budget.register(self.clear_cache)
+    
+    def clear_cache(self):
+        with self._cache_lock:
+            self._png_cache.clear()
+    
+    @staticmethod
+    def score_payload(results):
+        """The subset of an analysis result the charts depend on"""
+        return {key: round(float(results[key]), 6) for key in
+                ('direct_similarity', 'style_similarity', 'content_similarity', 'weighted_score')
+                if key in results}
+    
+    def _cached_png(self, kind, payload, build_figure):
+        """PNG bytes for a chart, rendered once per distinct payload
+        
+        Figures are built with the object-oriented API (not pyplot), so they
+        are never registered globally and are freed once rendered.
+        """
+        key = hashlib.sha1(json.dumps([kind, payload], sort_keys=True).encode('utf-8')).hexdigest()
+        with self._cache_lock:
+            if key in self._png_cache:
+                self._png_cache.move_to_end(key)
+                return self._png_cache[key]
+        
+        fig = build_figure()
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='png', dpi=100)
+        fig.clf()
+        png = buffer.getvalue()
+        
+        with self._cache_lock:
+            self._png_cache[key] = png
+            while len(self._png_cache) > self.cache_size:
+                self._png_cache.popitem(last=False)
+        return png
+    
+    def similarity_radar_png(self, results):
+        return self._cached_png('radar', self.score_payload(results),
+                                lambda: self.create_similarity_radar(results))
+    
+    def risk_heatmap_png(self, results):
+        return self._cached_png('heatmap', self.score_payload(results),
+                                lambda: self.create_risk_heatmap(results))
+    
+    def side_by_side_png(self, img1_path, img2_path, similarity_scores):
+        """Cached side-by-side comparison; keyed on image content, not (temp) file names"""
+        try:
+            images = [file_sha256(img1_path), file_sha256(img2_path)]
+        except OSError:
+            images = [img1_path, img2_path]
+        return self._cached_png('side_by_side', {'images': images, 'scores': self.score_payload(similarity_scores)},
+                                lambda: self.create_side_by_side_comparison(img1_path, img2_path, similarity_scores))
+    
+    def plotly_available(self):
+        return go is not None
+    
+    def similarity_radar_spec(self, results):
+        """Plotly figure for the similarity radar, rendered client-side by the browser"""
+        categories = ['Direct', 'Style', 'Content']
+        values = [results['direct_similarity'], results['style_similarity'], results['content_similarity']]
+        fig = go.Figure(go.Scatterpolar(r=values + values[:1], theta=categories + categories[:1],
+                                        fill='toself', line_color=self.colors['neutral'], name='Similarity',
+                                        text=[f'{value:.2f}' for value in values + values[:1]],
+                                        mode='lines+markers+text', textposition='top center'))
+        fig.update_layout(title='Similarity Profile Analysis', showlegend=False,
+                          polar=dict(radialaxis=dict(range=[0, 1], tickvals=[0.2, 0.4, 0.6, 0.8, 1.0])))
+        return fig
+    
+    def risk_heatmap_spec(self, results):
+        """Plotly figure for the per-metric risk bars, rendered client-side by the browser"""
+        metrics = ['Direct Copy', 'Style Match', 'Content Match']
+        scores = [results['direct_similarity'], results['style_similarity'], results['content_similarity']]
+        fig = go.Figure(go.Bar(x=scores, y=metrics, orientation='h',
+                               marker_color=[self.get_color(score) for score in scores],
+                               text=[f'{score:.3f}' for score in scores], textposition='outside'))
+        fig.add_vline(x=0.7, line_dash='dash', line_color='red', annotation_text='High Risk Threshold')
+        fig.add_vline(x=0.4, line_dash='dash', line_color='orange', annotation_text='Medium Risk Threshold')
+        fig.update_layout(title='Risk Assessment by Metric', xaxis=dict(range=[0, 1], title='Similarity Score'))
+        return fig
     
     def create_similarity_radar(self, results):
         """Create radar chart for similarity profile"""
@@ -23,7 +119,8 @@ class ResultsVisualizer:
         values += values[:1]  # Complete the circle
         angles += angles[:1]  # Complete the circle
         
-        fig, ax = plt.subplots(figsize=(8, 8), subplot_kw=dict(projection='polar'))
+        fig = Figure(figsize=(8, 8))
+        ax = fig.add_subplot(projection='polar')
         
         # Plot the main area
         ax.plot(angles, values, 'o-', linewidth=2, color=self.colors['neutral'], label='Similarity')
@@ -43,7 +140,7 @@ class ResultsVisualizer:
                    fontweight='bold', fontsize=10)
         
         ax.set_title('Similarity Profile Analysis', size=14, fontweight='bold', pad=20)
-        plt.tight_layout()
+        fig.tight_layout()
         
         return fig
     
@@ -53,7 +150,8 @@ class ResultsVisualizer:
         scores = [results['direct_similarity'], results['style_similarity'], results['content_similarity']]
         colors = [self.get_color(score) for score in scores]
         
-        fig, ax = plt.subplots(figsize=(10, 4))
+        fig = Figure(figsize=(10, 4))
+        ax = fig.add_subplot()
         bars = ax.barh(metrics, scores, color=colors, height=0.6)
         
         # Add value labels
@@ -70,7 +168,7 @@ class ResultsVisualizer:
         ax.axvline(x=0.4, color='orange', linestyle='--', alpha=0.7, label='Medium Risk Threshold')
         ax.legend()
         
-        plt.tight_layout()
+        fig.tight_layout()
         return fig
     
     def get_color(self, score):
@@ -84,12 +182,13 @@ class ResultsVisualizer:
     
     def create_side_by_side_comparison(self, img1_path, img2_path, similarity_scores):
         """Create side-by-side comparison with annotations"""
-        fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 5))
+        fig = Figure(figsize=(12, 5))
+        ax1, ax2 = fig.subplots(1, 2)
         
         try:
-            # Load and display images
-            img1 = Image.open(img1_path)
-            img2 = Image.open(img2_path)
+            # Display-sized decodes: the figure is 12x5 inches, so full resolution is wasted
+            img1 = open_downscaled(img1_path, (800, 800))
+            img2 = open_downscaled(img2_path, (800, 800))
             
             ax1.imshow(img1)
             ax1.set_title('🖼️ Reference Image', fontsize=14, fontweight='bold', pad=10)
@@ -117,8 +216,8 @@ class ResultsVisualizer:
             ax1.axis('off')
             ax2.axis('off')
         
-        plt.tight_layout()
-        plt.subplots_adjust(bottom=0.15)
+        fig.tight_layout()
+        fig.subplots_adjust(bottom=0.15)
         return fig
     
     def create_progress_bars(self, results):
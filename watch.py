@@ -0,0 +1,480 @@
+import json
+import os
+import threading
+import time
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from memory_budget import memory_budget
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm')
+
+
+class DirectorySource:
+    """New or changed images and videos in a local directory
+
+    Files are picked up once their size and mtime are unchanged across two
+    checks, so half-copied files are not read. Checks run every
+    poll_interval seconds; with the optional watchdog package, inotify
+    (or the platform equivalent) events trigger them immediately instead.
+    Videos are fed as frames sampled every video_interval seconds. Files
+    already present at start are skipped unless existing is set.
+    """
+
+    def __init__(self, path, recursive=False, poll_interval=1.0, video_interval=1.0, existing=False):
+        self.path = path
+        self.recursive = recursive
+        self.poll_interval = poll_interval
+        self.video_interval = video_interval
+        self.existing = existing
+        self._changed = threading.Event()
+
+    @property
+    def name(self):
+        return self.path
+
+    def _snapshot(self):
+        files = {}
+        for directory, subdirectories, names in os.walk(self.path):
+            if not self.recursive:
+                subdirectories.clear()
+            for name in names:
+                if name.lower().endswith(IMAGE_EXTENSIONS + VIDEO_EXTENSIONS):
+                    path = os.path.join(directory, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files[path] = (stat.st_size, stat.st_mtime_ns)
+        return files
+
+    def _feed(self, watcher, path):
+        if path.lower().endswith(IMAGE_EXTENSIONS):
+            watcher.submit({'source': self.name, 'name': path, 'image': path, 'frame_time': None})
+            return
+        from video_analyzer import video_analyzer
+
+        for frame_time, frame in video_analyzer.sample_frames(path, self.video_interval):
+            if watcher.stopped:
+                return
+            watcher.submit({'source': self.name, 'name': path, 'image': frame, 'frame_time': frame_time})
+
+    def run(self, watcher):
+        observer = None
+        if Observer is not None:
+            changed = self._changed
+            handler = type('WakeHandler', (FileSystemEventHandler,), {'on_any_event': lambda self, event: changed.set()})
+            observer = Observer()
+            observer.schedule(handler(), self.path, recursive=self.recursive)
+            observer.start()
+        try:
+            done = {} if self.existing else self._snapshot()
+            previous = {}
+            while not watcher.stopped:
+                current = self._snapshot()
+                for path, signature in current.items():
+                    # Unchanged since the last check and not yet processed in this version
+                    if previous.get(path) == signature and done.get(path) != signature:
+                        done[path] = signature
+                        self._feed(watcher, path)
+                previous = current
+                self._changed.wait(self.poll_interval)
+                if self._changed.is_set():
+                    # Let the writer finish before the settle check
+                    self._changed.clear()
+                    time.sleep(min(self.poll_interval, 0.5))
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+
+
+class StreamSource:
+    """Frames from an RTSP/HTTP stream (or a video file standing in for one), sampled at fps
+
+    The stream is read continuously so the capture buffer never backs up;
+    only every 1/fps seconds is a frame handed on, and those frames may be
+    dropped by the watcher when it falls behind. Video files are paced to
+    real time. Lost connections are reopened after reconnect_delay.
+    """
+
+    def __init__(self, url, fps=5.0, reconnect_delay=2.0, loop=False):
+        self.url = url
+        self.fps = fps
+        self.reconnect_delay = reconnect_delay
+        self.loop = loop
+        self.is_file = os.path.exists(url)
+
+    @property
+    def name(self):
+        return self.url
+
+    def run(self, watcher):
+        import cv2
+        from PIL import Image
+
+        while not watcher.stopped:
+            cap = cv2.VideoCapture(self.url)
+            if not cap.isOpened():
+                print(f"⚠️ Could not open stream {self.url}; retrying in {self.reconnect_delay:.0f}s")
+                time.sleep(self.reconnect_delay)
+                continue
+            opened, next_sample = time.time(), 0.0
+            try:
+                while not watcher.stopped:
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    position = (cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0 if self.is_file
+                                else time.time() - opened)
+                    if self.is_file and position > time.time() - opened:
+                        time.sleep(position - (time.time() - opened))
+                    if position >= next_sample:
+                        next_sample = position + 1.0 / self.fps
+                        watcher.submit({'source': self.name, 'name': self.url, 'frame_time': position,
+                                        'image': Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))},
+                                       droppable=True)
+            finally:
+                cap.release()
+            if self.is_file and not self.loop:
+                return
+            if not watcher.stopped:
+                print(f"⚠️ Stream {self.url} ended; reconnecting in {self.reconnect_delay:.0f}s")
+                time.sleep(self.reconnect_delay)
+
+
+class JsonlAlertSink:
+    """Appends one JSON line per alert to a local file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, alert):
+        line = json.dumps(alert)
+        with self._lock, open(self.path, 'a') as f:
+            f.write(line + "\n")
+
+
+class WebhookAlertSink:
+    """POSTs each alert as JSON to a (local) webhook from a background thread
+
+    Delivery never blocks the watch loop; when more than max_pending
+    alerts are waiting for a slow endpoint, new ones are dropped with a
+    warning.
+    """
+
+    def __init__(self, url, timeout=5.0, max_pending=1000):
+        self.url = url
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self._pending = deque()
+        self._ready = threading.Condition()
+        threading.Thread(target=self._deliver, name="copyscale-webhook", daemon=True).start()
+
+    def send(self, alert):
+        with self._ready:
+            if len(self._pending) >= self.max_pending:
+                print(f"⚠️ Webhook {self.url} is behind; dropping alert for {alert['image_id']}")
+                return
+            self._pending.append(alert)
+            self._ready.notify()
+
+    def _deliver(self):
+        while True:
+            with self._ready:
+                while not self._pending:
+                    self._ready.wait()
+                alert = self._pending.popleft()
+            request = urllib.request.Request(self.url, data=json.dumps(alert).encode('utf-8'),
+                                             headers={'Content-Type': 'application/json'})
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    response.read()
+            except Exception as e:
+                print(f"⚠️ Webhook {self.url} failed: {e}")
+
+
+class Watcher:
+    """Feeds watched files and stream frames through batched embed-and-search and raises alerts
+
+    Items from all sources share one bounded queue. Files and video frames
+    wait for room; stream frames are droppable: when the queue is full the
+    oldest droppable frame gives way, and frames older than max_lag seconds
+    are skipped at batch time, so the lag behind a live stream stays
+    within max_lag plus one batch's processing time. Each batch gets one forward pass, then every item is searched
+    with its precomputed descriptors. A match at min_level or above
+    becomes an alert, at most once per cooldown seconds for the same
+    source item and reference.
+    """
+
+    def __init__(self, db, sources, sinks, batch_size=8, batch_timeout=0.2, max_lag=2.0, min_level="HIGH",
+                 cooldown=30.0, top_k=3, min_similarity=0.3, search_options=None, queue_size=64):
+        self.db = db
+        self.sources = sources
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.max_lag = max_lag
+        self.min_level = min_level
+        self.cooldown = cooldown
+        self.top_k = top_k
+        self.min_similarity = min_similarity
+        self.search_options = dict(search_options or {})
+        self.queue_size = queue_size
+        self._items = deque()
+        self._ready = threading.Condition()
+        self._stop = threading.Event()
+        self._last_alert = {}
+        self._lags = deque(maxlen=500)
+        self._processed_times = deque(maxlen=500)
+        self.counts = {'queued': 0, 'processed': 0, 'unreadable': 0, 'dropped': 0, 'stale': 0, 'alerts': 0}
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    def stop(self):
+        self._stop.set()
+        with self._ready:
+            self._ready.notify_all()
+
+    def submit(self, item, droppable=False):
+        """Queue a watch item ({'source', 'name', 'image', 'frame_time'}); blocks while full unless droppable"""
+        item = dict(item, captured_at=time.time(), droppable=droppable)
+        with self._ready:
+            while not droppable and len(self._items) >= self.queue_size and not self.stopped:
+                self._ready.wait(0.5)
+            if droppable and len(self._items) >= self.queue_size:
+                oldest = next((queued for queued in self._items if queued['droppable']), None)
+                if oldest is None:
+                    self.counts['dropped'] += 1
+                    return
+                self._items.remove(oldest)
+                self.counts['dropped'] += 1
+            self._items.append(item)
+            self.counts['queued'] += 1
+            self._ready.notify_all()
+
+    def _next_batch(self):
+        size = memory_budget.batch_size(self.batch_size)
+        with self._ready:
+            if not self._items:
+                self._ready.wait(0.5)
+                if not self._items:
+                    return []
+            # A short wait to fill the batch once the first item is in
+            deadline = time.time() + self.batch_timeout
+            while len(self._items) < size and not self.stopped and time.time() < deadline:
+                self._ready.wait(deadline - time.time())
+            batch = [self._items.popleft() for _ in range(min(size, len(self._items)))]
+            self._ready.notify_all()
+        now = time.time()
+        fresh = [item for item in batch if not (item['droppable'] and now - item['captured_at'] > self.max_lag)]
+        self.counts['stale'] += len(batch) - len(fresh)
+        return fresh
+
+    def process(self, batch):
+        """Embed a batch in one forward pass, search each item and emit alerts; returns the alerts"""
+        from analyzer import analyzer
+        from fingerprint import tta_views
+        from scoring import RISK_LEVELS
+
+        views = tta_views(self.search_options.get('tta'))
+        with memory_budget.measure_batch(len(batch) * len(views)):
+            descriptors = analyzer.extract_descriptors([item['image'] for item in batch], len(batch),
+                                                       augmentations=views if len(views) > 1 else None)
+        floor = RISK_LEVELS.index(self.min_level)
+        alerts = []
+        for item, query_descriptors in zip(batch, descriptors):
+            if query_descriptors is None:
+                self.counts['unreadable'] += 1
+                continue
+            matches = self.db.search_similar_content(item['image'], top_k=self.top_k,
+                                                     min_similarity=self.min_similarity,
+                                                     query_descriptors=query_descriptors, **self.search_options)
+            now = time.time()
+            self._lags.append(now - item['captured_at'])
+            self._processed_times.append(now)
+            self.counts['processed'] += 1
+            for match in matches:
+                analysis = match['full_analysis']
+                if RISK_LEVELS.index(analysis['risk_level']) < floor:
+                    continue
+                key = (item['name'], match['image_id'])
+                if now - self._last_alert.get(key, float('-inf')) < self.cooldown:
+                    continue
+                self._last_alert[key] = now
+                alerts.append({
+                    'time': now,
+                    'source': item['source'],
+                    'item': item['name'] if isinstance(item['image'], str) else f"{item['name']}@{item['frame_time']:.2f}s",
+                    'frame_time': item['frame_time'],
+                    'image_id': match['image_id'],
+                    'title': match['title'],
+                    'owner': match['owner'],
+                    'similarity': match['similarity'],
+                    'weighted_score': analysis['weighted_score'],
+                    'risk_level': analysis['risk_level'],
+                    'lag_seconds': now - item['captured_at']
+                })
+        for alert in alerts:
+            self.counts['alerts'] += 1
+            for sink in self.sinks:
+                try:
+                    sink.send(alert)
+                except Exception as e:
+                    print(f"⚠️ Alert delivery failed: {e}")
+        return alerts
+
+    def stats(self):
+        """Counts, items/sec over the last 10 seconds and lag (median and max over the last few hundred items)"""
+        now = time.time()
+        times = [processed for processed in self._processed_times if now - processed <= 10.0]
+        lags = sorted(self._lags)
+        return dict(self.counts,
+                    backlog=len(self._items),
+                    items_per_sec=(len(times) - 1) / (times[-1] - times[0]) if len(times) > 1 and times[-1] > times[0]
+                    else 0.0,
+                    median_lag=lags[len(lags) // 2] if lags else 0.0,
+                    max_lag=lags[-1] if lags else 0.0)
+
+    def run(self, report_interval=10.0, duration=None):
+        """Start every source on its own thread and process batches until stop() (or duration seconds)"""
+        threads = [threading.Thread(target=source.run, args=(self,), name=f"copyscale-watch-{i}", daemon=True)
+                   for i, source in enumerate(self.sources)]
+        for thread in threads:
+            thread.start()
+        started = last_report = time.time()
+        try:
+            while not self.stopped:
+                if duration is not None and time.time() - started >= duration:
+                    break
+                batch = self._next_batch()
+                if batch:
+                    self.process(batch)
+                if report_interval and time.time() - last_report >= report_interval:
+                    last_report = time.time()
+                    stats = self.stats()
+                    print(f"{stats['processed']} items, {stats['items_per_sec']:.1f}/s, lag {stats['median_lag']:.2f}s "
+                          f"(max {stats['max_lag']:.2f}s), backlog {stats['backlog']}, "
+                          f"{stats['dropped'] + stats['stale']} frames dropped, {stats['alerts']} alerts")
+        finally:
+            self.stop()
+            for thread in threads:
+                thread.join(timeout=5)
+        return self.stats()
+
+
+def serve_stream(video_path, host="127.0.0.1", port=8090, fps=10.0, loop=True):
+    """Serve a video file as an MJPEG HTTP stream at /stream.mjpg, a local stand-in for a camera feed
+
+    Returns the server (running on a background thread).
+    """
+    import cv2
+
+    class StreamHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split('?')[0] != "/stream.mjpg":
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
+            self.end_headers()
+            cap = cv2.VideoCapture(video_path)
+            try:
+                while True:
+                    ret, frame = cap.read()
+                    if not ret:
+                        if not loop:
+                            return
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        continue
+                    jpeg = cv2.imencode('.jpg', frame)[1].tobytes()
+                    self.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\n"
+                                     + f"Content-Length: {len(jpeg)}\r\n\r\n".encode() + jpeg + b"\r\n")
+                    time.sleep(1.0 / fps)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                cap.release()
+
+    server = ThreadingHTTPServer((host, port), StreamHandler)
+    threading.Thread(target=server.serve_forever, name="copyscale-stream", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    import argparse
+    import signal
+
+    parser = argparse.ArgumentParser(description="Continuously scan new files and live streams against the database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="watch directories and streams")
+    run_parser.add_argument("--db", default="copyright_database.json")
+    run_parser.add_argument("--dir", action="append", default=[], help="directory to watch (repeatable)")
+    run_parser.add_argument("--stream", action="append", default=[], help="RTSP/HTTP URL or video file (repeatable)")
+    run_parser.add_argument("--recursive", action="store_true")
+    run_parser.add_argument("--existing", action="store_true", help="also scan files already in the directories")
+    run_parser.add_argument("--fps", type=float, default=5.0, help="target frames per second sampled from each stream")
+    run_parser.add_argument("--video-interval", type=float, default=1.0, help="seconds between frames of new videos")
+    run_parser.add_argument("--poll-interval", type=float, default=1.0)
+    run_parser.add_argument("--batch-size", type=int, default=8)
+    run_parser.add_argument("--max-lag", type=float, default=2.0, help="skip stream frames older than this")
+    run_parser.add_argument("--min-level", choices=("MEDIUM", "HIGH"), default="HIGH")
+    run_parser.add_argument("--cooldown", type=float, default=30.0, help="seconds between repeated alerts")
+    run_parser.add_argument("--top-k", type=int, default=3)
+    run_parser.add_argument("--tta", help="test-time augmentation views (count or names)")
+    run_parser.add_argument("--jsonl", default="copyscale_alerts.jsonl", help="alert log (JSON lines)")
+    run_parser.add_argument("--webhook", action="append", default=[], help="URL to POST alerts to (repeatable)")
+    run_parser.add_argument("--duration", type=float, help="stop after this many seconds")
+
+    stream_parser = subparsers.add_parser("serve-stream", help="serve a video file as a local MJPEG stream")
+    stream_parser.add_argument("video")
+    stream_parser.add_argument("--port", type=int, default=8090)
+    stream_parser.add_argument("--fps", type=float, default=10.0)
+    args = parser.parse_args()
+
+    if args.command == "serve-stream":
+        serve_stream(args.video, port=args.port, fps=args.fps)
+        print(f"✅ Streaming {args.video} at http://127.0.0.1:{args.port}/stream.mjpg")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            raise SystemExit(0)
+
+    if not args.dir and not args.stream:
+        parser.error("give at least one --dir or --stream")
+    from copyright_db import CopyrightDatabase
+
+    sources = ([DirectorySource(path, args.recursive, args.poll_interval, args.video_interval, args.existing)
+                for path in args.dir] +
+               [StreamSource(url, args.fps) for url in args.stream])
+    sinks = [JsonlAlertSink(args.jsonl)] + [WebhookAlertSink(url) for url in args.webhook]
+    search_options = {}
+    if args.tta:
+        search_options['tta'] = int(args.tta) if args.tta.isdigit() else args.tta
+    watcher = Watcher(CopyrightDatabase(args.db), sources, sinks, args.batch_size, max_lag=args.max_lag,
+                      min_level=args.min_level, cooldown=args.cooldown, top_k=args.top_k,
+                      search_options=search_options)
+    signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+    print(f"👀 Watching {len(args.dir)} directories and {len(args.stream)} streams "
+          f"({'filesystem events' if Observer is not None else 'polling'}); alerts -> {args.jsonl}")
+    try:
+        stats = watcher.run(duration=args.duration)
+    except KeyboardInterrupt:
+        watcher.stop()
+        stats = watcher.stats()
+    print(f"Stopped after {stats['processed']} items with {stats['alerts']} alerts")